@@ -0,0 +1,199 @@
+import collections
+import math
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .config import settings
+from .cancellation import GenerationCancelledError
+
+
+class AdmissionRejectedError(RuntimeError):
+    """Raised when a generation cannot be admitted; carries the HTTP status and a Retry-After hint."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    def __init__(self, cost: int):
+        self.cost = cost  # Estimated bytes reserved for this generation
+        self.admitted_at = time.perf_counter()
+
+
+class AdmissionController:
+    """Bounds how many generations run at once and how much memory they may claim.
+
+    A request is admitted when fewer than ``max_concurrent`` generations are running
+    and its estimated cost fits in what is left of ``memory_budget`` (0 = no memory
+    limit). Otherwise it waits in a FIFO queue of at most ``max_waiting`` requests for
+    up to ``wait_timeout`` seconds. A full queue is rejected at once with 429 and a
+    timed-out wait with 503, both with a Retry-After estimated from recent
+    generation times. A request costing more than the whole budget still runs, but
+    only when nothing else does.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: Optional[int] = None,
+        max_waiting: Optional[int] = None,
+        wait_timeout: Optional[float] = None,
+        memory_budget: Optional[int] = None,
+    ):
+        self._max_concurrent = max_concurrent
+        self._max_waiting = max_waiting
+        self._wait_timeout = wait_timeout
+        self._memory_budget = memory_budget
+        self._cond = threading.Condition()
+        self._waiting: "collections.deque[AdmissionTicket]" = collections.deque()
+        self._active = 0
+        self._reserved = 0
+        self._avg_duration: Optional[float] = None  # EMA of admitted generation time
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    # Limits are read from settings on every call unless fixed at construction
+    @property
+    def max_concurrent(self) -> int:
+        if self._max_concurrent is not None:
+            return max(1, self._max_concurrent)
+        if settings.max_concurrent_generations > 0:
+            return settings.max_concurrent_generations
+        return settings.max_batch_size if settings.enable_batching else settings.inference_workers
+
+    @property
+    def max_waiting(self) -> int:
+        return max(0, self._max_waiting if self._max_waiting is not None else settings.admission_queue_size)
+
+    @property
+    def wait_timeout(self) -> float:
+        return self._wait_timeout if self._wait_timeout is not None else settings.admission_timeout_seconds
+
+    @property
+    def memory_budget(self) -> int:
+        if self._memory_budget is not None:
+            return self._memory_budget
+        return settings.generation_memory_budget_mb * 1024 * 1024
+
+    def acquire(self, cost: int = 0, cancel: Optional[Any] = None) -> AdmissionTicket:
+        """Blocks until the request is admitted; the caller must ``release`` the ticket.
+
+        A waiting request whose ``cancel`` token is set leaves the queue with
+        GenerationCancelledError.
+        """
+        ticket = AdmissionTicket(cost)
+        with self._cond:
+            if not self._waiting and self._fits(cost):
+                return self._admit(ticket)
+            if len(self._waiting) >= self.max_waiting:
+                self.rejected_queue_full += 1
+                raise AdmissionRejectedError(
+                    f"Server is busy ({self._active} generations running, {len(self._waiting)} waiting). Try again shortly.",
+                    status_code=429,
+                    retry_after=self._retry_after(),
+                )
+            self._waiting.append(ticket)
+            deadline = time.monotonic() + self.wait_timeout
+            try:
+                while not (self._waiting[0] is ticket and self._fits(cost)):
+                    if cancel is not None and cancel.is_set():
+                        raise GenerationCancelledError("Request cancelled while waiting for a generation slot.")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected_timeout += 1
+                        raise AdmissionRejectedError(
+                            f"Timed out after {self.wait_timeout:.0f}s waiting for a generation slot. Try again shortly.",
+                            status_code=503,
+                            retry_after=self._retry_after(),
+                        )
+                    # Wake up now and then to notice cancellation (nothing notifies for it)
+                    self._cond.wait(min(remaining, 0.25) if cancel is not None else remaining)
+            finally:
+                self._waiting.remove(ticket)
+                # The next request in line may fit now
+                self._cond.notify_all()
+            ticket.admitted_at = time.perf_counter()
+            return self._admit(ticket)
+
+    def release(self, ticket: Optional[AdmissionTicket]) -> None:
+        if ticket is None:
+            return
+        duration = time.perf_counter() - ticket.admitted_at
+        with self._cond:
+            self._active -= 1
+            self._reserved -= ticket.cost
+            self._avg_duration = duration if self._avg_duration is None else 0.8 * self._avg_duration + 0.2 * duration
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "active": self._active,
+                "waiting": len(self._waiting),
+                "reserved_bytes": self._reserved,
+                "max_concurrent": self.max_concurrent,
+                "max_waiting": self.max_waiting,
+                "wait_timeout": self.wait_timeout,
+                "memory_budget": self.memory_budget,
+                "avg_generation_seconds": self._avg_duration,
+                "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_queue_full,
+                "rejected_timeout": self.rejected_timeout,
+            }
+
+    # ------------------------------------------------------------------
+    def _fits(self, cost: int) -> bool:
+        if self._active >= self.max_concurrent:
+            return False
+        budget = self.memory_budget
+        return budget <= 0 or self._active == 0 or self._reserved + cost <= budget
+
+    def _admit(self, ticket: AdmissionTicket) -> AdmissionTicket:
+        self._active += 1
+        self._reserved += ticket.cost
+        self.admitted += 1
+        return ticket
+
+    def _retry_after(self) -> int:
+        """Seconds until the queue ahead has likely drained (5s per generation until measured)."""
+        per_generation = self._avg_duration if self._avg_duration is not None else 5.0
+        return max(1, math.ceil(per_generation * (len(self._waiting) + 1) / self.max_concurrent))
+
+
+def estimate_generation_bytes(model: Any, prompt_tokens: int, max_new_tokens: int) -> int:
+    """Rough memory a generation adds on top of the weights.
+
+    The KV cache holds keys and values for every layer and position
+    (``2 * layers * kv_heads * head_dim`` elements per token). Prefill also needs
+    transient activations for the whole prompt, approximated by the hidden and MLP
+    widths.
+    """
+    config = getattr(model, "config", None)
+    if config is None:
+        return 0
+    element_size = getattr(getattr(model, "dtype", None), "itemsize", 4)
+    heads = getattr(config, "num_attention_heads", 1) or 1
+    kv_heads = getattr(config, "num_key_value_heads", None) or heads
+    hidden = getattr(config, "hidden_size", 0)
+    head_dim = getattr(config, "head_dim", None) or hidden // heads
+    layers = getattr(config, "num_hidden_layers", 0)
+    intermediate = getattr(config, "intermediate_size", None) or 4 * hidden
+
+    kv_cache = 2 * layers * kv_heads * head_dim * element_size * (prompt_tokens + max_new_tokens)
+    prefill = 2 * prompt_tokens * (hidden + intermediate) * element_size
+    return kv_cache + prefill
+
+
+def generation_cost(model: Any, tokenizer: Any, prompt: str, max_new_tokens: int) -> int:
+    """Estimated bytes for generating from ``prompt``; 0 (and no tokenization) without a memory budget."""
+    if admission_controller.memory_budget <= 0:
+        return 0
+    prompt_tokens = len(tokenizer(prompt, add_special_tokens=False)["input_ids"])
+    return estimate_generation_bytes(model, prompt_tokens, max_new_tokens)
+
+
+# Singleton in front of every generation path (executor, batch scheduler, streaming)
+admission_controller = AdmissionController()
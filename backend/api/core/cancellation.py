@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import uuid
+from typing import Any, Dict, List, Optional
+
+# Key of the per-request disconnect event in the ASGI scope
+DISCONNECT_SCOPE_KEY = "sigil.client_disconnected"
+
+
+class GenerationCancelledError(RuntimeError):
+    """Raised when a generation stops because its request was cancelled or its client went away."""
+
+
+class CancelToken:
+    """Cancellation flag of one generation request.
+
+    Set explicitly through ``cancel`` (the cancel endpoint) or by any of the
+    ``sources`` (e.g. the client-disconnect event). Generation polls ``is_set``
+    between decode steps, so it behaves like a threading.Event there.
+    """
+
+    def __init__(self, request_id: str, *sources: Optional[threading.Event]):
+        self.request_id = request_id
+        self._event = threading.Event()
+        self._sources = [source for source in sources if source is not None]
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    def is_set(self) -> bool:
+        return self._event.is_set() or any(source.is_set() for source in self._sources)
+
+    @property
+    def reason(self) -> Optional[str]:
+        if self._event.is_set():
+            return "cancelled"
+        if any(source.is_set() for source in self._sources):
+            return "client_disconnected"
+        return None
+
+
+class CancellationRegistry:
+    """Maps request ids of running generations to their CancelToken."""
+
+    def __init__(self):
+        self._tokens: Dict[str, CancelToken] = {}
+        self._lock = threading.Lock()
+        self.cancelled = 0
+
+    def register(self, request_id: Optional[str] = None, *sources: Optional[threading.Event]) -> CancelToken:
+        """Creates the token for a new request; generates an id when none is given.
+
+        Raises ValueError if ``request_id`` belongs to a generation that is still running.
+        """
+        with self._lock:
+            request_id = request_id or uuid.uuid4().hex
+            if request_id in self._tokens:
+                raise ValueError(f"Request id '{request_id}' is already in use by a running generation.")
+            token = self._tokens[request_id] = CancelToken(request_id, *sources)
+            return token
+
+    def cancel(self, request_id: str) -> bool:
+        """Cancels a running generation. Returns False if the id is unknown or already finished."""
+        with self._lock:
+            token = self._tokens.get(request_id)
+            if token is None:
+                return False
+            self.cancelled += 1
+        token.cancel()
+        print(f"🛑 Cancellation requested for generation '{request_id}'.")
+        return True
+
+    def release(self, token: Optional[CancelToken]) -> None:
+        if token is None:
+            return
+        with self._lock:
+            if self._tokens.get(token.request_id) is token:
+                del self._tokens[token.request_id]
+
+    def active(self) -> List[str]:
+        with self._lock:
+            return list(self._tokens)
+
+
+def client_disconnected(scope: Dict[str, Any]) -> Optional[threading.Event]:
+    """The event DisconnectMiddleware sets when the client of this request goes away."""
+    return scope.get(DISCONNECT_SCOPE_KEY)
+
+
+class DisconnectMiddleware:
+    """ASGI middleware that notices a client disconnect while the endpoint is still working.
+
+    Once the request body has been read, a background task waits on ``receive`` for
+    ``http.disconnect`` and sets a threading.Event stored in the scope, so blocking
+    code (a sync endpoint, a generation thread) can poll it. Later ``receive`` calls
+    from the app (e.g. StreamingResponse's own disconnect listener) get the same
+    disconnect message.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        disconnected = threading.Event()
+        scope[DISCONNECT_SCOPE_KEY] = disconnected
+        watcher: Optional[asyncio.Task] = None
+
+        async def watch():
+            # After the body the only message left is http.disconnect
+            message = await receive()
+            disconnected.set()
+            return message
+
+        async def receive_wrapper():
+            nonlocal watcher
+            if watcher is not None:
+                return await asyncio.shield(watcher)
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body", False):
+                watcher = asyncio.ensure_future(watch())
+            return message
+
+        try:
+            await self.app(scope, receive_wrapper, send)
+        finally:
+            if watcher is not None and not watcher.done():
+                watcher.cancel()
+
+
+# Singleton used by the chat routes and the cancel endpoint
+cancellations = CancellationRegistry()
@@ -1,13 +1,15 @@
 import re
 from typing import List, Optional
 
+DEFAULT_STOP_TOKENS = [
+    "\nUser:", "\nuser:", "\nAssistant:", "\nassistant:", "</s>", "<|endoftext|>", "<|user|>", "<|assistant|>"
+]
+
 # --- Helper Function for Truncating at Stop Tokens ---
 def truncate_at_stop_token(text: str, stop_tokens: Optional[List[str]] = None) -> str:
     """Truncates the text at the first occurrence of any stop token."""
     if not stop_tokens:
-        stop_tokens = [
-            "\nUser:", "\nuser:", "\nAssistant:", "\nassistant:", "</s>", "<|endoftext|>", "<|user|>", "<|assistant|>"
-        ]
+        stop_tokens = DEFAULT_STOP_TOKENS
     min_idx = None
     for token in stop_tokens:
         idx = text.find(token)
@@ -18,6 +20,23 @@ def truncate_at_stop_token(text: str, stop_tokens: Optional[List[str]] = None) -
         return text[:min_idx].rstrip()
     return text
 
+# --- Helper Function for Streaming Stop Tokens ---
+def stop_token_holdback(text: str, stop_tokens: Optional[List[str]] = None) -> int:
+    """Returns how many trailing characters of text could still grow into a stop token.
+
+    Streaming callers should not emit those characters yet: the next chunk may
+    complete the stop token, in which case they must be dropped instead.
+    """
+    if not stop_tokens:
+        stop_tokens = DEFAULT_STOP_TOKENS
+    longest = 0
+    for token in stop_tokens:
+        for size in range(min(len(token) - 1, len(text)), longest, -1):
+            if text.endswith(token[:size]):
+                longest = size
+                break
+    return longest
+
 # --- Helper Function for Cleaning Response ---
 def clean_response(text: str) -> str:
     """Removes potential speaker tags like 'User:' or 'Assistant:' from the text."""
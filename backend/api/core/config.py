@@ -4,8 +4,9 @@ from typing import Literal, List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import field_validator, ValidationInfo
 
-# Allowed precision choices for models
-PrecisionType = Literal["fp32", "fp16"]
+# Allowed precision choices for models. "int8" quantizes Linear weights at load time
+# (CPU only); "bf16" suits CPUs and GPUs with bfloat16 support.
+PrecisionType = Literal["fp32", "fp16", "bf16", "int8"]
 
 
 class Settings(BaseSettings):
@@ -20,13 +21,23 @@ class Settings(BaseSettings):
     # --- Core ---
     model_precision: PrecisionType = "fp32"
     log_level: str = "INFO"
+    structured_generation_logs: bool = False  # One JSON usage record per generation instead of debug prints
 
     # --- Model paths & behaviour ---
     model_base_directory: str = os.path.abspath(
         os.path.join(os.path.dirname(__file__), "..", "..", "models")
     )
     default_model_path: Optional[str] = None  # e.g. "tinyllama" or an absolute path
+    preload_default_model: bool = False  # Load default_model_path in the background at startup (/ready waits for it)
+    warmup_prompt_lengths: List[int] = [32, 512]  # Prompt lengths (tokens) of the warm-up generations, e.g. "[32, 512]"
+    warmup_max_new_tokens: int = 8  # Tokens generated per warm-up prompt
     hf_trust_remote_code: bool = False  # Enable with care
+    # Keep weights converted to the load precision in <model dir>/.sigil_cache as safetensors
+    # (mmap-loaded on the next load; rebuilt when the checkpoint files change)
+    converted_weights_cache: bool = True
+    # Device that runs generation, decided once at load time. "auto" picks CUDA when
+    # available and CPU otherwise; MPS is opt-in.
+    inference_device: Literal["auto", "cuda", "mps", "cpu"] = "auto"
 
     # --- Generation defaults ---
     default_system_prompt: str = "You are a helpful assistant."
@@ -34,6 +45,52 @@ class Settings(BaseSettings):
     default_top_p: float = 0.95
     default_max_new_tokens: int = 1000
     default_repetition_penalty: float = 1.0
+    continuation_max_new_tokens: int = 500  # Budget of the automatic continuation pass (0 disables it)
+    # Drop the oldest chat turns that don't fit the model's context window minus max_tokens
+    history_token_budget: bool = True
+    token_count_cache_size: int = 8192  # Per-message token counts kept for history packing (LRU)
+    # Keep each thread's rendered+tokenized messages so a turn only renders/tokenizes new ones
+    prompt_segment_cache: bool = True
+    prompt_segment_cache_threads: int = 256  # Threads kept (LRU)
+    prompt_segment_verify_interval: int = 32  # Compare every Nth stitched prompt with a full render (0 = never)
+
+    # --- Inference execution ---
+    inference_workers: int = 1  # Threads running model.generate concurrently
+    inference_queue_size: int = 8  # Jobs allowed to wait for a worker before 503s
+    enable_batching: bool = False  # Route chat requests through the continuous-batching scheduler
+    max_batch_size: int = 8  # Sequences decoded together per step when batching
+    prefix_cache_enabled: bool = True  # Reuse the previous turn's KV cache per thread
+    prefix_cache_max_mb: int = 512  # Memory budget across all threads (LRU eviction)
+    kv_snapshots_enabled: bool = False  # Spill idle/evicted thread caches to saved_chats/<id>.kv.safetensors
+    kv_snapshot_idle_seconds: int = 600  # Inactivity after which a thread's cache is moved to disk
+
+    # --- Admission control (in front of every generation) ---
+    max_concurrent_generations: int = 0  # 0 = inference_workers (max_batch_size when batching)
+    admission_queue_size: int = 16  # Requests allowed to wait for a slot; beyond that 429
+    admission_timeout_seconds: float = 30.0  # Longest wait for a slot before 503
+    generation_memory_budget_mb: int = 0  # Estimated KV/activation memory across running generations (0 = no limit)
+
+    # --- Model residency ---
+    max_resident_models: int = 1  # Models kept loaded at once (1 = switching models unloads the previous one)
+    model_memory_budget_mb: int = 0  # RAM/VRAM budget across resident models, LRU eviction (0 = no byte limit)
+    # Load a replacement model alongside the active one and swap it in once warm, instead of
+    # unloading first. Needs room for both models while the swap is in progress.
+    model_hot_swap: bool = False
+
+    # --- Speculative decoding ---
+    draft_model_name: Optional[str] = None  # Directory in backend/models (same tokenizer family as the main model)
+    speculative_decoding: bool = False  # Default for requests that don't set `speculative`
+
+    # --- Chat history storage ---
+    # "json": one saved_chats/<thread_id>.json per session. "sqlite": sessions and messages
+    # in one SQLite database (WAL); import existing files with backend.utils.migrate_chats
+    history_backend: Literal["json", "sqlite"] = "json"
+    history_db_path: Optional[str] = None  # Default: saved_chats/history.sqlite3
+    # "json": saves append to <thread_id>.log.jsonl; this many appends are folded into the session file
+    history_log_compact_entries: int = 32
+    # /sessions page size when a client asks for pages (limit/cursor/filters) without a limit
+    session_page_size: int = 50
+    session_page_size_max: int = 500
 
     # --- API / Frontend ---
     cors_allowed_origins: str = (
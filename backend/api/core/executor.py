@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .config import settings
+
+
+class InferenceQueueFullError(RuntimeError):
+    """Raised when a generation job is submitted while the inference queue is full."""
+    pass
+
+
+class InferenceExecutor:
+    """Runs blocking generation work on dedicated threads with a bounded backlog.
+
+    Jobs beyond ``max_workers + max_queue_size`` outstanding are rejected with
+    InferenceQueueFullError instead of piling up. Every returned future carries a
+    ``timings`` dict with the time spent waiting in the queue and the time spent
+    computing, so the two can be reported separately. The worker pool is created on
+    first use, so the executor can be used again after shutdown() (e.g. a second
+    application lifespan in the same process).
+    """
+
+    def __init__(self, max_workers: int = 1, max_queue_size: int = 8):
+        self.max_workers = max(1, max_workers)
+        self.max_queue_size = max(0, max_queue_size)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._outstanding = 0
+
+    @property
+    def outstanding(self) -> int:
+        """Number of jobs currently queued or running."""
+        return self._outstanding
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a free worker."""
+        return max(0, self._outstanding - self.max_workers)
+
+    def is_saturated(self) -> bool:
+        """True when another submit() would be rejected."""
+        return self._outstanding >= self.max_workers + self.max_queue_size
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Queues fn(*args, **kwargs) on an inference worker and returns its future."""
+        with self._lock:
+            if self._outstanding >= self.max_workers + self.max_queue_size:
+                raise InferenceQueueFullError(
+                    f"Inference queue is full ({self._outstanding} jobs outstanding). Try again shortly."
+                )
+            self._outstanding += 1
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sigil-inference")
+            pool = self._pool
+
+        timings = {"queue_wait": 0.0, "compute_time": 0.0}
+        queued_at = time.perf_counter()
+
+        def _job():
+            started_at = time.perf_counter()
+            timings["queue_wait"] = started_at - queued_at
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings["compute_time"] = time.perf_counter() - started_at
+                # Release before the future resolves so waiters see the freed slot
+                self._release()
+
+        try:
+            future = pool.submit(_job)
+        except Exception:
+            self._release()
+            raise
+        future.timings = timings
+        # Jobs cancelled before they start never reach _job's release
+        future.add_done_callback(lambda f: self._release() if f.cancelled() else None)
+        return future
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, Dict[str, float]]:
+        """Awaitable wrapper around submit(); returns ``(result, timings)``."""
+        future = self.submit(fn, *args, **kwargs)
+        result = await asyncio.wrap_future(future)
+        return result, future.timings
+
+    def shutdown(self, wait: bool = False) -> None:
+        """Cancels queued jobs and optionally waits for running ones; the next submit() starts a new pool."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _release(self) -> None:
+        with self._lock:
+            self._outstanding -= 1
+
+
+# Singleton shared by all chat routes
+inference_executor = InferenceExecutor(
+    max_workers=settings.inference_workers,
+    max_queue_size=settings.inference_queue_size,
+)
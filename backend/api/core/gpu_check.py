@@ -1,3 +1,5 @@
+from typing import Optional
+
 import torch
 
 def get_device_status() -> dict:
@@ -6,4 +8,20 @@ def get_device_status() -> dict:
         device_name = torch.cuda.get_device_name(0)
         return {"device": "cuda", "device_name": device_name}
     else:
-        return {"device": "cpu", "device_name": "CPU"} 
\ No newline at end of file
+        return {"device": "cpu", "device_name": "CPU"}
+
+
+def get_cuda_memory() -> Optional[dict]:
+    """Memory of CUDA device 0 in bytes, or None when CUDA is not available."""
+    if not torch.cuda.is_available():
+        return None
+    total_mem = torch.cuda.get_device_properties(0).total_memory
+    reserved_mem = torch.cuda.memory_reserved(0)
+    allocated_mem = torch.cuda.memory_allocated(0)
+    return {
+        "device_name": torch.cuda.get_device_name(0),
+        "total": total_mem,
+        "reserved": reserved_mem,
+        "allocated": allocated_mem,
+        "free_in_reserved": reserved_mem - allocated_mem,
+    }
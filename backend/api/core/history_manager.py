@@ -1,12 +1,18 @@
 import os
 import json
+import base64
 import datetime
 from datetime import UTC
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import re
+import shutil
 import threading
 
+from .config import settings
+from .history_store import HistoryStore, SQLiteHistoryStore, compact_messages, new_messages
+from .session_index import SessionIndex, index_entry, recency_key
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
@@ -26,6 +32,83 @@ thread_id_lock = threading.Lock()
 
 os.makedirs(HISTORY_DIR, exist_ok=True)
 
+# --- NEW: Pluggable storage backend ---
+# The JSON files below are the built-in backend; with settings.history_backend set
+# to another store every public function hands off to it.
+_history_store: Optional[HistoryStore] = None
+_history_store_lock = threading.Lock()
+
+def get_history_db_path() -> str:
+    return settings.history_db_path or os.path.join(HISTORY_DIR, "history.sqlite3")
+
+def get_history_store() -> Optional[HistoryStore]:
+    """Returns the configured store, or None when sessions live in JSON files."""
+    global _history_store
+    if settings.history_backend == "json":
+        return None
+    path = get_history_db_path()
+    with _history_store_lock:
+        if _history_store is None or _history_store.path != path:
+            if _history_store is not None:
+                _history_store.close()
+            _history_store = SQLiteHistoryStore(path)
+        return _history_store
+
+# --- NEW: Listing index of the JSON files (see session_index) ---
+SESSION_INDEX_FILENAME = ".session_index.jsonl"
+_session_indexes: Dict[str, SessionIndex] = {}
+
+def get_session_index() -> SessionIndex:
+    path = os.path.join(HISTORY_DIR, SESSION_INDEX_FILENAME)
+    with _history_store_lock:
+        if path not in _session_indexes:
+            _session_indexes[path] = SessionIndex(path)
+        return _session_indexes[path]
+
+def _index_session(thread_id: str, session_data: Dict[str, Any]) -> None:
+    """Records a session file's new listing fields (until the first listing builds the index there is nothing to update)."""
+    index = get_session_index()
+    if not index.exists():
+        return
+    try:
+        index.put(thread_id, index_entry(session_data))
+    except OSError as e:
+        logging.warning(f"Error updating session index for {thread_id}: {e}")
+
+def _unindex_session(thread_id: str) -> None:
+    index = get_session_index()
+    if not index.exists():
+        return
+    try:
+        index.remove(thread_id)
+    except OSError as e:
+        logging.warning(f"Error removing {thread_id} from session index: {e}")
+
+def _session_file_ids() -> List[str]:
+    """Thread ids of the session files in HISTORY_DIR (names only, nothing is read)."""
+    thread_ids = []
+    for filename in os.listdir(HISTORY_DIR):
+        if not filename.endswith(".json"):
+            continue
+        thread_id = filename[:-5] # Remove .json extension
+        # Add basic check for potentially invalid filenames from listdir
+        if ".." in thread_id or "/" in thread_id or "\\" in thread_id:
+            logging.warning(f"Skipping potentially unsafe filename: {filename}")
+            continue
+        thread_ids.append(thread_id)
+    return thread_ids
+
+def rebuild_session_index() -> int:
+    """Rebuilds the listing index from the session files; returns the number of sessions indexed."""
+    entries = {}
+    for thread_id in _session_file_ids():
+        session_data = _read_session_file(thread_id)
+        if session_data:
+            entries[thread_id] = index_entry(session_data)
+    get_session_index().replace_all(entries)
+    return len(entries)
+# --- END NEW ---
+
 def generate_thread_id() -> str:
     """Generates a unique sequential thread ID."""
     with thread_id_lock:
@@ -81,18 +164,84 @@ def get_session_filepath(thread_id: str) -> str:
     # For new thread IDs, use the numbered format
     return os.path.join(HISTORY_DIR, f"{thread_id}.json")
 
+# --- NEW: Sidecar file holding a thread's saved KV cache ---
+def get_kv_snapshot_filepath(thread_id: str) -> str:
+    """Gets the full path for a session's KV cache snapshot (stored next to its JSON file)."""
+    return get_session_filepath(thread_id)[:-len(".json")] + ".kv.safetensors"
+
+def remove_kv_snapshot(thread_id: str) -> None:
+    """Removes a session's KV snapshot, e.g. once its earlier messages no longer match it."""
+    snapshot_path = get_kv_snapshot_filepath(thread_id)
+    if os.path.exists(snapshot_path):
+        try:
+            os.remove(snapshot_path)
+        except OSError as e:
+            logging.error(f"Error deleting KV snapshot {snapshot_path}: {e}")
+# --- END NEW FUNCTION ---
+
+# --- NEW: Append-only message log next to each session file ---
+# A save appends its new messages to <thread_id>.log.jsonl instead of rewriting the
+# whole session file; reads fold the log in, and every
+# settings.history_log_compact_entries-th save folds it into the session file. Each
+# entry records the message count it starts at, so an entry the file already holds
+# (e.g. a log left behind by a crash after the rewrite) is skipped.
+def get_session_log_filepath(thread_id: str) -> str:
+    """Gets the full path for a session's message log (stored next to its JSON file)."""
+    return get_session_filepath(thread_id)[:-len(".json")] + ".log.jsonl"
+
+def _read_session_log(thread_id: str) -> List[Dict[str, Any]]:
+    log_path = get_session_log_filepath(thread_id)
+    if not os.path.exists(log_path):
+        return []
+    entries = []
+    with open(log_path, 'r') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                break # Cut short mid-append
+    return entries
+
+def _apply_session_log(session_data: Dict[str, Any], entries: List[Dict[str, Any]]) -> None:
+    for entry in entries:
+        if entry.get("position") != len(session_data["messages"]):
+            continue # Already in the session file
+        session_data["messages"].extend(entry.get("messages", []))
+        session_data.setdefault("metadata", {})["last_updated"] = entry.get("last_updated")
+        for key in ("sampling_settings", "system_prompt"):
+            if key in entry:
+                session_data[key] = entry[key]
+
+def _write_session_file(thread_id: str, session_data: Dict[str, Any]) -> None:
+    """Writes the whole session file; its message log is folded in and removed."""
+    filepath = get_session_filepath(thread_id)
+    with open(filepath, 'w') as f:
+        json.dump(session_data, f, indent=2)
+    log_path = get_session_log_filepath(thread_id)
+    if os.path.exists(log_path):
+        os.remove(log_path)
+# --- END NEW ---
+
 def save_chat_messages(
     thread_id: Optional[str], 
     messages: List[Dict[str, Any]],
     sampling_settings: Optional[Dict[str, Any]] = None,
-    system_prompt: Optional[str] = None
+    system_prompt: Optional[str] = None,
+    dedupe: bool = False
 ) -> str:
     """
     Saves a list of messages and associated settings to a chat session file.
     If thread_id is None, creates a new session.
     Saves sampling settings and system prompt if provided.
+    With ``dedupe`` the messages are the full conversation a client sent (plus the
+    reply) and only those not stored yet are appended (see new_messages); a system
+    prompt the thread already holds is never appended again.
     Returns the thread_id of the saved session.
     """
+    store = get_history_store()
+    if store is not None:
+        return store.save_chat_messages(thread_id, messages, sampling_settings, system_prompt, dedupe)
+
     if thread_id is None:
         thread_id = generate_thread_id()
         # For a new thread, create the full structure
@@ -111,32 +260,41 @@ def save_chat_messages(
              print(f"Error saving: {e}")
              raise 
 
-        if os.path.exists(filepath):
+        session_data, log_entries = _load_session_file(thread_id) if os.path.exists(filepath) else (None, 0)
+        if session_data is not None:
+            # --- MODIFIED: Append the new messages to the session's log ---
+            entry = {"position": len(session_data["messages"])}
+            entry["messages"] = new_messages(session_data["messages"], messages, includes_history=dedupe)
+            entry["last_updated"] = datetime.datetime.now(UTC).isoformat()
+            # Update settings only if they are explicitly passed in
+            if sampling_settings is not None:
+                entry["sampling_settings"] = sampling_settings
+            if system_prompt is not None:
+                entry["system_prompt"] = system_prompt
+            _apply_session_log(session_data, [entry])
             try:
-                with open(filepath, 'r') as f:
-                    session_data = json.load(f)
-                # Append new messages
-                session_data["messages"].extend(messages)
-                session_data["metadata"]["last_updated"] = datetime.datetime.now(UTC).isoformat()
-                # Update settings only if they are explicitly passed in
-                if sampling_settings is not None:
-                    session_data["sampling_settings"] = sampling_settings
-                if system_prompt is not None:
-                    session_data["system_prompt"] = system_prompt
-                # Ensure custom_title field exists if loading older session file
-                if "custom_title" not in session_data:
-                    session_data["custom_title"] = None
-            except (json.JSONDecodeError, IOError) as e:
-                logging.warning(f"Error reading session file {thread_id}: {e}. Overwriting with new data.")
-                # If file is corrupted, overwrite with current state
-                session_data = {
-                    "thread_id": thread_id, 
-                    "messages": messages, 
-                    "metadata": {"last_updated": datetime.datetime.utcnow().isoformat()},
-                    "sampling_settings": sampling_settings,
-                    "system_prompt": system_prompt,
-                    "custom_title": None
-                }
+                if log_entries + 1 >= settings.history_log_compact_entries:
+                    _write_session_file(thread_id, session_data)
+                else:
+                    with open(get_session_log_filepath(thread_id), 'a') as f:
+                        f.write(json.dumps(entry) + "\n")
+            except IOError as e:
+                logging.error(f"Error writing session file {thread_id}: {e}")
+                raise # Re-raise the exception to signal failure
+            _index_session(thread_id, session_data)
+            return thread_id
+            # --- END MODIFICATION ---
+        elif os.path.exists(filepath):
+            logging.warning(f"Error reading session file {thread_id}. Overwriting with new data.")
+            # If file is corrupted, overwrite with current state
+            session_data = {
+                "thread_id": thread_id, 
+                "messages": messages, 
+                "metadata": {"last_updated": datetime.datetime.utcnow().isoformat()},
+                "sampling_settings": sampling_settings,
+                "system_prompt": system_prompt,
+                "custom_title": None
+            }
         else:
              # If file doesn't exist for the given ID, create it
              session_data = {
@@ -156,12 +314,12 @@ def save_chat_messages(
          raise
          
     try:
-        with open(filepath, 'w') as f:
-            json.dump(session_data, f, indent=2)
+        _write_session_file(thread_id, session_data)
     except IOError as e:
         logging.error(f"Error writing session file {thread_id}: {e}")
         raise # Re-raise the exception to signal failure
 
+    _index_session(thread_id, session_data)
     return thread_id
 
 # --- NEW: Function to update only the custom title ---
@@ -171,6 +329,10 @@ def update_session_title(thread_id: str, new_title: str) -> bool:
     Returns True if successful, False otherwise.
     Raises ValueError on invalid thread_id.
     """
+    store = get_history_store()
+    if store is not None:
+        return store.update_session_title(thread_id, new_title)
+
     try:
         filepath = get_session_filepath(thread_id)
     except ValueError as e:
@@ -182,14 +344,15 @@ def update_session_title(thread_id: str, new_title: str) -> bool:
         return False
 
     try:
-        with open(filepath, 'r') as f:
-            session_data = json.load(f)
+        session_data = _read_session_file(thread_id)
+        if session_data is None:
+            return False
 
         session_data["custom_title"] = new_title.strip() # Save the stripped title
         session_data["metadata"]["last_updated"] = datetime.datetime.now(UTC).isoformat() # Also update timestamp
 
-        with open(filepath, 'w') as f:
-            json.dump(session_data, f, indent=2)
+        _write_session_file(thread_id, session_data)
+        _index_session(thread_id, session_data)
         
         logging.info(f"Successfully updated title for session {thread_id}")
         return True
@@ -200,82 +363,169 @@ def update_session_title(thread_id: str, new_title: str) -> bool:
 
 def get_session(thread_id: str) -> Optional[Dict[str, Any]]:
     """Loads a chat session from its JSON file."""
+    store = get_history_store()
+    if store is not None:
+        return store.get_session(thread_id)
+    return _read_session_file(thread_id)
+
+def _read_session_file(thread_id: str) -> Optional[Dict[str, Any]]:
+    return _load_session_file(thread_id)[0]
+
+def _load_session_file(thread_id: str) -> Tuple[Optional[Dict[str, Any]], int]:
+    """Reads a session file with its message log folded in; also returns the log's entry count."""
     try:
         filepath = get_session_filepath(thread_id)
     except ValueError:
-        return None # Invalid thread_id format
+        return None, 0 # Invalid thread_id format
         
     if not os.path.exists(filepath):
-        return None
+        return None, 0
     try:
         with open(filepath, 'r') as f:
             session_data = json.load(f)
         # Ensure custom_title field is present in the response, even if None
         if "custom_title" not in session_data:
             session_data["custom_title"] = None
-        return session_data
-    except (json.JSONDecodeError, IOError) as e:
+        log_entries = _read_session_log(thread_id)
+        _apply_session_log(session_data, log_entries)
+        return session_data, len(log_entries)
+    except (json.JSONDecodeError, IOError, KeyError, TypeError) as e:
         logging.error(f"Error reading session file {thread_id}: {e}")
-        return None # Indicate failure to load
+        return None, 0 # Indicate failure to load
+
+def _session_title(thread_id: str, custom_title: Optional[str], first_user_message: Optional[str]) -> str:
+    """Sidebar title: the custom title, else the (truncated) first user message."""
+    # Prioritize custom_title
+    if custom_title:
+        return custom_title
+    # Fallback to first user message if custom_title is None or empty
+    if first_user_message:
+        return first_user_message[:50] + ('...' if len(first_user_message) > 50 else '') # Truncate
+    # If this is a new numbered thread ID, hide it and use a generic title
+    if not is_legacy_thread_id(thread_id):
+        return "Untitled Chat"
+    return thread_id # Ultimate fallback to thread_id
+
+def _session_summary(thread_id: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+    """A /sessions item from an index entry (JSON backend) or a store summary."""
+    return {
+        "thread_id": thread_id,
+        "title": _session_title(thread_id, entry.get("custom_title"), entry.get("first_user_message")),
+        "last_updated": entry.get("last_updated"),
+        "created_at": entry.get("created_at"),
+        "message_count": entry.get("message_count"),
+        "is_legacy_id": is_legacy_thread_id(thread_id) # Add flag for frontend to know format
+    }
 
 def list_sessions() -> List[Dict[str, Any]]:
     """Lists all available chat sessions with basic metadata and title."""
-    sessions_list = []
+    store = get_history_store()
+    if store is not None:
+        return [_session_summary(summary["thread_id"], summary) for summary in store.list_session_summaries()]
+
     if not os.path.isdir(HISTORY_DIR):
         logging.warning(f"History directory not found: {HISTORY_DIR}")
         return []
     try:
-        for filename in os.listdir(HISTORY_DIR):
-            # Skip the counter file
-            if filename == ".thread_counter":
-                continue
-                
-            if filename.endswith(".json"):
-                thread_id = filename[:-5] # Remove .json extension
-                # Add basic check for potentially invalid filenames from listdir
-                if ".." in thread_id or "/" in thread_id or "\\" in thread_id:
-                    logging.warning(f"Skipping potentially unsafe filename: {filename}")
-                    continue
-                
-                # --- MODIFIED: Read title from session data ---
-                session_data = get_session(thread_id) # Use get_session to load full data
-                if not session_data:
-                    logging.warning(f"Skipping session {thread_id} due to loading error.")
-                    continue # Skip if session failed to load
-
-                # Prioritize custom_title
-                title = session_data.get("custom_title")
-                
-                # Fallback to first user message if custom_title is None or empty
-                if not title:
-                    messages = session_data.get("messages", [])
-                    first_user_message = next((msg.get("content") for msg in messages if msg.get("role") == "user"), None)
-                    if first_user_message:
-                         title = first_user_message[:50] + ('...' if len(first_user_message) > 50 else '') # Truncate
-                    else:
-                         # If this is a new numbered thread ID, hide it and use a generic title
-                         if not is_legacy_thread_id(thread_id):
-                             title = "Untitled Chat" 
-                         else:
-                             title = thread_id # Ultimate fallback to thread_id
-
-                sessions_list.append({
-                    "thread_id": thread_id,
-                    "title": title, # Use the determined title
-                    "last_updated": session_data.get("metadata", {}).get("last_updated"),
-                    "created_at": session_data.get("metadata", {}).get("created_at"),
-                    "is_legacy_id": is_legacy_thread_id(thread_id) # Add flag for frontend to know format
-                })
-                # --- END MODIFICATION ---
-
-        # Sort sessions, e.g., by last updated descending (most recent first)
-        sessions_list.sort(key=lambda x: x.get("last_updated") or x.get("created_at") or '', reverse=True)
+        # --- MODIFIED: Listing fields come from the session index, not the files ---
+        index = get_session_index()
+        if not index.exists():
+            print(f"🗂️ Building session index for {HISTORY_DIR}...")
+            rebuild_session_index()
+        entries = index.entries()
 
+        # Pick up files the write paths didn't index (copied in, older versions) and drop
+        # entries whose file is gone; only those files are read
+        on_disk = set(_session_file_ids())
+        for thread_id in on_disk - entries.keys():
+            session_data = _read_session_file(thread_id)
+            if not session_data:
+                logging.warning(f"Skipping session {thread_id} due to loading error.")
+                continue # Skip if session failed to load
+            entries[thread_id] = index_entry(session_data)
+            index.put(thread_id, entries[thread_id])
+        for thread_id in entries.keys() - on_disk:
+            del entries[thread_id]
+            index.remove(thread_id)
+        # --- END MODIFICATION ---
     except OSError as e:
         logging.error(f"Error listing directory {HISTORY_DIR}: {e}")
         return [] # Return empty list on error
 
-    return sessions_list
+    # Sort sessions by last updated descending (most recent first), in the same order as pages
+    ordered = sorted(entries.items(), key=lambda item: recency_key(*item), reverse=True)
+    return [_session_summary(thread_id, entry) for thread_id, entry in ordered]
+
+# --- NEW: Paginated listing ---
+def encode_session_cursor(key: Tuple[str, str]) -> str:
+    """Opaque page cursor for a (last_updated or created_at, thread_id) listing key."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_session_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_session_cursor; raises ValueError for anything it didn't produce."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e: # binascii.Error and JSONDecodeError are ValueErrors
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not (isinstance(key, list) and len(key) == 2 and all(isinstance(part, str) for part in key)):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return key[0], key[1]
+
+def _utc_timestamp(value: Optional[datetime.datetime]) -> Optional[str]:
+    """A filter bound in the stored timestamp format (UTC isoformat); naive datetimes are UTC."""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.astimezone(UTC).isoformat()
+
+def list_sessions_page(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    updated_after: Optional[datetime.datetime] = None,
+    updated_before: Optional[datetime.datetime] = None,
+    title_prefix: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    One page of list_sessions(), newest first: {"sessions": [...], "next_cursor": str or None}.
+
+    ``cursor`` is the previous page's next_cursor. ``updated_after``/``updated_before``
+    bound the last activity time ([after, before)); ``title_prefix`` matches the start
+    of the custom title, else of the first user message, ignoring case. Pages come
+    from the session index (JSON) or the sessions table indexes (SQLite) without
+    reading the other sessions; with ``title_prefix`` a page costs O(m log m) for the
+    m sessions whose title matches (see HistoryStore.list_session_page). Raises
+    ValueError for an invalid cursor.
+    """
+    limit = max(1, min(limit or settings.session_page_size, settings.session_page_size_max))
+    query = {
+        "before": decode_session_cursor(cursor) if cursor else None,
+        "updated_after": _utc_timestamp(updated_after),
+        "updated_before": _utc_timestamp(updated_before),
+        "title_prefix": title_prefix or None,
+    }
+
+    # One extra row tells whether there is a next page
+    store = get_history_store()
+    if store is not None:
+        rows = [(summary["thread_id"], summary) for summary in store.list_session_page(limit + 1, **query)]
+    elif not os.path.isdir(HISTORY_DIR):
+        rows = []
+    else:
+        # Unlike list_sessions() this trusts the index and doesn't look at the directory;
+        # the write paths keep it current and a full listing reconciles it
+        index = get_session_index()
+        if not index.exists():
+            print(f"🗂️ Building session index for {HISTORY_DIR}...")
+            rebuild_session_index()
+        rows = index.page(limit + 1, **query)
+
+    next_cursor = encode_session_cursor(recency_key(*rows[limit - 1])) if len(rows) > limit else None
+    return {
+        "sessions": [_session_summary(thread_id, entry) for thread_id, entry in rows[:limit]],
+        "next_cursor": next_cursor,
+    }
+# --- END NEW ---
 
 # --- NEW: Function to delete a session file ---
 def delete_session(thread_id: str) -> bool:
@@ -284,6 +534,13 @@ def delete_session(thread_id: str) -> bool:
     Returns True if successful, False otherwise.
     Raises ValueError on invalid thread_id format.
     """
+    store = get_history_store()
+    if store is not None:
+        deleted = store.delete_session(thread_id)
+        if deleted:
+            remove_kv_snapshot(thread_id)
+        return deleted
+
     try:
         filepath = get_session_filepath(thread_id)
     except ValueError as e:
@@ -296,6 +553,10 @@ def delete_session(thread_id: str) -> bool:
 
     try:
         os.remove(filepath)
+        if os.path.exists(get_session_log_filepath(thread_id)):
+            os.remove(get_session_log_filepath(thread_id))
+        _unindex_session(thread_id)
+        remove_kv_snapshot(thread_id)
         logging.info(f"Successfully deleted session file: {filepath}")
         return True
     except OSError as e:
@@ -319,6 +580,14 @@ def edit_chat_message(thread_id: str, message_index: int, new_content: str) -> b
     Raises:
         ValueError: If thread_id format is invalid or message_index is out of range
     """
+    store = get_history_store()
+    if store is not None:
+        edited = store.edit_chat_message(thread_id, message_index, new_content)
+        if edited:
+            # The saved KV cache was computed from the old content
+            remove_kv_snapshot(thread_id)
+        return edited
+
     try:
         filepath = get_session_filepath(thread_id)
     except ValueError as e:
@@ -330,8 +599,9 @@ def edit_chat_message(thread_id: str, message_index: int, new_content: str) -> b
         return False
 
     try:
-        with open(filepath, 'r') as f:
-            session_data = json.load(f)
+        session_data = _read_session_file(thread_id)
+        if session_data is None:
+            return False
         
         # Check if messages list exists and is properly formed
         if not isinstance(session_data.get("messages"), list):
@@ -355,8 +625,11 @@ def edit_chat_message(thread_id: str, message_index: int, new_content: str) -> b
         session_data["metadata"]["last_updated"] = datetime.datetime.now(UTC).isoformat()
         
         # Write the updated session data back to the file
-        with open(filepath, 'w') as f:
-            json.dump(session_data, f, indent=2)
+        _write_session_file(thread_id, session_data)
+        _index_session(thread_id, session_data)
+
+        # The saved KV cache was computed from the old content
+        remove_kv_snapshot(thread_id)
             
         logging.debug(f"Successfully edited message {message_index} in session {thread_id}")
         return True
@@ -374,4 +647,107 @@ def edit_chat_message(thread_id: str, message_index: int, new_content: str) -> b
             logging.error(f"Unexpected error when editing message in session {thread_id}: {e}")
             return False
         raise  # Re-raise ValueError
-# --- END NEW FUNCTION ---
\ No newline at end of file
+# --- END NEW FUNCTION ---
+
+# --- NEW: One-time compaction of sessions saved with duplicated history ---
+def compact_session(thread_id: str, dry_run: bool = False, backup: bool = True) -> Optional[Dict[str, int]]:
+    """
+    Rewrites a session file without the duplicated history (see compact_messages).
+    Returns the message counts before and after, or None if the session can't be read.
+    With ``backup`` the original file is kept as ``<thread_id>.json.bak``.
+    """
+    filepath = get_session_filepath(thread_id)
+    session_data = _read_session_file(thread_id)
+    if session_data is None:
+        return None
+
+    messages = session_data.get("messages")
+    if not isinstance(messages, list):
+        return None
+    compacted = compact_messages(messages)
+    result = {"before": len(messages), "after": len(compacted)}
+    if dry_run or len(compacted) == len(messages):
+        return result
+
+    log_path = get_session_log_filepath(thread_id)
+    if backup:
+        shutil.copy2(filepath, filepath + ".bak")
+        if os.path.exists(log_path):
+            shutil.copy2(log_path, log_path + ".bak")
+    session_data["messages"] = compacted
+    tmp_path = filepath + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(session_data, f, indent=2)
+    os.replace(tmp_path, filepath)
+    if os.path.exists(log_path):
+        os.remove(log_path) # Folded into the compacted file
+    _index_session(thread_id, session_data)
+    return result
+
+def compact_all_sessions(dry_run: bool = False, backup: bool = True) -> Dict[str, Dict[str, int]]:
+    """Compacts every session in HISTORY_DIR; returns the counts of each session that shrank."""
+    results = {}
+    for filename in sorted(os.listdir(HISTORY_DIR)):
+        if not filename.endswith(".json"):
+            continue
+        thread_id = filename[:-5]
+        try:
+            result = compact_session(thread_id, dry_run=dry_run, backup=backup)
+        except ValueError:
+            continue
+        if result and result["after"] < result["before"]:
+            results[thread_id] = result
+    return results
+# --- END NEW ---
+
+# --- NEW: Importer from the JSON files into a store ---
+def import_json_sessions(
+    store: Optional[HistoryStore] = None, compact: bool = False, overwrite: bool = False
+) -> Dict[str, int]:
+    """
+    Copies every session file in HISTORY_DIR into ``store`` (default: the configured
+    store). Sessions already in the store are skipped unless ``overwrite``. With
+    ``compact`` duplicated history is removed on the way (see compact_messages).
+    The JSON files are left untouched. Returns imported/skipped/failed counts.
+    """
+    store = store or get_history_store()
+    if store is None:
+        raise ValueError("No history store configured (SIGIL_HISTORY_BACKEND is 'json').")
+
+    counts = {"imported": 0, "skipped": 0, "failed": 0}
+    highest = 0
+    for filename in sorted(os.listdir(HISTORY_DIR)):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(HISTORY_DIR, filename), 'r') as f:
+                session_data = json.load(f)
+            session_data.setdefault("thread_id", filename[:-5])
+            if not isinstance(session_data.get("messages", []), list):
+                raise ValueError("malformed 'messages' list")
+            session_data.setdefault("messages", [])
+            _apply_session_log(session_data, _read_session_log(filename[:-5])) # Saves not yet folded into the file
+            if compact:
+                session_data["messages"] = compact_messages(session_data.get("messages") or [])
+            imported = store.put_session(session_data, overwrite=overwrite)
+        except (json.JSONDecodeError, IOError, ValueError) as e:
+            logging.error(f"Error importing session file {filename}: {e}")
+            counts["failed"] += 1
+            continue
+        counts["imported" if imported else "skipped"] += 1
+        match = re.match(r'^chat_(\d+)$', session_data["thread_id"])
+        if match:
+            highest = max(highest, int(match.group(1)))
+
+    # New ids continue after both the imported sessions and the JSON counter
+    next_number = highest + 1
+    # The counter next to the files being imported (THREAD_COUNTER_FILE is fixed at import time)
+    counter_file = os.path.join(HISTORY_DIR, os.path.basename(THREAD_COUNTER_FILE))
+    if os.path.exists(counter_file):
+        with open(counter_file, 'r') as f:
+            content = f.read().strip()
+        if content.isdigit():
+            next_number = max(next_number, int(content))
+    store.reserve_thread_numbers(next_number)
+    return counts
+# --- END NEW ---
@@ -0,0 +1,565 @@
+import abc
+import datetime
+import json
+import os
+import sqlite3
+import threading
+from datetime import UTC
+from typing import Any, Dict, List, Optional, Tuple
+
+from .session_index import FIRST_MESSAGE_CHARS, title_key
+
+
+# ---------------------------------------------------------------------------
+# Message-list helpers shared by every backend
+# (clients resend the whole conversation every turn)
+# ---------------------------------------------------------------------------
+def _message_key(message: Dict[str, Any]) -> tuple:
+    return (message.get("role"), message.get("content"))
+
+
+def _overlap(stored: List[tuple], incoming: List[tuple]) -> int:
+    """Length of the longest suffix of ``stored`` that is a prefix of ``incoming``."""
+    for k in range(min(len(stored), len(incoming)), 0, -1):
+        if stored[-k:] == incoming[:k]:
+            return k
+    return 0
+
+
+def new_messages(
+    stored: List[Dict[str, Any]], incoming: List[Dict[str, Any]], includes_history: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    Returns the part of ``incoming`` that is not stored yet.
+
+    With ``includes_history`` (a client's full conversation plus the reply)
+    conversation messages are matched on role and content: when the stored
+    conversation is a prefix of the incoming one only the rest is new; otherwise the
+    longest stored suffix (or common prefix) that the incoming messages repeat is
+    skipped. Without it every conversation message is new. System messages are
+    kept once per distinct content either way.
+    """
+    stored_conversation = [_message_key(m) for m in stored if m.get("role") != "system"]
+    stored_system = {m.get("content") for m in stored if m.get("role") == "system"}
+
+    incoming_conversation = [m for m in incoming if m.get("role") != "system"]
+    keys = [_message_key(m) for m in incoming_conversation]
+    if not includes_history:
+        known = 0
+    elif keys[:len(stored_conversation)] == stored_conversation:
+        known = len(stored_conversation)
+    else:
+        common_prefix = 0
+        while (common_prefix < min(len(keys), len(stored_conversation))
+               and keys[common_prefix] == stored_conversation[common_prefix]):
+            common_prefix += 1
+        known = max(_overlap(stored_conversation, keys), common_prefix)
+
+    new_system = []
+    for m in incoming:
+        if m.get("role") == "system" and m.get("content") and m.get("content") not in stored_system:
+            stored_system.add(m.get("content"))
+            new_system.append(m)
+    return new_system + incoming_conversation[known:]
+
+
+def compact_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Removes the history that older versions stored again on every turn.
+
+    Each save used to append the system prompt, the whole conversation so far and
+    the reply, so a file reads like ``[sys, u1, a1, sys, u1, a1, u2, a2, ...]``.
+    Repeated system prompts and every replay of the complete conversation so far are
+    dropped; everything else (including edited copies) is kept in order.
+    """
+    compacted: List[Dict[str, Any]] = []
+    conversation: List[tuple] = []
+    seen_system = set()
+    i = 0
+    while i < len(messages):
+        message = messages[i]
+        if message.get("role") == "system":
+            if message.get("content") not in seen_system:
+                seen_system.add(message.get("content"))
+                compacted.append(message)
+            i += 1
+            continue
+        n = len(conversation)
+        if n and [_message_key(m) for m in messages[i:i + n]] == conversation:
+            i += n  # A replay of everything stored so far
+            continue
+        compacted.append(message)
+        conversation.append(_message_key(message))
+        i += 1
+    return compacted
+
+
+def check_thread_id(thread_id: str) -> None:
+    """Thread ids double as file names (sessions, KV snapshots); reject path elements."""
+    if not thread_id or ".." in thread_id or "/" in thread_id or "\\" in thread_id:
+        raise ValueError("Invalid thread_id format containing path elements.")
+
+
+def _title_key(row: sqlite3.Row) -> str:
+    # Same key and first-message prefix as the JSON backend's session index
+    first_user_message = row["first_user_message"]
+    return title_key({
+        "custom_title": row["custom_title"],
+        "first_user_message": first_user_message[:FIRST_MESSAGE_CHARS] if first_user_message else None,
+    })
+
+
+def _now() -> str:
+    return datetime.datetime.now(UTC).isoformat()
+
+
+# ---------------------------------------------------------------------------
+# Storage backends
+# ---------------------------------------------------------------------------
+class HistoryStore(abc.ABC):
+    """Storage backend for chat sessions.
+
+    history_manager keeps the JSON files in HISTORY_DIR as its built-in backend and
+    hands every call to the configured store otherwise (settings.history_backend).
+    Methods mirror the history_manager functions of the same name, take the same
+    arguments, return the same shapes and raise ValueError in the same cases.
+    """
+
+    @abc.abstractmethod
+    def save_chat_messages(
+        self,
+        thread_id: Optional[str],
+        messages: List[Dict[str, Any]],
+        sampling_settings: Optional[Dict[str, Any]] = None,
+        system_prompt: Optional[str] = None,
+        dedupe: bool = False,
+    ) -> str:
+        ...
+
+    @abc.abstractmethod
+    def get_session(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    def list_session_summaries(self) -> List[Dict[str, Any]]:
+        """thread_id, custom_title, first_user_message, created_at, last_updated and
+        message_count of every session, most recently updated first."""
+
+    @abc.abstractmethod
+    def list_session_page(
+        self,
+        limit: int,
+        before: Optional[Tuple[str, str]] = None,
+        updated_after: Optional[str] = None,
+        updated_before: Optional[str] = None,
+        title_prefix: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Up to ``limit`` summaries (as list_session_summaries) in the same order, starting
+        after the (last_updated or created_at, thread_id) key ``before``. The timestamp
+        must be in [updated_after, updated_before) and the custom title, else the first
+        user message, must start with ``title_prefix`` (case-insensitively).
+
+        Without ``title_prefix`` a page should cost O(log n + limit). With it the m
+        matching titles are filtered and ordered by recency, O(log n + m log m): no
+        single index is ordered by both title and recency."""
+
+    @abc.abstractmethod
+    def update_session_title(self, thread_id: str, new_title: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def delete_session(self, thread_id: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def edit_chat_message(self, thread_id: str, message_index: int, new_content: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def put_session(self, session_data: Dict[str, Any], overwrite: bool = False) -> bool:
+        """Stores a complete session as read from a JSON file (the importer's entry point).
+        Returns False if it exists and ``overwrite`` is off."""
+
+    @abc.abstractmethod
+    def reserve_thread_numbers(self, next_number: int) -> None:
+        """Makes generated ids (chat_NNNNNN) start at ``next_number`` or later."""
+
+    def close(self) -> None:
+        pass
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    thread_id TEXT PRIMARY KEY,
+    custom_title TEXT,
+    system_prompt TEXT,
+    sampling_settings TEXT,
+    created_at TEXT,
+    last_updated TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    first_user_message TEXT,
+    title_key TEXT  -- session_index.title_key(): folded in Python, as SQLite's lower() is ASCII-only
+);
+CREATE TABLE IF NOT EXISTS messages (
+    thread_id TEXT NOT NULL REFERENCES sessions (thread_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT,
+    extra TEXT,
+    PRIMARY KEY (thread_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS sessions_by_recency ON sessions (COALESCE(last_updated, created_at, ''), thread_id);
+-- Title prefix pages range-scan the matching titles; the recency columns let the date
+-- and cursor conditions be checked in the index before any session row is read
+DROP INDEX IF EXISTS sessions_by_title_key;
+CREATE INDEX IF NOT EXISTS sessions_by_title ON sessions (title_key, COALESCE(last_updated, created_at, ''), thread_id);
+CREATE INDEX IF NOT EXISTS system_messages ON messages (thread_id) WHERE role = 'system';
+"""
+
+# Must match the index expression above word for word for SQLite to use it
+_RECENCY = "COALESCE(last_updated, created_at, '')"
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """Sessions and messages in one SQLite database in WAL mode.
+
+    Every operation is a single transaction that touches only the rows it needs:
+    a save inserts the new message rows, a title update or message edit updates one
+    row, and listing reads the sessions table (which keeps the message count and
+    first user message) without loading any messages. Each thread gets its own
+    connection; WAL lets reads proceed while another thread writes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript(_SCHEMA)
+        self._add_title_keys(conn)
+        conn.executescript(_INDEXES)
+
+    # --- Connections & transactions ---
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: transactions are opened explicitly in _write
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.execute("PRAGMA synchronous = NORMAL")  # Durable at checkpoints; safe with WAL
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _write(self) -> "_Transaction":
+        return _Transaction(self._connection())
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    # --- HistoryStore API ---
+    def save_chat_messages(
+        self,
+        thread_id: Optional[str],
+        messages: List[Dict[str, Any]],
+        sampling_settings: Optional[Dict[str, Any]] = None,
+        system_prompt: Optional[str] = None,
+        dedupe: bool = False,
+    ) -> str:
+        if thread_id is not None:
+            check_thread_id(thread_id)
+        with self._write() as conn:
+            if thread_id is None:
+                thread_id = self._next_thread_id(conn)
+            row = conn.execute("SELECT message_count FROM sessions WHERE thread_id = ?", (thread_id,)).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO sessions (thread_id, system_prompt, sampling_settings, created_at) VALUES (?, ?, ?, ?)",
+                    (thread_id, system_prompt, _dumps(sampling_settings), _now()),
+                )
+                position = 0
+            else:
+                position = row["message_count"]
+                stored = self._dedupe_window(conn, thread_id, messages, dedupe)
+                messages = new_messages(stored, messages, includes_history=dedupe)
+
+                updates, params = ["last_updated = ?"], [_now()]
+                if sampling_settings is not None:
+                    updates.append("sampling_settings = ?")
+                    params.append(_dumps(sampling_settings))
+                if system_prompt is not None:
+                    updates.append("system_prompt = ?")
+                    params.append(system_prompt)
+                conn.execute(f"UPDATE sessions SET {', '.join(updates)} WHERE thread_id = ?", (*params, thread_id))
+            self._insert_messages(conn, thread_id, position, messages)
+        return thread_id
+
+    @staticmethod
+    def _dedupe_window(
+        conn: sqlite3.Connection, thread_id: str, incoming: List[Dict[str, Any]], dedupe: bool,
+    ) -> List[Dict[str, Any]]:
+        """The stored messages new_messages needs, without reading the whole thread.
+
+        System prompts, plus with dedupe the first ``n + 1`` and the last ``n``
+        conversation messages for ``n`` incoming ones: the common prefix and the
+        overlapping suffix can't be longer than ``n``, and a longer stored history
+        can't be a prefix of the incoming one, so the window decides like the full history.
+        """
+        rows = list(conn.execute(
+            "SELECT position, role, content FROM messages WHERE thread_id = ? AND role = 'system'", (thread_id,)
+        ))
+        if dedupe:
+            n = sum(1 for m in incoming if m.get("role") != "system")
+            query = "SELECT position, role, content FROM messages WHERE thread_id = ? AND role != 'system' ORDER BY position"
+            rows += conn.execute(query + " LIMIT ?", (thread_id, n + 1)).fetchall()
+            rows += conn.execute(query + " DESC LIMIT ?", (thread_id, n)).fetchall()
+        window = {r["position"]: {"role": r["role"], "content": r["content"]} for r in rows}
+        return [window[p] for p in sorted(window)]
+
+    def get_session(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            check_thread_id(thread_id)
+        except ValueError:
+            return None
+        conn = self._connection()
+        # One read transaction so the session row and its messages are consistent
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT * FROM sessions WHERE thread_id = ?", (thread_id,)).fetchone()
+            if row is None:
+                return None
+            messages = [
+                _message_from_row(r)
+                for r in conn.execute(
+                    "SELECT role, content, extra FROM messages WHERE thread_id = ? ORDER BY position", (thread_id,)
+                )
+            ]
+        finally:
+            conn.execute("COMMIT")
+        metadata = {key: row[key] for key in ("created_at", "last_updated") if row[key] is not None}
+        return {
+            "thread_id": thread_id,
+            "messages": messages,
+            "metadata": metadata,
+            "sampling_settings": _loads(row["sampling_settings"]),
+            "system_prompt": row["system_prompt"],
+            "custom_title": row["custom_title"],
+        }
+
+    def list_session_summaries(self) -> List[Dict[str, Any]]:
+        rows = self._connection().execute(
+            "SELECT thread_id, custom_title, first_user_message, created_at, last_updated, message_count "
+            f"FROM sessions ORDER BY {_RECENCY} DESC, thread_id DESC"
+        )
+        return [dict(r) for r in rows]
+
+    def list_session_page(
+        self,
+        limit: int,
+        before: Optional[Tuple[str, str]] = None,
+        updated_after: Optional[str] = None,
+        updated_before: Optional[str] = None,
+        title_prefix: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        # Keyset pagination: each page is a range scan of sessions_by_recency (or of
+        # sessions_by_title when filtering by title) however many sessions there are
+        conditions, params = [], []
+        if before is not None:
+            conditions.append(f"({_RECENCY}, thread_id) < (?, ?)")
+            params.extend(before)
+        if updated_after is not None:
+            conditions.append(f"{_RECENCY} >= ?")
+            params.append(updated_after)
+        if updated_before is not None:
+            conditions.append(f"{_RECENCY} < ?")
+            params.append(updated_before)
+        if title_prefix is not None:
+            prefix = title_prefix.lower()
+            conditions.append("title_key >= ? AND title_key < ?")
+            params.extend((prefix, prefix + "\U0010ffff"))
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        rows = self._connection().execute(
+            "SELECT thread_id, custom_title, first_user_message, created_at, last_updated, message_count "
+            f"FROM sessions {where}ORDER BY {_RECENCY} DESC, thread_id DESC LIMIT ?",
+            (*params, limit),
+        )
+        return [dict(r) for r in rows]
+
+    def update_session_title(self, thread_id: str, new_title: str) -> bool:
+        check_thread_id(thread_id)
+        with self._write() as conn:
+            cursor = conn.execute(
+                "UPDATE sessions SET custom_title = ?, last_updated = ? WHERE thread_id = ?",
+                (new_title.strip(), _now(), thread_id),
+            )
+            self._update_title_key(conn, thread_id)
+        return cursor.rowcount > 0
+
+    def delete_session(self, thread_id: str) -> bool:
+        check_thread_id(thread_id)
+        with self._write() as conn:
+            conn.execute("DELETE FROM messages WHERE thread_id = ?", (thread_id,))
+            cursor = conn.execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+        return cursor.rowcount > 0
+
+    def edit_chat_message(self, thread_id: str, message_index: int, new_content: str) -> bool:
+        check_thread_id(thread_id)
+        with self._write() as conn:
+            row = conn.execute("SELECT message_count FROM sessions WHERE thread_id = ?", (thread_id,)).fetchone()
+            if row is None:
+                return False
+            count = row["message_count"]
+            if message_index < 0 or message_index >= count:
+                raise ValueError(f"Message index {message_index} out of range (0-{count - 1})")
+            message = conn.execute(
+                "SELECT extra FROM messages WHERE thread_id = ? AND position = ?", (thread_id, message_index)
+            ).fetchone()
+            extra = _loads(message["extra"]) or {}
+            extra["edited"] = True
+            conn.execute(
+                "UPDATE messages SET content = ?, extra = ? WHERE thread_id = ? AND position = ?",
+                (new_content, _dumps(extra), thread_id, message_index),
+            )
+            conn.execute(
+                "UPDATE sessions SET last_updated = ?, first_user_message = ("
+                "  SELECT content FROM messages WHERE thread_id = ? AND role = 'user' ORDER BY position LIMIT 1"
+                ") WHERE thread_id = ?",
+                (_now(), thread_id, thread_id),
+            )
+            self._update_title_key(conn, thread_id)
+        return True
+
+    def put_session(self, session_data: Dict[str, Any], overwrite: bool = False) -> bool:
+        thread_id = session_data["thread_id"]
+        check_thread_id(thread_id)
+        metadata = session_data.get("metadata") or {}
+        with self._write() as conn:
+            exists = conn.execute("SELECT 1 FROM sessions WHERE thread_id = ?", (thread_id,)).fetchone()
+            if exists and not overwrite:
+                return False
+            conn.execute("DELETE FROM messages WHERE thread_id = ?", (thread_id,))
+            conn.execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+            conn.execute(
+                "INSERT INTO sessions (thread_id, custom_title, system_prompt, sampling_settings, created_at, last_updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id, session_data.get("custom_title"), session_data.get("system_prompt"),
+                    _dumps(session_data.get("sampling_settings")), metadata.get("created_at"), metadata.get("last_updated"),
+                ),
+            )
+            self._insert_messages(conn, thread_id, 0, session_data.get("messages") or [])
+            self._update_title_key(conn, thread_id)
+        return True
+
+    def reserve_thread_numbers(self, next_number: int) -> None:
+        with self._write() as conn:
+            conn.execute(
+                "INSERT INTO counters (name, value) VALUES ('thread_id', ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)",
+                (next_number,),
+            )
+
+    # --- Helpers ---
+    @staticmethod
+    def _next_thread_id(conn: sqlite3.Connection) -> str:
+        row = conn.execute("SELECT value FROM counters WHERE name = 'thread_id'").fetchone()
+        number = row["value"] if row else 1
+        # Imported sessions may already use the next numbers
+        while conn.execute("SELECT 1 FROM sessions WHERE thread_id = ?", (f"chat_{number:06d}",)).fetchone():
+            number += 1
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES ('thread_id', ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+            (number + 1,),
+        )
+        return f"chat_{number:06d}"
+
+    @staticmethod
+    def _insert_messages(conn: sqlite3.Connection, thread_id: str, position: int, messages: List[Dict[str, Any]]) -> None:
+        if not messages:
+            return
+        conn.executemany(
+            "INSERT INTO messages (thread_id, position, role, content, extra) VALUES (?, ?, ?, ?, ?)",
+            [
+                (thread_id, position + i, m.get("role"), m.get("content"),
+                 _dumps({k: v for k, v in m.items() if k not in ("role", "content")} or None))
+                for i, m in enumerate(messages)
+            ],
+        )
+        first_user = next((m.get("content") for m in messages if m.get("role") == "user"), None)
+        conn.execute(
+            "UPDATE sessions SET message_count = message_count + ?, "
+            "first_user_message = COALESCE(first_user_message, ?) WHERE thread_id = ?",
+            (len(messages), first_user, thread_id),
+        )
+        if first_user is not None:
+            SQLiteHistoryStore._update_title_key(conn, thread_id)
+
+    @staticmethod
+    def _update_title_key(conn: sqlite3.Connection, thread_id: str) -> None:
+        row = conn.execute("SELECT custom_title, first_user_message FROM sessions WHERE thread_id = ?", (thread_id,)).fetchone()
+        if row is not None:
+            conn.execute("UPDATE sessions SET title_key = ? WHERE thread_id = ?", (_title_key(row), thread_id))
+
+    @staticmethod
+    def _add_title_keys(conn: sqlite3.Connection) -> None:
+        """Adds and fills the title_key column in databases created before it existed."""
+        if any(column["name"] == "title_key" for column in conn.execute("PRAGMA table_info(sessions)")):
+            return
+        with _Transaction(conn):
+            conn.execute("DROP INDEX IF EXISTS sessions_by_title")  # Its lower() missed non-ASCII titles
+            conn.execute("ALTER TABLE sessions ADD COLUMN title_key TEXT")
+            rows = conn.execute("SELECT thread_id, custom_title, first_user_message FROM sessions").fetchall()
+            conn.executemany(
+                "UPDATE sessions SET title_key = ? WHERE thread_id = ?",
+                [(_title_key(row), row["thread_id"]) for row in rows],
+            )
+
+
+class _Transaction:
+    """``with`` block around BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error).
+
+    IMMEDIATE takes the write lock up front, so read-modify-write sequences (e.g.
+    appending after the current message count) can't interleave between threads.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.conn.execute("ROLLBACK" if exc_type is not None else "COMMIT")
+
+
+def _dumps(value: Any) -> Optional[str]:
+    return None if value is None else json.dumps(value)
+
+
+def _loads(value: Optional[str]) -> Any:
+    return None if value is None else json.loads(value)
+
+
+def _message_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    message = {"role": row["role"], "content": row["content"]}
+    message.update(_loads(row["extra"]) or {})
+    return message
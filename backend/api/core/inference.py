@@ -1,5 +1,183 @@
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+from .config import settings
+from .metrics import observe_generation
+from .prefix_cache import prefix_cache
+from .prompt_cache import prompt_segments
+from .stopping import CancellationCriteria, StopSequenceCriteria, StopStringMatcher
+from .cancellation import GenerationCancelledError
+
+# Cue appended after a cut-off response before the automatic continuation pass
+CONTINUATION_CUE = "\nContinue:"
+
+# One JSON record per generation when settings.structured_generation_logs is on
+usage_logger = logging.getLogger("sigil.generation")
+
+
+def _debug(message: str) -> None:
+    """Human-readable debug output, silenced in favour of usage_logger records when
+    structured generation logs are enabled."""
+    if not settings.structured_generation_logs:
+        print(message)
+
+
+def _sampling_kwargs(
+    tokenizer: AutoTokenizer,
+    temperature: float,
+    top_p: float,
+    max_new_tokens: int,
+    repetition_penalty: float,
+) -> dict:
+    """Keyword arguments shared by every model.generate call in this module."""
+    return {
+        "max_new_tokens": max_new_tokens,
+        "do_sample": True,
+        "temperature": temperature,
+        "top_k": 50, # Keep default top_k
+        "top_p": top_p,
+        "repetition_penalty": repetition_penalty,
+        "pad_token_id": tokenizer.pad_token_id,
+        # Needed so the continuation pass can resume from this pass's KV cache
+        "return_dict_in_generate": True,
+    }
+
+def _continuation_inputs(tokenizer: AutoTokenizer, outputs) -> Tuple[Dict[str, Any], int]:
+    """Builds model.generate inputs for the continuation pass on top of the first pass.
+
+    Rather than re-tokenizing ``prompt + response + cue`` and prefilling all of it
+    again, the cue tokens are appended to the ids the first pass produced and its
+    ``past_key_values`` are handed back to generate(), which then only prefills the
+    tokens the cache does not cover. Returns the inputs and the number of cached
+    tokens reused (i.e. prefill tokens saved).
+    """
+    sequences = outputs.sequences
+    cue_ids = tokenizer(CONTINUATION_CUE, add_special_tokens=False, return_tensors="pt")["input_ids"]
+    input_ids = torch.cat([sequences, cue_ids.to(sequences.device)], dim=-1)
+    continuation_inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+
+    past_key_values = getattr(outputs, "past_key_values", None)
+    if past_key_values is None:
+        return continuation_inputs, 0
+    continuation_inputs["past_key_values"] = past_key_values
+    if hasattr(past_key_values, "get_seq_length"):
+        reused_tokens = past_key_values.get_seq_length()
+    else:  # Legacy tuple-of-tuples cache
+        reused_tokens = past_key_values[0][0].shape[-2]
+    return continuation_inputs, reused_tokens
+
+class _GenerationTimer(StoppingCriteria):
+    """Stopping criterion that never stops; it only timestamps decoding steps.
+
+    generate() evaluates stopping criteria after every step, so the first call marks
+    the end of the prefill (the first token exists) and everything after it is decode.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+
+    def start(self) -> None:
+        """Marks the beginning of the pass (call right before generate() runs)."""
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+    def split(self, finished_at: float) -> Tuple[float, float]:
+        """Returns ``(prefill_time, decode_time)`` of a pass that ended at ``finished_at``."""
+        first_token_at = self.first_token_at or finished_at
+        return first_token_at - self.started_at, finished_at - first_token_at
+
+def _stop_criteria(
+    matcher: StopStringMatcher, input_ids: torch.Tensor, cancel: Optional[Any] = None,
+) -> Tuple[Dict[str, Any], StopSequenceCriteria, _GenerationTimer]:
+    """generate() kwargs that end the pass as soon as a stop string is produced (or ``cancel``
+    is set) and time its steps."""
+    criteria = StopSequenceCriteria(matcher, input_ids.shape[1])
+    timer = _GenerationTimer()
+    stopping = [criteria, timer]
+    if cancel is not None:
+        stopping.append(CancellationCriteria(cancel))
+    return {"stopping_criteria": StoppingCriteriaList(stopping)}, criteria, timer
+
+def _check_cancelled(cancel: Optional[Any], generated_tokens: int = 0) -> None:
+    """Raises GenerationCancelledError once ``cancel`` is set; the continuation pass is never started."""
+    if cancel is not None and cancel.is_set():
+        _debug(f"   🛑 Generation cancelled after {generated_tokens} tokens")
+        raise GenerationCancelledError(f"Generation cancelled after {generated_tokens} tokens.")
+
+class _ForwardCounter:
+    """Counts forward calls a model makes from the current thread while the context is active.
+
+    Used to estimate speculative-decoding acceptance: the draft runs one forward per
+    proposed token and the main model one per verification step.
+    """
+
+    def __init__(self, model: Optional[AutoModelForCausalLM]):
+        self.model = model
+        self.calls = 0
+        self._thread_id = threading.get_ident()
+        self._handle = None
+
+    def _hook(self, module, args, output):
+        if threading.get_ident() == self._thread_id:
+            self.calls += 1
+
+    def __enter__(self):
+        if self.model is not None:
+            self._handle = self.model.register_forward_hook(self._hook)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._handle is not None:
+            self._handle.remove()
+
+def _speculative_stats(generated_tokens: int, verify_calls: int, draft_calls: int) -> Dict[str, Any]:
+    """Estimates draft tokens proposed/accepted from forward-call counts.
+
+    Every verification step of the main model yields one token of its own on top of
+    the draft tokens it accepted, so ``accepted = generated - verify_calls``.
+    """
+    accepted = max(generated_tokens - verify_calls, 0)
+    return {
+        "draft_tokens_proposed": draft_calls,
+        "draft_tokens_accepted": accepted,
+        "acceptance_rate": (accepted / draft_calls) if draft_calls else None,
+    }
+
+def _encode_prompt(tokenizer: AutoTokenizer, prompt: str, cache_key: Optional[str], device: str) -> Dict[str, torch.Tensor]:
+    """Model inputs for ``prompt``; a thread's prompt is usually already tokenized by the prompt segment cache."""
+    input_ids = torch.tensor([prompt_segments.encode(cache_key, prompt, tokenizer)], dtype=torch.long, device=device)
+    return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+
+def _take_prefix(cache_key: Optional[str], model: AutoModelForCausalLM, input_ids: torch.Tensor) -> Tuple[Dict[str, Any], int]:
+    """Looks up the thread's prefix cache; returns extra generate() kwargs and tokens reused."""
+    if cache_key is None or not settings.prefix_cache_enabled:
+        return {}, 0
+    past_key_values, reused_tokens = prefix_cache.take(cache_key, model, input_ids[0].tolist())
+    if past_key_values is None:
+        return {}, 0
+    return {"past_key_values": past_key_values}, reused_tokens
+
+def _store_prefix(cache_key: Optional[str], model: AutoModelForCausalLM, outputs) -> None:
+    """Keeps the final KV cache of this turn so the thread's next turn can reuse it."""
+    if cache_key is None or not settings.prefix_cache_enabled:
+        return
+    past_key_values = getattr(outputs, "past_key_values", None)
+    if past_key_values is None or not hasattr(past_key_values, "get_seq_length"):
+        return
+    cached_length = past_key_values.get_seq_length()
+    prefix_cache.put(cache_key, model, outputs.sequences[0][:cached_length].tolist(), past_key_values)
 
 def generate_response(
     model: AutoModelForCausalLM,
@@ -10,122 +188,395 @@ def generate_response(
     top_p: float,
     max_new_tokens: int,
     repetition_penalty: float = 1.0,
+    continuation_max_tokens: Optional[int] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    cache_key: Optional[str] = None,
+    stop: Optional[List[str]] = None,
+    assistant_model: Optional[AutoModelForCausalLM] = None,
+    cancel: Optional[Any] = None,
 ) -> str:
     """Generates a response string using the provided model and parameters.
     
     If the response is cut off (generated tokens equal max_new_tokens), a continuation
-    will be automatically generated and appended to the original response.
+    will be automatically generated and appended to the original response. The
+    continuation resumes from the first pass's KV cache and is limited to
+    ``continuation_max_tokens`` (defaults to ``settings.continuation_max_new_tokens``;
+    0 disables it). If ``stats`` is given it is filled with token counts, including
+    ``prefill_tokens_saved`` by the cache reuse.
+
+    ``cache_key`` (normally the thread_id) enables the cross-turn prefix cache: the
+    previous turn's KV cache is reused for the shared token prefix and this turn's
+    cache is stored for the next one.
+
+    Decoding stops as soon as one of the ``stop`` strings (``DEFAULT_STOP_TOKENS``
+    when not given) has been generated; the stop string itself is still part of the
+    returned text for truncate_at_stop_token to remove. ``stats["stop_tokens_saved"]``
+    reports how many tokens of the budget this avoided generating.
+
+    With an ``assistant_model`` (a small draft sharing the tokenizer) generation is
+    speculative: the draft proposes tokens that the main model verifies in a single
+    forward pass. The acceptance rate and effective tokens/s are reported in the
+    debug output and ``stats``.
+
+    ``cancel`` (a CancelToken) is checked between decode steps: once it is set the
+    pass ends at the next step, no continuation runs and GenerationCancelledError
+    is raised.
     """
     try:
-        # Store original device
-        original_device = device
+        _check_cancelled(cancel)  # Cancelled while waiting for a worker
+        # The model already lives on the inference device chosen at load time
+        # (see model_loader); only the inputs are moved here, never the weights.
         inference_device = device
-        
-        # Check if we need to move to CPU for inference due to MPS issues
-        if device == 'mps':
-            print("   ⚠️ MPS device detected. Moving model and inputs to CPU for generation.")
-            inference_device = 'cpu'
-            model.to(inference_device) # Move model to CPU
-
-        # Move inputs to the chosen inference device (CPU or original MPS/CUDA)
-        inputs = tokenizer(prompt, return_tensors="pt").to(inference_device)
+        inputs = _encode_prompt(tokenizer, prompt, cache_key, inference_device)
         input_ids = inputs["input_ids"]
         attention_mask = inputs.get("attention_mask")
         input_length = input_ids.shape[1]
 
-        # --- Removed MPS cache clearing as we're moving to CPU ---
-        # if device == 'mps':
-        #     torch.mps.empty_cache()
-        # --- End MPS cache clearing ---
-
-        print("--- Debug: Inference Parameters ---")
-        print(f"   Prompt (first 100 chars): {prompt[:100]}...")
-        print(f"   Temperature: {temperature}")
-        print(f"   Top P: {top_p}")
-        print(f"   Repetition Penalty: {repetition_penalty}")
-        print(f"   Max New Tokens: {max_new_tokens}")
-        print(f"   Inference Device: {inference_device}")
-        print("------------------------------------")
-
-        with torch.no_grad():
+        _debug("--- Debug: Inference Parameters ---")
+        _debug(f"   Prompt (first 100 chars): {prompt[:100]}...")
+        _debug(f"   Temperature: {temperature}")
+        _debug(f"   Top P: {top_p}")
+        _debug(f"   Repetition Penalty: {repetition_penalty}")
+        _debug(f"   Max New Tokens: {max_new_tokens}")
+        _debug(f"   Inference Device: {inference_device}")
+        if assistant_model is not None:
+            _debug(f"   Draft Model (speculative): {getattr(assistant_model, 'name_or_path', 'unknown')}")
+        _debug("------------------------------------")
+
+        assisted_kwargs = {"assistant_model": assistant_model} if assistant_model is not None else {}
+        prefix_kwargs, prefix_tokens_reused = _take_prefix(cache_key, model, input_ids)
+        if prefix_tokens_reused:
+            _debug(f"   ♻️ Prefix cache hit: reusing {prefix_tokens_reused}/{input_length} prompt tokens")
+
+        stop_matcher = StopStringMatcher(tokenizer, stop)
+        stop_kwargs, stop_criteria, timer = _stop_criteria(stop_matcher, input_ids, cancel)
+
+        timer.start()
+        with torch.no_grad(), _ForwardCounter(model) as verify_counter, _ForwardCounter(assistant_model) as draft_counter:
             outputs = model.generate(
                 input_ids=input_ids,
                 attention_mask=attention_mask,
-                max_new_tokens=max_new_tokens,
-                do_sample=True,
-                temperature=temperature,
-                top_k=50, # Keep default top_k
-                top_p=top_p,
-                repetition_penalty=repetition_penalty,
-                pad_token_id=tokenizer.pad_token_id
+                **prefix_kwargs,
+                **stop_kwargs,
+                **assisted_kwargs,
+                **_sampling_kwargs(tokenizer, temperature, top_p, max_new_tokens, repetition_penalty)
             )
+        prefill_time, decode_time = timer.split(time.perf_counter())
+        final_outputs = outputs
 
         # --- Debug: Token Count ---
-        total_tokens = outputs[0].shape[0]
+        total_tokens = outputs.sequences[0].shape[0]
         generated_tokens = total_tokens - input_length
-        print(f"   Tokens in prompt: {input_length}")
-        print(f"   Tokens generated: {generated_tokens} (limit {max_new_tokens})")
-        print("------------------------------------")
+        _check_cancelled(cancel, generated_tokens)
+        generation_time = prefill_time + decode_time
+        effective_tokens_per_second = generated_tokens / generation_time if generation_time > 0 else None
+        _debug(f"   Tokens in prompt: {input_length}")
+        _debug(f"   Tokens generated: {generated_tokens} (limit {max_new_tokens})")
+        _debug(f"   Prefill: {prefill_time:.3f}s, decode: {decode_time:.3f}s")
+        if effective_tokens_per_second is not None:
+            _debug(f"   Effective speed: {effective_tokens_per_second:.1f} tokens/s")
+        speculative_stats = {}
+        if assistant_model is not None:
+            speculative_stats = _speculative_stats(generated_tokens, verify_counter.calls, draft_counter.calls)
+            if speculative_stats["acceptance_rate"] is not None:
+                _debug(f"   Draft acceptance: {speculative_stats['draft_tokens_accepted']}/"
+                      f"{speculative_stats['draft_tokens_proposed']} ({speculative_stats['acceptance_rate']:.0%})")
+        _debug("------------------------------------")
         # --- End Debug ---
 
-        generated_ids = outputs[0][input_length:]
+        generated_ids = outputs.sequences[0][input_length:]
         # Decode on CPU is fine
         response_text = tokenizer.decode(generated_ids, skip_special_tokens=True)
+
+        if continuation_max_tokens is None:
+            continuation_max_tokens = settings.continuation_max_new_tokens
+        continuation_generated_tokens = 0
+        continuation_prefill_tokens = 0
+        prefill_tokens_saved = 0
+        stop_tokens_saved = 0
+        if stop_criteria.stopped_at is not None:
+            stop_tokens_saved = max_new_tokens - generated_tokens
+            _debug(f"   🛑 Stop string reached after {generated_tokens} tokens ({stop_tokens_saved} tokens saved)")
         
         # --- Check if response might be cut off (generated tokens equals max_new_tokens) ---
-        if generated_tokens >= max_new_tokens:
-            print(f"   🔁 Chaining a continuation pass... (generated {generated_tokens}/{max_new_tokens})")
+        if generated_tokens >= max_new_tokens and continuation_max_tokens > 0 and stop_criteria.stopped_at is None:
+            _debug(f"   🔁 Chaining a continuation pass... (generated {generated_tokens}/{max_new_tokens})")
             
-            # Create continuation prompt by appending the current response
-            continuation_prompt = f"{prompt}{response_text}\nContinue:"
+            # Resume from the first pass instead of re-encoding prompt + response
+            continuation_inputs, prefill_tokens_saved = _continuation_inputs(tokenizer, outputs)
+            continuation_input_length = continuation_inputs["input_ids"].shape[1]
+            continuation_prefill_tokens = continuation_input_length - prefill_tokens_saved
             
-            # Generate continuation with same parameters (but reusing the model that's already on the right device)
-            continuation_inputs = tokenizer(continuation_prompt, return_tensors="pt").to(inference_device)
-            continuation_input_ids = continuation_inputs["input_ids"]
-            continuation_attention_mask = continuation_inputs.get("attention_mask")
-            continuation_input_length = continuation_input_ids.shape[1]
-            
-            # Use a fixed number of tokens for the continuation (e.g., 500)
-            continuation_max_tokens = 500
-            
-            print(f"   Continuation prompt length: {continuation_input_length} tokens")
-            print(f"   Generating up to {continuation_max_tokens} additional tokens")
+            _debug(f"   Continuation prompt length: {continuation_input_length} tokens "
+                  f"({prefill_tokens_saved} reused from KV cache, {continuation_prefill_tokens} prefilled)")
+            _debug(f"   Generating up to {continuation_max_tokens} additional tokens")
             
+            continuation_stop_kwargs, continuation_stop, continuation_timer = _stop_criteria(
+                stop_matcher, continuation_inputs["input_ids"], cancel
+            )
+            continuation_timer.start()
             with torch.no_grad():
                 continuation_outputs = model.generate(
-                    input_ids=continuation_input_ids,
-                    attention_mask=continuation_attention_mask,
-                    max_new_tokens=continuation_max_tokens,
-                    do_sample=True,
-                    temperature=temperature,
-                    top_k=50,
-                    top_p=top_p,
-                    repetition_penalty=repetition_penalty,
-                    pad_token_id=tokenizer.pad_token_id
+                    **continuation_inputs,
+                    **continuation_stop_kwargs,
+                    **assisted_kwargs,
+                    **_sampling_kwargs(tokenizer, temperature, top_p, continuation_max_tokens, repetition_penalty)
                 )
+            # The continuation only extends the answer, so all of it counts as decode time
+            decode_time += sum(continuation_timer.split(time.perf_counter()))
+            
+            final_outputs = continuation_outputs
             
             # Decode only the newly generated tokens
-            continuation_generated_ids = continuation_outputs[0][continuation_input_length:]
+            continuation_generated_ids = continuation_outputs.sequences[0][continuation_input_length:]
             continuation_text = tokenizer.decode(continuation_generated_ids, skip_special_tokens=True)
             
             # Report tokens generated in continuation
             continuation_generated_tokens = continuation_generated_ids.shape[0]
-            print(f"   Continuation generated: {continuation_generated_tokens} tokens")
+            _check_cancelled(cancel, generated_tokens + continuation_generated_tokens)
+            _debug(f"   Continuation generated: {continuation_generated_tokens} tokens")
+            if continuation_stop.stopped_at is not None:
+                stop_tokens_saved = continuation_max_tokens - continuation_generated_tokens
             
             # Append continuation to original response
             response_text = response_text + continuation_text
-            print("   ✅ Continuation complete and appended to response")
+            _debug("   ✅ Continuation complete and appended to response")
         # --- End continuation handling ---
-        
-        # --- Move model back to original device if it was moved ---
-        if original_device == 'mps' and inference_device == 'cpu':
-             print("   ✅ Generation complete. Moving model back to MPS.")
-             model.to(original_device)
-        # --- End move back ---
+
+        _store_prefix(cache_key, model, final_outputs)
+
+        decoded_tokens = generated_tokens + continuation_generated_tokens
+        generation_stats = {
+            "prompt_tokens": input_length,
+            "prefix_tokens_reused": prefix_tokens_reused,
+            "completion_tokens": generated_tokens,
+            "continuation_tokens": continuation_generated_tokens,
+            "continuation_prefill_tokens": continuation_prefill_tokens,
+            "prefill_tokens_saved": prefill_tokens_saved,
+            "stop_tokens_saved": stop_tokens_saved,
+            "prefill_time": prefill_time,
+            "decode_time": decode_time,
+            "time_to_first_token": prefill_time,
+            # Steady-state decode rate; the first token is paid for by the prefill
+            "tokens_per_second": (decoded_tokens - 1) / decode_time if decoded_tokens > 1 and decode_time > 0 else None,
+            "effective_tokens_per_second": effective_tokens_per_second,
+            "speculative": assistant_model is not None,
+            **speculative_stats,
+        }
+        if settings.structured_generation_logs:
+            usage_logger.info(json.dumps({"event": "generation", "device": str(inference_device), **generation_stats}))
+        observe_generation("single", input_length, decoded_tokens, generation_stats["tokens_per_second"])
+        if stats is not None:
+            stats.update(generation_stats)
              
         return response_text
 
+    except GenerationCancelledError:
+        raise
     except Exception as e:
         # Re-raise exceptions to be handled by the calling endpoint
         print(f"Error during core generation: {e}") # Log error here
-        raise e 
\ No newline at end of file
+        raise e
+
+
+def _stream_pass(
+    model: AutoModelForCausalLM,
+    tokenizer: AutoTokenizer,
+    model_inputs: Dict[str, Any],
+    generation_kwargs: dict,
+    submit: Optional[Callable] = None,
+    timer: Optional[_GenerationTimer] = None,
+) -> Iterator[str]:
+    """Runs one model.generate call on a worker thread and yields text as it is decoded.
+
+    ``submit`` schedules the generate call (e.g. InferenceExecutor.submit); when it is
+    None a plain background thread is used. ``timer`` is started when the worker
+    actually begins, so time spent queued for it is not counted as prefill. The generator's return value is a
+    ``(text, outputs)`` tuple, where ``outputs`` is what model.generate returned, so
+    the caller can decide whether (and how) to run a continuation pass.
+    """
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    result = {"outputs": None, "error": None}
+
+    def _run():
+        if timer is not None:
+            timer.start()
+        try:
+            with torch.no_grad():
+                result["outputs"] = model.generate(
+                    **model_inputs,
+                    streamer=streamer,
+                    **generation_kwargs
+                )
+        except Exception as e:
+            result["error"] = e
+            # Unblock the consumer loop below; generate() never reached its own end()
+            streamer.end()
+
+    if submit is not None:
+        job = submit(_run)
+        wait_for_worker = job.result
+    else:
+        worker = threading.Thread(target=_run, name="sigil-stream-generate", daemon=True)
+        worker.start()
+        wait_for_worker = worker.join
+
+    text = ""
+    for chunk in streamer:
+        if chunk:
+            text += chunk
+            yield chunk
+
+    wait_for_worker()
+    if result["error"] is not None:
+        raise result["error"]
+    return text, result["outputs"]
+
+
+def stream_response(
+    model: AutoModelForCausalLM,
+    tokenizer: AutoTokenizer,
+    device: str,
+    prompt: str,
+    temperature: float,
+    top_p: float,
+    max_new_tokens: int,
+    repetition_penalty: float = 1.0,
+    submit: Optional[Callable] = None,
+    continuation_max_tokens: Optional[int] = None,
+    cache_key: Optional[str] = None,
+    stop: Optional[List[str]] = None,
+    assistant_model: Optional[AutoModelForCausalLM] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    cancel: Optional[Any] = None,
+) -> Iterator[str]:
+    """Streaming counterpart of generate_response.
+
+    Yields decoded text chunks as soon as the model produces them. The automatic
+    continuation pass is chained exactly like in generate_response (resuming from
+    the first pass's KV cache), so the concatenation of all chunks equals the text
+    generate_response would return. ``submit`` is forwarded to _stream_pass to
+    choose where model.generate runs; ``cache_key`` enables the prefix cache and
+    ``stop`` ends decoding early and ``assistant_model`` enables speculative
+    decoding, both as in generate_response. ``stats`` is filled with the same token
+    counts and prefill/decode timings once the stream is exhausted. ``cancel`` ends
+    the stream as in generate_response.
+    """
+    inference_device = device  # Weights were placed here at load time
+    try:
+        _check_cancelled(cancel)
+        _debug("--- Debug: Streaming Inference Parameters ---")
+        _debug(f"   Prompt (first 100 chars): {prompt[:100]}...")
+        _debug(f"   Temperature: {temperature}")
+        _debug(f"   Top P: {top_p}")
+        _debug(f"   Repetition Penalty: {repetition_penalty}")
+        _debug(f"   Max New Tokens: {max_new_tokens}")
+        _debug(f"   Inference Device: {inference_device}")
+        _debug("------------------------------------")
+
+        inputs = _encode_prompt(tokenizer, prompt, cache_key, inference_device)
+        input_length = inputs["input_ids"].shape[1]
+        prefix_kwargs, prefix_tokens_reused = _take_prefix(cache_key, model, inputs["input_ids"])
+        if prefix_tokens_reused:
+            _debug(f"   ♻️ Prefix cache hit: reusing {prefix_tokens_reused}/{input_length} prompt tokens")
+        stop_matcher = StopStringMatcher(tokenizer, stop)
+        stop_kwargs, stop_criteria, timer = _stop_criteria(stop_matcher, inputs["input_ids"], cancel)
+        assisted_kwargs = {"assistant_model": assistant_model} if assistant_model is not None else {}
+        _, outputs = yield from _stream_pass(
+            model, tokenizer,
+            {"input_ids": inputs["input_ids"], "attention_mask": inputs.get("attention_mask"), **prefix_kwargs},
+            {**stop_kwargs, **assisted_kwargs, **_sampling_kwargs(tokenizer, temperature, top_p, max_new_tokens, repetition_penalty)},
+            submit,
+            timer,
+        )
+        prefill_time, decode_time = timer.split(time.perf_counter())
+        generated_tokens = outputs.sequences[0].shape[0] - input_length
+        _check_cancelled(cancel, generated_tokens)
+        continuation_generated_tokens = 0
+        _debug(f"   Tokens generated: {generated_tokens} (limit {max_new_tokens})")
+        if stop_criteria.stopped_at is not None:
+            _debug(f"   🛑 Stop string reached ({max_new_tokens - generated_tokens} tokens saved)")
+
+        if continuation_max_tokens is None:
+            continuation_max_tokens = settings.continuation_max_new_tokens
+        if generated_tokens >= max_new_tokens and continuation_max_tokens > 0 and stop_criteria.stopped_at is None:
+            _debug(f"   🔁 Chaining a streamed continuation pass... (generated {generated_tokens}/{max_new_tokens})")
+            continuation_inputs, prefill_tokens_saved = _continuation_inputs(tokenizer, outputs)
+            _debug(f"   Continuation reuses {prefill_tokens_saved} cached tokens")
+            continuation_input_length = continuation_inputs["input_ids"].shape[1]
+            continuation_stop_kwargs, _, continuation_timer = _stop_criteria(stop_matcher, continuation_inputs["input_ids"], cancel)
+            _, continuation_outputs = yield from _stream_pass(
+                model, tokenizer, continuation_inputs,
+                {**continuation_stop_kwargs, **assisted_kwargs,
+                 **_sampling_kwargs(tokenizer, temperature, top_p, continuation_max_tokens, repetition_penalty)},
+                submit,
+                continuation_timer,
+            )
+            decode_time += sum(continuation_timer.split(time.perf_counter()))
+            continuation_generated_tokens = continuation_outputs.sequences[0].shape[0] - continuation_input_length
+            _check_cancelled(cancel, generated_tokens + continuation_generated_tokens)
+            _debug(f"   Continuation generated: {continuation_generated_tokens} tokens")
+            outputs = continuation_outputs
+        _store_prefix(cache_key, model, outputs)
+
+        decoded_tokens = generated_tokens + continuation_generated_tokens
+        generation_stats = {
+            "prompt_tokens": input_length,
+            "prefix_tokens_reused": prefix_tokens_reused,
+            "completion_tokens": generated_tokens,
+            "continuation_tokens": continuation_generated_tokens,
+            "prefill_time": prefill_time,
+            "decode_time": decode_time,
+            "time_to_first_token": prefill_time,
+            "tokens_per_second": (decoded_tokens - 1) / decode_time if decoded_tokens > 1 and decode_time > 0 else None,
+            "speculative": assistant_model is not None,
+        }
+        if settings.structured_generation_logs:
+            usage_logger.info(json.dumps({"event": "generation", "streamed": True, "device": str(inference_device), **generation_stats}))
+        observe_generation("stream", input_length, decoded_tokens, generation_stats["tokens_per_second"])
+        if stats is not None:
+            stats.update(generation_stats)
+    except GenerationCancelledError:
+        raise
+    except Exception as e:
+        print(f"Error during streamed generation: {e}")
+        raise
+
+
+# --- NEW: Warm-up before a model starts serving ---
+def warm_up_model(
+    model: AutoModelForCausalLM,
+    tokenizer: AutoTokenizer,
+    device: str,
+    prompt_lengths: Optional[Sequence[int]] = None,
+    max_new_tokens: Optional[int] = None,
+) -> float:
+    """Runs short greedy generations at representative prompt lengths so the first real
+    request doesn't pay for kernel selection and allocator growth. Returns the seconds
+    it took. Defaults come from settings.warmup_prompt_lengths / warmup_max_new_tokens.
+    """
+    if prompt_lengths is None:
+        prompt_lengths = settings.warmup_prompt_lengths
+    if max_new_tokens is None:
+        max_new_tokens = settings.warmup_max_new_tokens
+    max_positions = getattr(model.config, "max_position_embeddings", None) or 2048
+    filler = tokenizer(" hello", add_special_tokens=False)["input_ids"] or [tokenizer.eos_token_id]
+
+    started = time.perf_counter()
+    with torch.no_grad():
+        for length in prompt_lengths:
+            length = max(1, min(int(length), max_positions - max_new_tokens))
+            input_ids = torch.tensor([(filler * (length // len(filler) + 1))[:length]], device=device)
+            model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=max_new_tokens,
+                do_sample=False,
+                pad_token_id=tokenizer.pad_token_id,
+            )
+    if str(device).startswith("cuda"):
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - started
+    _debug(f"   🔥 Warm-up ({len(prompt_lengths)} prompt length(s), {max_new_tokens} new tokens) took {elapsed:.2f}s")
+    return elapsed
+# --- END NEW ---
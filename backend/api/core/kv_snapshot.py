@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+from typing import Any, List, Optional, Tuple
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
+from transformers import DynamicCache
+
+from .history_manager import get_kv_snapshot_filepath
+
+SNAPSHOT_FORMAT = "sigil-kv-1"
+
+
+def model_identity(model: Any) -> str:
+    """Stable identifier of a loaded model, used to refuse snapshots taken with another one."""
+    identity = f"{getattr(model, 'name_or_path', '')}|{getattr(model, 'dtype', '')}"
+    quantization = getattr(model, "sigil_quantization", None)  # int8 models keep an fp32 dtype
+    return f"{identity}|{quantization}" if quantization else identity
+
+
+def _snapshot_device(model: Any) -> Optional[torch.device]:
+    """Device restored caches go to, or None when layers are spread over several devices."""
+    device_map = getattr(model, "hf_device_map", None)
+    if device_map and len(set(device_map.values())) > 1:
+        return None
+    return model.device
+
+
+def save_snapshot(thread_id: str, identity: str, token_ids: List[int], cache: DynamicCache) -> bool:
+    """Writes a thread's KV cache next to its chat file as ``<thread_id>.kv.safetensors``.
+
+    ``identity`` is the model_identity() of the model that produced the cache. The file
+    is written to a temporary name and renamed into place so readers never see a
+    partial snapshot. Returns False if the cache could not be written.
+    """
+    try:
+        filepath = get_kv_snapshot_filepath(thread_id)
+    except ValueError as e:
+        logging.error(f"Not writing KV snapshot (invalid thread_id): {e}")
+        return False
+
+    tensors = {"token_ids": torch.tensor(token_ids, dtype=torch.int64)}
+    for layer, (keys, values) in enumerate(zip(cache.key_cache, cache.value_cache)):
+        tensors[f"key.{layer}"] = keys.detach().to("cpu").contiguous()
+        tensors[f"value.{layer}"] = values.detach().to("cpu").contiguous()
+    metadata = {
+        "format": SNAPSHOT_FORMAT,
+        "model": identity,
+        "layers": json.dumps(len(cache.key_cache)),
+    }
+
+    tmp_path = f"{filepath}.tmp"
+    try:
+        save_file(tensors, tmp_path, metadata=metadata)
+        os.replace(tmp_path, filepath)
+        return True
+    except (OSError, RuntimeError) as e:
+        logging.error(f"Error writing KV snapshot for {thread_id}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def load_snapshot(thread_id: str, model: Any) -> Optional[Tuple[List[int], DynamicCache]]:
+    """Memory-maps a thread's KV snapshot back into a DynamicCache for ``model``.
+
+    Returns ``(token_ids, cache)``, or None if there is no usable snapshot (missing,
+    unreadable, or produced by a different model/precision).
+    """
+    try:
+        filepath = get_kv_snapshot_filepath(thread_id)
+    except ValueError:
+        return None
+    if not os.path.exists(filepath):
+        return None
+    device = _snapshot_device(model)
+    if device is None:
+        return None
+
+    try:
+        with safe_open(filepath, framework="pt", device="cpu") as snapshot:
+            metadata = snapshot.metadata() or {}
+            if metadata.get("format") != SNAPSHOT_FORMAT or metadata.get("model") != model_identity(model):
+                logging.info(f"Ignoring KV snapshot for {thread_id}: taken with a different model")
+                return None
+            token_ids = snapshot.get_tensor("token_ids").tolist()
+            cache = DynamicCache()
+            for layer in range(json.loads(metadata["layers"])):
+                cache.key_cache.append(snapshot.get_tensor(f"key.{layer}").to(device))
+                cache.value_cache.append(snapshot.get_tensor(f"value.{layer}").to(device))
+            cache._seen_tokens = len(token_ids)
+    except Exception as e:
+        logging.error(f"Error reading KV snapshot for {thread_id}: {e}")
+        return None
+
+    if cache.get_seq_length() != len(token_ids):
+        logging.warning(f"Ignoring inconsistent KV snapshot for {thread_id}")
+        return None
+    return token_ids, cache
+
@@ -0,0 +1,252 @@
+import collections
+import itertools
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import transformers.modeling_utils as modeling_utils
+
+# Job states
+QUEUED = "queued"
+LOADING = "loading"
+LOADED = "loaded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (LOADED, FAILED, CANCELLED)
+
+
+class LoadCancelledError(RuntimeError):
+    """Raised inside from_pretrained when the running load job is cancelled."""
+
+
+class LoadJob:
+    """One model load with its shard/byte progress.
+
+    Progress is fed by the transformers hooks below: a shard starts and finishes
+    around ``_load_state_dict_into_meta_model`` and every materialised tensor adds
+    its bytes, so ``bytes_loaded`` moves within a shard as well.
+    """
+
+    def __init__(self, job_id: str, model_name: str, path: str, shards: List[Tuple[str, int]]):
+        self.id = job_id
+        self.model_name = model_name
+        self.path = path
+        self.state = QUEUED
+        self.error: Optional[str] = None
+        self.device: Optional[str] = None
+        self.load_time: Optional[float] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self._shard_sizes = dict(shards)
+        self.shards_total = len(shards)
+        self.shards_loaded = 0
+        self.current_shard: Optional[str] = None
+        self.bytes_total = sum(self._shard_sizes.values())
+        self._bytes_done = 0  # Bytes of finished shards
+        self._shard_bytes = 0  # Tensor bytes loaded from the current shard
+
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+        self._exception: Optional[BaseException] = None  # What load_fn/publish_fn raised, for wait()
+        self._lock = threading.Lock()
+
+    @property
+    def bytes_loaded(self) -> int:
+        current_size = self._shard_sizes.get(self.current_shard or "", 0)
+        return self._bytes_done + min(self._shard_bytes, current_size)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            bytes_loaded = self.bytes_total if self.state == LOADED else self.bytes_loaded
+            return {
+                "job_id": self.id,
+                "model_name": self.model_name,
+                "state": self.state,
+                "error": self.error,
+                "device": self.device,
+                "load_time": self.load_time,
+                "shards_total": self.shards_total,
+                "shards_loaded": self.shards_total if self.state == LOADED else self.shards_loaded,
+                "current_shard": self.current_shard,
+                "bytes_total": self.bytes_total,
+                "bytes_loaded": bytes_loaded,
+                "progress": (bytes_loaded / self.bytes_total) if self.bytes_total else (1.0 if self.state == LOADED else 0.0),
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+    # --- Called from the loading thread through the transformers hooks ---
+    def _shard_started(self, shard_file: str) -> None:
+        with self._lock:
+            self.current_shard = os.path.basename(shard_file)
+            self._shard_bytes = 0
+
+    def _shard_finished(self, shard_file: str) -> None:
+        with self._lock:
+            self._bytes_done += self._shard_sizes.get(os.path.basename(shard_file), self._shard_bytes)
+            self._shard_bytes = 0
+            self.shards_loaded += 1
+            self.current_shard = None
+
+    def _tensor_loaded(self, nbytes: int) -> None:
+        if self._cancel.is_set():
+            raise LoadCancelledError(f"Load job {self.id} was cancelled.")
+        with self._lock:
+            self._shard_bytes += nbytes
+
+
+# --- Progress hooks (installed once, active only on threads running a job) ---
+_job_context = threading.local()
+_hooks_lock = threading.Lock()
+_hooks_installed = False
+
+
+def _install_progress_hooks() -> None:
+    global _hooks_installed
+    with _hooks_lock:
+        if _hooks_installed:
+            return
+        load_shard = modeling_utils._load_state_dict_into_meta_model
+        load_parameter = modeling_utils._load_parameter_into_model
+
+        def tracked_load_shard(model, state_dict, shard_file, *args, **kwargs):
+            job = getattr(_job_context, "job", None)
+            if job is not None:
+                job._shard_started(shard_file)
+            result = load_shard(model, state_dict, shard_file, *args, **kwargs)
+            if job is not None:
+                job._shard_finished(shard_file)
+            return result
+
+        def tracked_load_parameter(model, param_name, tensor, *args, **kwargs):
+            job = getattr(_job_context, "job", None)
+            if job is not None:
+                job._tensor_loaded(tensor.numel() * tensor.element_size())
+            return load_parameter(model, param_name, tensor, *args, **kwargs)
+
+        modeling_utils._load_state_dict_into_meta_model = tracked_load_shard
+        modeling_utils._load_parameter_into_model = tracked_load_parameter
+        _hooks_installed = True
+
+
+class LoadJobManager:
+    """Runs model loads one at a time on a background thread.
+
+    ``submit`` returns immediately with a job whose ``to_dict`` is cheap to poll.
+    ``load_fn(path)`` performs the load (returning ``(tokenizer, model, device)``)
+    and ``publish_fn(job, tokenizer, model, device)`` makes the result the active
+    model. Queued jobs can be cancelled outright; a running job is cancelled at the
+    next tensor it loads. Only the most recent ``max_history`` finished jobs are kept.
+
+    Every model load goes through here (the synchronous endpoints submit and then
+    wait()), so loads never interleave their updates of the active model state.
+    """
+
+    def __init__(self, max_history: int = 20):
+        self.max_history = max_history
+        self._jobs: "collections.OrderedDict[str, LoadJob]" = collections.OrderedDict()
+        self._queue: "queue.Queue[Tuple[LoadJob, Callable, Callable]]" = queue.Queue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(
+        self,
+        model_name: str,
+        path: str,
+        shards: List[Tuple[str, int]],
+        load_fn: Callable[[str], Tuple[Any, Any, str]],
+        publish_fn: Callable[[LoadJob, Any, Any, str], None],
+    ) -> LoadJob:
+        _install_progress_hooks()
+        with self._lock:
+            job = LoadJob(f"load-{next(self._ids)}-{int(time.time())}", model_name, path, shards)
+            self._jobs[job.id] = job
+            self._prune()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="sigil-model-loader", daemon=True)
+                self._thread.start()
+        self._queue.put((job, load_fn, publish_fn))
+        return job
+
+    def get(self, job_id: str) -> Optional[LoadJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def cancel(self, job_id: str) -> Optional[LoadJob]:
+        """Requests cancellation. Returns the job (None if unknown); finished jobs are left as they are."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with job._lock:
+            if job.state in FINISHED_STATES:
+                return job
+            job._cancel.set()
+            if job.state == QUEUED:
+                job.state = CANCELLED
+                job.finished_at = time.time()
+                job._done.set()
+        return job
+
+    def wait(self, job: LoadJob, timeout: Optional[float] = None) -> LoadJob:
+        """Blocks until ``job`` finishes and re-raises what its load or publish raised."""
+        if not job._done.wait(timeout):
+            raise TimeoutError(f"Load job {job.id} did not finish within {timeout}s.")
+        if job._exception is not None:
+            raise job._exception
+        if job.state == CANCELLED:
+            raise LoadCancelledError(f"Load job {job.id} was cancelled.")
+        return job
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.state in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def _worker(self) -> None:
+        while True:
+            job, load_fn, publish_fn = self._queue.get()
+            with job._lock:
+                if job.state != QUEUED:
+                    job._done.set()
+                    continue  # Cancelled while queued
+                job.state = LOADING
+                job.started_at = time.time()
+            print(f"⏳ Load job {job.id}: loading '{job.model_name}'...")
+            _job_context.job = job
+            try:
+                tokenizer, model, device = load_fn(job.path)
+                publish_fn(job, tokenizer, model, device)
+                state, error = LOADED, None
+                job.device = device
+                print(f"   ✅ Load job {job.id} finished on '{device}'.")
+            except Exception as e:
+                if job._cancel.is_set():
+                    state, error = CANCELLED, None
+                    print(f"   ⚠️ Load job {job.id} cancelled.")
+                else:
+                    state, error = FAILED, str(e)
+                    job._exception = e
+                    print(f"❌ Load job {job.id} failed: {e}", file=sys.stderr)
+            finally:
+                _job_context.job = None
+            with job._lock:
+                job.state = state
+                job.error = error
+                job.finished_at = time.time()
+            job._done.set()
+
+
+# Singleton used by the model load endpoints
+load_jobs = LoadJobManager()
@@ -0,0 +1,191 @@
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Default latency buckets (seconds): sub-ms control-plane calls up to multi-minute generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500, 1000)
+
+# Path prefix -> router label used by the HTTP metrics
+ROUTER_PREFIXES = (
+    ("/api/v1/chat", "chat"),
+    ("/api/v1/settings", "settings"),
+    ("/api/v1/models", "models"),
+    ("/api/v1/model/", "models"),  # Load endpoints defined directly in main.py
+    ("/api/v1/system", "system"),
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in sorted(self._series.items())]
+        for labelvalues, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render_gauge(name: str, documentation: str, samples: Iterable[Tuple[Dict[str, str], float]], metric_type: str = "gauge") -> List[str]:
+    """Renders a gauge (or a counter kept elsewhere) read at scrape time from ``(labels, value)`` samples."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        if value is None:
+            continue
+        lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+    return lines
+
+
+# --- Process-wide metrics (updated outside the generation loop) ---
+http_requests_total = Counter(
+    "sigil_http_requests_total", "HTTP requests handled, by router, method and status code.",
+    ("router", "method", "status"),
+)
+http_request_duration_seconds = Histogram(
+    "sigil_http_request_duration_seconds", "Time from request start to the last response byte, by router.",
+    ("router",),
+)
+generation_tokens_per_second = Histogram(
+    "sigil_generation_tokens_per_second", "Decode speed of completed generations.",
+    ("mode",), buckets=TOKENS_PER_SECOND_BUCKETS,
+)
+generation_prompt_tokens_total = Counter("sigil_generation_prompt_tokens_total", "Prompt tokens processed.", ("mode",))
+generation_completion_tokens_total = Counter(
+    "sigil_generation_completion_tokens_total", "Tokens generated (including continuation passes).", ("mode",),
+)
+
+_REGISTRY = (
+    http_requests_total,
+    http_request_duration_seconds,
+    generation_tokens_per_second,
+    generation_prompt_tokens_total,
+    generation_completion_tokens_total,
+)
+
+
+def observe_generation(mode: str, prompt_tokens: int, completion_tokens: int, tokens_per_second: Optional[float]) -> None:
+    """Records one finished generation ("single", "stream" or "batched")."""
+    generation_prompt_tokens_total.inc(prompt_tokens, mode)
+    generation_completion_tokens_total.inc(completion_tokens, mode)
+    if tokens_per_second is not None:
+        generation_tokens_per_second.observe(tokens_per_second, mode)
+
+
+def router_label(path: str) -> str:
+    for prefix, label in ROUTER_PREFIXES:
+        if path.startswith(prefix):
+            return label
+    return "other"
+
+
+def render_registry() -> List[str]:
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return lines
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests and timing them until the last body chunk.
+
+    Written as plain ASGI (rather than BaseHTTPMiddleware) so streamed responses are
+    timed to completion and nothing is buffered.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        router = router_label(scope.get("path", ""))
+        status_code = [500]
+        recorded = [False]
+
+        def record():
+            if not recorded[0]:
+                recorded[0] = True
+                http_requests_total.inc(1, router, scope.get("method", ""), str(status_code[0]))
+                http_request_duration_seconds.observe(time.perf_counter() - start, router)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
@@ -1,67 +1,160 @@
 import os
 import sys
+import threading
+import time
+from typing import Optional
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
 import json
 from .config import settings
+from .prefix_cache import prefix_cache
+from .prompt_builder import _tokenizer_key
+from .model_registry import ModelBudgetError, ModelRegistry, ResidentModel
+from .inference import warm_up_model
+from .quantization import load_int8_model
+from . import weight_cache
 
 # --- Module-level cache for the currently loaded model ---
 _current_model_state = {
+    "path": None,  # Registry key of the active model
     "tokenizer": None,
     "model": None,
     "device": None,
+    "load_time": None,  # Seconds spent loading + placing weights on the inference device
 }
 
-# --- Helper to unload the current model ---
+# --- Helper to release the current model ---
 def _unload_current_model_if_exists():
-    """Checks the cache and unloads the model if one is present."""
+    """Releases the active model so the registry may evict it.
+
+    With the default ``max_resident_models=1`` the next load evicts it straight away
+    (the old single-model behaviour); with a larger budget it stays resident and
+    switching back to it is a registry hit instead of a reload.
+    """
     global _current_model_state
-    model_unloaded = False
-    tokenizer_unloaded = False
-
-    if _current_model_state["model"] is not None:
-        print(f"⏳ Unloading existing model from device '{_current_model_state['device']}'...")
-        del _current_model_state["model"]
-        _current_model_state["model"] = None
-        model_unloaded = True
-        print("   ✅ Model object deleted.")
-
-    if _current_model_state["tokenizer"] is not None:
-        del _current_model_state["tokenizer"]
-        _current_model_state["tokenizer"] = None
-        tokenizer_unloaded = True
-        print("   ✅ Tokenizer object deleted.")
-
-    if _current_model_state["device"] == 'cuda':
+    if _current_model_state["path"] is not None:
+        print(f"⏳ Releasing active model '{_current_model_state['path']}' from device '{_current_model_state['device']}'...")
+        model_registry.unpin(_current_model_state["path"])
+
+    _current_model_state.update({"path": None, "tokenizer": None, "model": None, "device": None, "load_time": None})
+
+def _unload_resident(entry: ResidentModel):
+    """Frees an evicted model (registry unload callback)."""
+    print(f"⏳ Unloading model '{entry.key}' from device '{entry.device}'...")
+    # Cached attention state belongs to the evicted model
+    prefix_cache.forget_model(entry.model)
+    entry.model = None
+    entry.tokenizer = None
+    print("   ✅ Model object deleted.")
+
+    if entry.device == 'cuda':
         try:
             torch.cuda.empty_cache()
             print("   ✅ torch.cuda.empty_cache() called.")
         except Exception as e:
             print(f"   ⚠️ Error calling torch.cuda.empty_cache(): {e}", file=sys.stderr)
-    
-    if model_unloaded or tokenizer_unloaded:
-        print("   Unload process complete.")
-    
-    _current_model_state["device"] = None
+    print("   Unload process complete.")
 
 
+# --- Module-level cache for the speculative-decoding draft model ---
+_draft_model_state = {
+    "name": None,
+    "device": None,
+    "model": None,
+    "vocab": None,
+    "compatible": {},  # tokenizer key of a main model -> whether it shares the draft's vocabulary
+}
+_draft_model_lock = threading.Lock()
+
 # --- Model Registry (REMOVED) ---
 # MODEL_REGISTRY = {
 #     # Paths should be relative to the project root (the directory containing 'backend' and 'frontend')
 #     "tinyllama": "backend/models/tinyllama",
 # }
 
-# --- Model Loading Helper ---
-def load_model_internal(path: str):
-    """Loads the tokenizer and model from the specified path, resolving relative paths from the project root."""
-    global _current_model_state
+def _resolve_inference_device() -> str:
+    """Decides, once per load, which device runs generation: 'cuda', 'mps' or 'cpu'.
 
-    # Unload any existing model before loading a new one
-    _unload_current_model_if_exists()
+    Weights are loaded straight onto this device so the per-request path never has
+    to move them.
+    """
+    requested = settings.inference_device
+    if requested in ("auto", "cuda") and torch.cuda.is_available():
+        return "cuda"
+    if requested == "mps" and torch.backends.mps.is_available():
+        return "mps"
+    if requested not in ("auto", "cpu"):
+        print(f"   ⚠️ Requested inference device '{requested}' is not available. Falling back to CPU.")
+    return "cpu"
 
+def _choose_device_map(device: str):
+    """Determines the device_map strategy for loading onto ``device``."""
+    if device == "cuda":
+        print("   Detected CUDA. Loading model with device_map='auto' (CUDA)...")
+        return "auto"  # Let accelerate place layers on CUDA devices
+    if device == "mps":
+        print("   Loading model with device_map={'': 'mps'} (MPS, opted in via SIGIL_INFERENCE_DEVICE)...")
+        return {"": "mps"}
+    # CPU by default to avoid known issues with MPS on some macOS setups
+    print("   CUDA not available. Loading model with device_map='cpu' (force CPU)...")
+    return "cpu"
+
+def _precision_dtype() -> torch.dtype:
+    """Maps the model_precision setting to a torch dtype."""
+    precision_setting = settings.model_precision
+    if precision_setting == "fp16":
+        print(f"   Applying precision: {precision_setting} (torch.float16)")
+        return torch.float16
+    if precision_setting == "bf16":
+        print(f"   Applying precision: {precision_setting} (torch.bfloat16)")
+        return torch.bfloat16
+    if precision_setting == "int8":
+        # Non-Linear layers (embeddings, norms) stay fp32 around the int8 matmuls
+        print(f"   Applying precision: {precision_setting} (int8 Linear weights, torch.float32 elsewhere)")
+        return torch.float32
+    # Default to fp32
+    print(f"   Applying precision: fp32 (torch.float32)")
+    return torch.float32
+
+def _resolve_model_path(path: str) -> str:
+    """Resolves ``path`` against the project root (absolute paths are kept)."""
     # Calculate project root relative to this file's location (backend/api/core)
     project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
-    absolute_path = os.path.join(project_root, path)
+    return os.path.join(project_root, path)
+
+def model_key_for_name(model_name: str) -> str:
+    """Registry key of the model directory ``backend/models/<model_name>``."""
+    return os.path.normpath(os.path.join("backend", "models", model_name))
+
+def checkpoint_files(path: str):
+    """``[(filename, bytes)]`` of the weight files from_pretrained will read under ``path``.
+
+    Safetensors shards win over .bin ones when both are present, as in transformers.
+    """
+    absolute_path = _resolve_model_path(path)
+    # A fresh converted-weights cache is what from_pretrained will actually read
+    if settings.converted_weights_cache and os.path.isdir(absolute_path):
+        absolute_path = weight_cache.cached_checkpoint(absolute_path, settings.model_precision) or absolute_path
+    try:
+        names = sorted(os.listdir(absolute_path))
+    except OSError:
+        return []
+    weights = [name for name in names if name.endswith(".safetensors")]
+    if not weights:
+        weights = [name for name in names if name.endswith((".bin", ".pt", ".pth"))]
+    return [(name, os.path.getsize(os.path.join(absolute_path, name))) for name in weights]
+
+def _estimate_checkpoint_bytes(path: str) -> int:
+    """Size of the weight files under ``path``, used to make room before loading."""
+    return sum(size for _, size in checkpoint_files(path))
+
+# --- Model Loading Helper ---
+def _load_from_path(path: str):
+    """Loads the tokenizer and model from ``path`` (registry load callback).
+
+    Returns ``(tokenizer, model, device, load_time)``.
+    """
+    absolute_path = _resolve_model_path(path)
 
     # Check if the resolved absolute path is a directory
     if not os.path.isdir(absolute_path):
@@ -113,67 +206,162 @@ def load_model_internal(path: str):
         tokenizer.custom_prompt_config = custom_prompt_config
         # -------------------------------------------------------------
 
-        # Determine the desired device mapping strategy
-        if torch.cuda.is_available():
-            chosen_device_map = "auto"  # Let accelerate place layers on CUDA devices
-            print("   Detected CUDA. Loading model with device_map='auto' (CUDA)...")
-        else:
-            # Force CPU placement to avoid known issues with MPS on some macOS setups
-            chosen_device_map = "cpu"
-            print("   CUDA not available. Loading model with device_map='cpu' (force CPU)...")
-
-        # ---> ADDED: Get precision setting <---
-        precision_setting = settings.model_precision
-        if precision_setting == "fp16":
-            torch_dtype = torch.float16
-            print(f"   Applying precision: {precision_setting} (torch.float16)")
-        else: # Default to fp32
-            torch_dtype = torch.float32
-            print(f"   Applying precision: fp32 (torch.float32)")
-        # ---> END ADDED <---
+        inference_device = _resolve_inference_device()
+        if settings.model_precision == "int8" and inference_device != "cpu":
+            # Dynamic int8 kernels only exist for CPU
+            print(f"   ⚠️ int8 precision runs on CPU only; ignoring inference device '{inference_device}'.")
+            inference_device = "cpu"
+        chosen_device_map = _choose_device_map(inference_device)
+        torch_dtype = _precision_dtype()
 
         # Load model with the chosen device_map and precision
-        model = AutoModelForCausalLM.from_pretrained(
-            absolute_path,
-            local_files_only=True,
-            trust_remote_code=False,
-            device_map=chosen_device_map,
-            torch_dtype=torch_dtype # <-- Pass the determined dtype
-        )
+        precision = settings.model_precision
+        load_start = time.perf_counter()
+        if precision == "int8":
+            model, warm = load_int8_model(absolute_path)
+        else:
+            # Repeat loads read safetensors already in the target dtype from .sigil_cache
+            cached_path = weight_cache.cached_checkpoint(absolute_path, precision) if settings.converted_weights_cache else None
+            warm = cached_path is not None
+            if warm:
+                print(f"   ♻️ Loading converted {precision} weights from '{cached_path}'.")
+            model = AutoModelForCausalLM.from_pretrained(
+                cached_path or absolute_path,
+                local_files_only=True,
+                trust_remote_code=False,
+                device_map=chosen_device_map,
+                torch_dtype=torch_dtype # <-- Pass the determined dtype
+            )
+            if warm:
+                # Keep the source directory as the model's identity (KV snapshots, logs),
+                # not the .sigil_cache copy it was read from
+                model.name_or_path = absolute_path
+                model.config._name_or_path = absolute_path
         model.eval()
+        load_time = time.perf_counter() - load_start
+        weight_cache.record_load_time(absolute_path, precision, load_time, warm)
+        if (precision != "int8" and not warm and settings.converted_weights_cache
+                and weight_cache.needs_conversion(absolute_path, torch_dtype)):
+            weight_cache.save_converted_in_background(absolute_path, precision, model)
         
         # Determine the primary device after accelerate placement
         # If any part is on CUDA, consider 'cuda' the primary device for reporting.
         # model.device might point to the device of the *first* parameter, 
         # or accelerate might provide a better way. Let's check model.hf_device_map
-        device = 'cpu' # Default to CPU
+        device = 'mps' if inference_device == 'mps' else 'cpu' # Default to CPU
         if hasattr(model, 'hf_device_map') and model.hf_device_map:
             devices_used = set(model.hf_device_map.values())
             # Check if any device is a CUDA device (either string starting with 'cuda' or an integer index)
             if any( (isinstance(d, str) and d.startswith('cuda')) or isinstance(d, int) for d in devices_used ):
                 device = 'cuda' # Report cuda if any layer is on GPU
         
-        print(f"   ✅ Model loaded from '{absolute_path}'. Effective device: '{device.upper()}'. Distribution: {getattr(model, 'hf_device_map', 'N/A')}")
-
-        # Update the cache with the newly loaded model
-        _current_model_state["tokenizer"] = tokenizer
-        _current_model_state["model"] = model
-        _current_model_state["device"] = device
-        print(f"   ℹ️ Model and tokenizer cached. Current state: device='{device}'")
+        print(f"   ✅ Model loaded from '{absolute_path}' in {load_time:.2f}s ({'warm, from cache' if warm else 'cold'}). Effective device: '{device.upper()}'. Distribution: {getattr(model, 'hf_device_map', 'N/A')}")
 
-        # The explicit model.to(device) calls are no longer needed as accelerate handles placement.
+        # The explicit model.to(device) calls are no longer needed as accelerate handles placement,
+        # including MPS, so generation never migrates weights per request.
 
-        return tokenizer, model, device
+        return tokenizer, model, device, load_time
 
     except Exception as e:
         print(f"❌ Error loading model from '{absolute_path}' with accelerate: {e}", file=sys.stderr)
         # Re-raise a more specific exception or handle as needed
         raise RuntimeError(f"Failed to load model from '{absolute_path}' with accelerate: {e}") from e
 
+# --- NEW: Multi-model residency ---
+model_registry = ModelRegistry(_load_from_path, _unload_resident, _estimate_checkpoint_bytes)
+
+# Held while the active model is published (app.state) or read together with a lease,
+# so a request never pairs the old model with the new tokenizer during a hot swap.
+model_swap_lock = threading.Lock()
+
+# Previous active model kept pinned during a hot swap until finish_model_swap()
+_swap_state = {"previous": None}
+
+def load_model_internal(path: str):
+    """Makes the model at ``path`` the active one, loading it unless it is already resident.
+
+    Relative paths are resolved from the project root. With ``settings.model_hot_swap``
+    the current model keeps serving while the replacement loads and warms up; the
+    caller publishes the new model and then calls finish_model_swap() to release the
+    old one, which is freed once its in-flight generations drain.
+    """
+    global _current_model_state
+
+    key = os.path.normpath(path)
+    previous = _current_model_state["path"]
+    hot_swap = settings.model_hot_swap and previous is not None and previous != key
+    # Release the previous active model; the registry evicts it if there is no room for both
+    if previous != key and not hot_swap:
+        _unload_current_model_if_exists()
+    if hot_swap:
+        print(f"🔁 Hot swap: loading '{key}' alongside active model '{previous}'...")
+
+    resident = model_registry.peek(key)
+    resident = resident is not None and resident.variant == settings.model_precision
+    entry = model_registry.get(key, pin=True, variant=settings.model_precision, replacing=previous if hot_swap else None)
+    if resident:
+        print(f"   ♻️ Model '{key}' already resident on '{entry.device}'; activated without reloading.")
+    elif hot_swap:
+        try:
+            warm_up_model(entry.model, entry.tokenizer, entry.device)
+        except Exception as e:
+            print(f"   ⚠️ Warm-up of '{key}' failed ({e}); swapping in anyway.", file=sys.stderr)
+
+    # Update the cache with the active model
+    with model_swap_lock:
+        _current_model_state.update({
+            "path": key,
+            "tokenizer": entry.tokenizer,
+            "model": entry.model,
+            "device": entry.device,
+            "load_time": entry.load_time,
+        })
+    if hot_swap:
+        _swap_state["previous"] = previous
+    print(f"   ℹ️ Model and tokenizer cached. Current state: device='{entry.device}'")
+    return entry.tokenizer, entry.model, entry.device
+
+def finish_model_swap():
+    """Releases the model replaced by a hot swap once the new one has been published.
+
+    The old model is unpinned and evicted if the budget has no room for it; while
+    requests still hold leases on it, its weights are only freed after they finish.
+    """
+    previous = _swap_state["previous"]
+    _swap_state["previous"] = None
+    if previous is None or previous == _current_model_state["path"]:
+        return
+    print(f"🔁 Hot swap complete; releasing '{previous}'.")
+    model_registry.unpin(previous)
+    model_registry.settle()
+
+def lease_model_for_request(model_name: str) -> ResidentModel:
+    """Returns the leased registry entry for a chat request naming ``backend/models/<model_name>``.
+
+    The model is loaded into the registry on a miss without changing the active
+    model; the caller must ``model_registry.release`` the entry. Raises ValueError if
+    the directory does not exist, ModelBudgetError if it cannot be made resident and
+    RuntimeError if loading fails.
+    """
+    return model_registry.get(model_key_for_name(model_name), variant=settings.model_precision, lease=True)
+
+def is_active_model(model_name: str) -> bool:
+    return _current_model_state["path"] == model_key_for_name(model_name)
+# --- END NEW ---
+
+def get_model_load_time():
+    """Seconds the current model took to load onto its inference device (None if none is loaded)."""
+    return _current_model_state["load_time"]
+
+def get_active_model_entry() -> Optional[ResidentModel]:
+    """The registry entry of the active model (its precision variant and device), or None if none is loaded."""
+    key = _current_model_state["path"]
+    return model_registry.peek(key) if key is not None else None
+
 def load_model_by_name(model_name: str):
     """Loads a model by its name, assuming it's a directory inside backend/models."""
     # Construct the expected relative path from the project root
-    relative_path = os.path.join("backend", "models", model_name)
+    relative_path = model_key_for_name(model_name)
     
     # No registry lookup needed
     # path = MODEL_REGISTRY.get(model_name)
@@ -189,4 +377,60 @@ def load_model_by_name(model_name: str):
         raise ValueError(f"Model directory not found or invalid for '{model_name}' at expected path '{relative_path}'. {ve}") from ve
     except RuntimeError as re:
         # Re-raise runtime errors from loading
-        raise RuntimeError(f"Failed to load model '{model_name}' from path '{relative_path}'. {re}") from re 
\ No newline at end of file
+        raise RuntimeError(f"Failed to load model '{model_name}' from path '{relative_path}'. {re}") from re 
+
+# --- NEW: Draft model for speculative decoding ---
+def get_draft_model(model_name: str, tokenizer: AutoTokenizer, device: str) -> AutoModelForCausalLM:
+    """Returns the draft model ``backend/models/<model_name>`` on ``device``, loading it on first use.
+
+    The draft proposes tokens that the main model verifies (assisted generation), so
+    it must run on the main model's device and share its tokenizer vocabulary; a
+    ValueError is raised otherwise or if the directory does not exist. The vocabulary
+    check runs once per main tokenizer. Only one draft is kept loaded.
+    """
+    global _draft_model_state
+
+    with _draft_model_lock:
+        if (_draft_model_state["name"], _draft_model_state["device"]) != (model_name, device):
+            project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+            absolute_path = os.path.join(project_root, "backend", "models", model_name)
+            if not os.path.isdir(absolute_path):
+                raise ValueError(f"Draft model directory not found for '{model_name}' (resolved to '{absolute_path}')")
+
+            _draft_model_state.update({"name": None, "device": None, "model": None, "vocab": None, "compatible": {}})
+            print(f"⏳ Loading draft model from '{absolute_path}' onto '{device}'...")
+            try:
+                draft_tokenizer = AutoTokenizer.from_pretrained(absolute_path, local_files_only=True, trust_remote_code=False)
+                draft_model = AutoModelForCausalLM.from_pretrained(
+                    absolute_path,
+                    local_files_only=True,
+                    trust_remote_code=False,
+                    device_map=_choose_device_map(device),
+                    torch_dtype=_precision_dtype()
+                )
+            except Exception as e:
+                raise RuntimeError(f"Failed to load draft model '{model_name}': {e}") from e
+            draft_model.eval()
+            _draft_model_state.update({
+                "name": model_name, "device": device, "model": draft_model, "vocab": draft_tokenizer.get_vocab(), "compatible": {},
+            })
+            print(f"   ✅ Draft model '{model_name}' loaded.")
+
+        key = _tokenizer_key(tokenizer)
+        compatible = _draft_model_state["compatible"].get(key)
+        if compatible is None:
+            compatible = _draft_model_state["compatible"][key] = _draft_model_state["vocab"] == tokenizer.get_vocab()
+        if not compatible:
+            raise ValueError(f"Draft model '{model_name}' does not share the loaded model's tokenizer vocabulary.")
+        return _draft_model_state["model"]
+
+def unload_draft_model():
+    """Frees the cached draft model, if any."""
+    global _draft_model_state
+    with _draft_model_lock:
+        if _draft_model_state["model"] is not None:
+            print(f"⏳ Unloading draft model '{_draft_model_state['name']}'...")
+        _draft_model_state.update({"name": None, "device": None, "model": None, "vocab": None, "compatible": {}})
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+# --- END NEW ---
@@ -0,0 +1,299 @@
+import collections
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .config import settings
+
+
+class ModelBudgetError(RuntimeError):
+    """Raised when a model cannot be made resident without evicting a pinned model."""
+
+
+class ResidentModel:
+    def __init__(self, key: str, variant: Optional[str], tokenizer: Any, model: Any, device: str, load_time: float, nbytes: int):
+        self.key = key
+        self.variant = variant  # e.g. the precision the weights were loaded in
+        self.tokenizer = tokenizer
+        self.model = model
+        self.device = device
+        self.load_time = load_time
+        self.nbytes = nbytes
+        self.pinned = False
+        self.leases = 0  # Generations currently running on this model
+        self.retired = False  # Evicted while leased; unloaded when the last lease is released
+        self.last_used = time.time()
+
+
+class ModelRegistry:
+    """Keeps several loaded models resident and evicts the least-recently-used one.
+
+    Models are keyed by the path they were loaded from. ``get`` returns a resident
+    model (a hit) or loads it (a miss), first evicting unpinned models until both the
+    ``max_models`` count and the ``max_bytes`` budget leave room for it. The size of a
+    model that is not loaded yet comes from ``estimate_fn`` (checkpoint size on disk)
+    and is corrected with the real footprint once it has loaded.
+
+    The active model (the one in ``app.state``) is pinned so serving requests for
+    other models never evicts it. Loads of different models run concurrently;
+    concurrent requests for the same model wait for a single load.
+
+    Generations hold a lease on the model they run on. Evicting a leased model only
+    retires it: it leaves the registry at once, but its weights are unloaded when
+    the last lease is released, so in-flight requests always finish.
+    """
+
+    def __init__(
+        self,
+        load_fn: Callable[[str], Tuple[Any, Any, str, float]],
+        unload_fn: Callable[[ResidentModel], None],
+        estimate_fn: Optional[Callable[[str], int]] = None,
+        max_models: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self._load_fn = load_fn
+        self._unload_fn = unload_fn
+        self._estimate_fn = estimate_fn
+        self._max_models = max_models
+        self._max_bytes = max_bytes
+        self._models: "collections.OrderedDict[str, ResidentModel]" = collections.OrderedDict()
+        self._retired: List[ResidentModel] = []
+        self._loading: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_failures = 0
+        self.evictions = 0
+
+    # Limits are read from settings on every call unless fixed at construction
+    @property
+    def max_models(self) -> int:
+        return max(1, self._max_models if self._max_models is not None else settings.max_resident_models)
+
+    @property
+    def max_bytes(self) -> int:
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return settings.model_memory_budget_mb * 1024 * 1024
+
+    def get(
+        self,
+        key: str,
+        pin: bool = False,
+        variant: Optional[str] = None,
+        lease: bool = False,
+        replacing: Optional[str] = None,
+    ) -> ResidentModel:
+        """Returns the resident model for ``key``, loading it (and evicting LRU models) on a miss.
+
+        A resident model loaded as a different ``variant`` is replaced. With ``lease``
+        the caller must ``release`` the entry when done with it. ``replacing`` names a
+        model that is about to be released (a hot swap): it is left out of the budget
+        so the new model can load alongside it.
+        """
+        while True:
+            stale = None
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None and entry.variant == variant:
+                    self.hits += 1
+                    return self._touch(entry, pin, lease)
+                if entry is not None:
+                    stale = self._models.pop(key)
+                    self.evictions += 1
+                    pin = pin or stale.pinned
+                else:
+                    loading = self._loading.get(key)
+                    if loading is None:
+                        self.misses += 1
+                        loading = self._loading[key] = threading.Event()
+                        break
+            if stale is not None:
+                self._discard(stale)
+                continue
+            # Another request is loading this model; wait and re-check
+            loading.wait()
+
+        try:
+            estimate = self._estimate_fn(key) if self._estimate_fn is not None else 0
+            self._evict_for(estimate, exclude=key, replacing=replacing)
+            tokenizer, model, device, load_time = self._load_fn(key)
+        except Exception:
+            with self._lock:
+                self.load_failures += 1
+                self._loading.pop(key).set()
+            raise
+
+        nbytes = _model_nbytes(model) or estimate
+        entry = ResidentModel(key, variant, tokenizer, model, device, load_time, nbytes)
+        with self._lock:
+            self.loads += 1
+            self._models[key] = entry
+            self._touch(entry, pin, lease)
+            self._loading.pop(key).set()
+        # The real footprint may exceed the estimate; settle the budget now
+        self._evict_for(0, exclude=key, replacing=replacing, strict=False)
+        return entry
+
+    def lease(self, model: Any) -> Optional[ResidentModel]:
+        """Takes a lease on the resident entry holding ``model`` (None if the registry doesn't manage it)."""
+        with self._lock:
+            for entry in self._models.values():
+                if entry.model is model:
+                    entry.leases += 1
+                    return entry
+        return None
+
+    def release(self, entry: Optional[ResidentModel]) -> None:
+        """Returns a lease; a retired model is unloaded once its last lease is back."""
+        if entry is None:
+            return
+        with self._lock:
+            entry.leases -= 1
+            drained = entry.retired and entry.leases <= 0
+            if drained:
+                self._retired.remove(entry)
+        if drained:
+            print(f"   ✅ In-flight requests on '{entry.key}' drained.")
+            self._unload_fn(entry)
+
+    def settle(self) -> None:
+        """Evicts unpinned LRU models until the registry is back within its limits (e.g. after an unpin)."""
+        self._evict_for(0, exclude=None, strict=False)
+
+    def peek(self, key: str) -> Optional[ResidentModel]:
+        """Returns the resident model for ``key`` without loading it or counting a hit."""
+        with self._lock:
+            return self._models.get(key)
+
+    def pin(self, key: str) -> None:
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                entry.pinned = True
+
+    def unpin(self, key: str) -> None:
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                entry.pinned = False
+
+    def evict(self, key: str) -> bool:
+        """Unloads ``key`` regardless of pinning. Returns whether it was resident."""
+        with self._lock:
+            entry = self._models.pop(key, None)
+            if entry is not None:
+                self.evictions += 1
+        if entry is None:
+            return False
+        self._discard(entry)
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            keys = list(self._models)
+        for key in keys:
+            self.evict(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            resident: List[Dict[str, Any]] = [
+                {
+                    "key": entry.key,
+                    "variant": entry.variant,
+                    "device": entry.device,
+                    "bytes": entry.nbytes,
+                    "load_time": entry.load_time,
+                    "pinned": entry.pinned,
+                    "leases": entry.leases,
+                    "last_used": entry.last_used,
+                }
+                for entry in reversed(self._models.values())  # Most recently used first
+            ]
+            return {
+                "resident": resident,
+                "resident_bytes": sum(entry.nbytes for entry in self._models.values()),
+                "retired": [{"key": entry.key, "leases": entry.leases} for entry in self._retired],
+                "loading": list(self._loading),
+                "max_models": self.max_models,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                "load_failures": self.load_failures,
+                "evictions": self.evictions,
+            }
+
+    # ------------------------------------------------------------------
+    def _touch(self, entry: ResidentModel, pin: bool, lease: bool = False) -> ResidentModel:
+        entry.last_used = time.time()
+        if pin:
+            entry.pinned = True
+        if lease:
+            entry.leases += 1
+        self._models.move_to_end(entry.key)
+        return entry
+
+    def _discard(self, entry: ResidentModel) -> None:
+        """Unloads a model that has left the registry, or retires it while it is leased."""
+        with self._lock:
+            if entry.leases > 0:
+                entry.retired = True
+                self._retired.append(entry)
+                print(f"   ⏳ Model '{entry.key}' retired; unloading after {entry.leases} in-flight request(s) finish.")
+                return
+        self._unload_fn(entry)
+
+    def _evict_for(self, incoming_bytes: int, exclude: Optional[str], replacing: Optional[str] = None, strict: bool = True) -> None:
+        """Evicts unpinned LRU models until ``incoming_bytes`` more fits within the limits.
+
+        When ``strict`` and only pinned models are left, raises ModelBudgetError
+        without evicting anything; otherwise evicts what it can.
+        """
+        victims: List[ResidentModel] = []
+        with self._lock:
+            counted = [entry for key, entry in self._models.items() if key != replacing]
+            count = len(counted) + (0 if exclude is None or exclude in self._models else 1)
+            used = sum(entry.nbytes for entry in counted) + incoming_bytes
+
+            def over_budget() -> bool:
+                return count > self.max_models or (self.max_bytes > 0 and used > self.max_bytes)
+
+            for key in list(self._models):
+                if not over_budget():
+                    break
+                entry = self._models[key]
+                if entry.pinned or key == exclude or key == replacing:
+                    continue
+                del self._models[key]
+                self.evictions += 1
+                victims.append(entry)
+                count -= 1
+                used -= entry.nbytes
+
+            if count > self.max_models and strict:
+                # Put back what we took out; nothing is unloaded on failure
+                for entry in reversed(victims):
+                    self._models[entry.key] = entry
+                    self._models.move_to_end(entry.key, last=False)
+                self.evictions -= len(victims)
+                raise ModelBudgetError(
+                    f"Cannot make '{exclude}' resident: {self.max_models} model(s) allowed and the others are pinned. "
+                    "Raise SIGIL_MAX_RESIDENT_MODELS or switch the active model."
+                )
+            if count > self.max_models:
+                print(f"   ⚠️ {count} models resident (limit {self.max_models}); the rest are pinned or being replaced.")
+            elif self.max_bytes > 0 and used > self.max_bytes:
+                print(f"   ⚠️ Resident models exceed the memory budget ({used / 2**20:.0f} MB > {self.max_bytes / 2**20:.0f} MB); only pinned models are left to evict.")
+
+        for entry in victims:
+            self._discard(entry)
+
+
+def _model_nbytes(model: Any) -> int:
+    """Bytes of weights and buffers held by ``model`` (0 if unknown)."""
+    try:
+        return int(model.get_memory_footprint())
+    except Exception:
+        return 0
@@ -0,0 +1,253 @@
+import collections
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from transformers import DynamicCache
+
+from .config import settings
+from .kv_snapshot import load_snapshot, model_identity, save_snapshot
+
+
+def cache_nbytes(cache: DynamicCache) -> int:
+    """Bytes held by the key/value tensors of a DynamicCache."""
+    total = 0
+    for keys, values in zip(cache.key_cache, cache.value_cache):
+        total += keys.numel() * keys.element_size() + values.numel() * values.element_size()
+    return total
+
+
+def _common_prefix_length(a: List[int], b: List[int]) -> int:
+    limit = min(len(a), len(b))
+    for i in range(limit):
+        if a[i] != b[i]:
+            return i
+    return limit
+
+
+def _is_thread_key(key: str) -> bool:
+    """Only saved threads get snapshots; ``pending:`` keys belong to in-flight new chats."""
+    return not key.startswith("pending:")
+
+
+class _Entry:
+    def __init__(self, model_key: int, identity: str, token_ids: List[int], cache: DynamicCache):
+        self.model_key = model_key
+        self.identity = identity
+        self.token_ids = token_ids
+        self.cache = cache
+        self.nbytes = cache_nbytes(cache)
+        self.last_used = time.time()
+
+
+class PrefixCache:
+    """Per-thread store of the KV cache left behind by the previous chat turn.
+
+    Each entry keeps the token ids whose keys/values are in the cache. A follow-up
+    turn takes the entry, crops it to the longest common token prefix with its new
+    prompt and hands it to model.generate, so only the newly appended messages are
+    prefilled. Because reuse is decided on token ids, edited or regenerated history
+    simply yields a shorter common prefix instead of stale attention state.
+
+    Entries are evicted least-recently-used first once their combined size exceeds
+    ``max_bytes``. With ``settings.kv_snapshots_enabled`` evicted and idle thread
+    entries are written to disk (see kv_snapshot) instead of being dropped, and a
+    memory miss falls back to the thread's snapshot, so resuming an old session only
+    prefills the new message.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "collections.OrderedDict[str, _Entry]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.tokens_reused = 0
+        self.snapshots_written = 0
+        self.snapshots_restored = 0
+
+    def take(self, key: str, model: Any, token_ids: List[int]) -> Tuple[Optional[DynamicCache], int]:
+        """Removes the entry for ``key`` and returns it cropped to the prefix shared with ``token_ids``.
+
+        Returns ``(cache, reused_tokens)``; ``(None, 0)`` on a miss. At least one prompt
+        token is always left uncached so generate() has logits to sample from.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+        if entry is None:
+            entry = self._restore(key, model)
+        if entry is None or entry.model_key != id(model):
+            self._count_miss()
+            return None, 0
+
+        reusable = min(_common_prefix_length(entry.token_ids, token_ids), len(token_ids) - 1)
+        if reusable <= 0:
+            self._count_miss()
+            return None, 0
+        entry.cache.crop(reusable)
+        with self._lock:
+            self.hits += 1
+            self.tokens_reused += reusable
+        return entry.cache, reusable
+
+    def put(self, key: str, model: Any, token_ids: List[int], cache: DynamicCache) -> None:
+        """Stores the cache for ``key`` (replacing any previous entry) and enforces the budget."""
+        if not isinstance(cache, DynamicCache) or cache.get_seq_length() != len(token_ids):
+            return
+        entry = _Entry(id(model), model_identity(model), list(token_ids), cache)
+        if entry.nbytes > self.max_bytes:
+            self._spill([(key, entry)])
+            return
+        self._spill(self._insert(key, entry))
+
+    def prefetch(self, key: str, model: Any) -> bool:
+        """Loads a thread's snapshot into memory ahead of its next turn (e.g. when the session is opened)."""
+        with self._lock:
+            if key in self._entries:
+                return True
+        entry = self._restore(key, model)
+        if entry is None:
+            return False
+        self._spill(self._insert(key, entry))
+        return True
+
+    def spill_idle(self, idle_seconds: float) -> int:
+        """Moves thread entries unused for ``idle_seconds`` to disk. Returns how many were written."""
+        cutoff = time.time() - idle_seconds
+        with self._lock:
+            idle = [(key, entry) for key, entry in self._entries.items()
+                    if entry.last_used < cutoff and _is_thread_key(key)]
+            for key, entry in idle:
+                del self._entries[key]
+                self._bytes -= entry.nbytes
+        return self._spill(idle)
+
+    def spill_all(self) -> int:
+        """Writes every thread entry to disk, e.g. on shutdown."""
+        return self.spill_idle(-1.0)
+
+    def rekey(self, old_key: str, new_key: str) -> None:
+        """Moves an entry, e.g. once a new chat has been assigned its thread_id."""
+        with self._lock:
+            entry = self._entries.pop(old_key, None)
+            if entry is not None:
+                self._entries[new_key] = entry
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+
+    def forget_model(self, model: Any) -> None:
+        """Drops the entries computed by ``model`` (e.g. when it is evicted from the model registry)."""
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.model_key == id(model)]
+            for key in stale:
+                self._bytes -= self._entries.pop(key).nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": settings.prefix_cache_enabled,
+                "snapshots_enabled": settings.kv_snapshots_enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "tokens_reused": self.tokens_reused,
+                "snapshots_written": self.snapshots_written,
+                "snapshots_restored": self.snapshots_restored,
+            }
+
+    def _insert(self, key: str, entry: _Entry) -> List[Tuple[str, _Entry]]:
+        """Adds an entry and returns whatever had to be evicted to stay within budget."""
+        evicted = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                evicted_key, evicted_entry = self._entries.popitem(last=False)
+                self._bytes -= evicted_entry.nbytes
+                self.evictions += 1
+                evicted.append((evicted_key, evicted_entry))
+        return evicted
+
+    def _spill(self, entries: List[Tuple[str, _Entry]]) -> int:
+        """Writes entries leaving memory to disk; runs outside the lock since it does I/O."""
+        if not settings.kv_snapshots_enabled:
+            return 0
+        written = 0
+        for key, entry in entries:
+            if _is_thread_key(key) and save_snapshot(key, entry.identity, entry.token_ids, entry.cache):
+                written += 1
+        with self._lock:
+            self.snapshots_written += written
+        return written
+
+    def _restore(self, key: str, model: Any) -> Optional[_Entry]:
+        if not settings.kv_snapshots_enabled or not _is_thread_key(key) or model is None:
+            return None
+        restored = load_snapshot(key, model)
+        if restored is None:
+            return None
+        token_ids, cache = restored
+        with self._lock:
+            self.snapshots_restored += 1
+        print(f"💾 Restored KV snapshot for {key} ({len(token_ids)} tokens)")
+        return _Entry(id(model), model_identity(model), token_ids, cache)
+
+    def _count_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+
+# Singleton shared by the inference paths
+prefix_cache = PrefixCache(max_bytes=settings.prefix_cache_max_mb * 1024 * 1024)
+
+_sweeper_stop = threading.Event()
+_sweeper_thread: Optional[threading.Thread] = None
+
+
+def start_idle_sweeper() -> None:
+    """Starts the background thread that moves idle thread caches to disk."""
+    global _sweeper_thread
+    if not settings.kv_snapshots_enabled or _sweeper_thread is not None:
+        return
+    idle_seconds = settings.kv_snapshot_idle_seconds
+    interval = max(1.0, min(60.0, idle_seconds / 2))
+
+    def _sweep():
+        while not _sweeper_stop.wait(interval):
+            written = prefix_cache.spill_idle(idle_seconds)
+            if written:
+                print(f"💾 Spilled {written} idle KV cache(s) to disk")
+
+    _sweeper_stop.clear()
+    _sweeper_thread = threading.Thread(target=_sweep, name="kv-snapshot-sweeper", daemon=True)
+    _sweeper_thread.start()
+
+
+def stop_idle_sweeper() -> None:
+    """Stops the sweeper and writes every remaining thread cache to disk."""
+    global _sweeper_thread
+    _sweeper_stop.set()
+    if _sweeper_thread is not None:
+        _sweeper_thread.join(timeout=5)
+        _sweeper_thread = None
+    if settings.kv_snapshots_enabled:
+        prefix_cache.spill_all()
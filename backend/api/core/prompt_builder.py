@@ -1,5 +1,184 @@
+import collections
+import hashlib
+import threading
 from transformers import AutoTokenizer
-from typing import Optional, List, Dict
+from typing import Any, Optional, List, Dict, Tuple
+
+from .config import settings
+
+
+# --- NEW: Token-budgeted history packing ---
+class TokenCountCache:
+    """LRU map of (tokenizer, text) -> token count.
+
+    Chat requests resend the whole history every turn; with the counts cached only
+    the messages that are new since the last turn are tokenized when packing.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._counts: "collections.OrderedDict[Tuple[Any, ...], int]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, tokenizer: AutoTokenizer, text: str) -> int:
+        key = (_tokenizer_key(tokenizer), hashlib.sha1(text.encode("utf-8")).digest())
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return cached
+        count = len(tokenizer(text, add_special_tokens=False)["input_ids"])
+        with self._lock:
+            self.misses += 1
+            self._counts[key] = count
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return count
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+def _tokenizer_key(tokenizer: AutoTokenizer) -> Tuple[Any, ...]:
+    # Not id(): a reloaded tokenizer may reuse the address of a different one
+    return (
+        type(tokenizer).__name__,
+        getattr(tokenizer, "name_or_path", ""),
+        len(tokenizer),
+        getattr(tokenizer, "prompt_mode", "template"),
+    )
+
+
+token_counts = TokenCountCache(settings.token_count_cache_size)
+
+
+def model_context_window(model: Any, tokenizer: Optional[AutoTokenizer] = None) -> Optional[int]:
+    """Longest sequence (prompt + generated tokens) the model supports, or None if unknown."""
+    config = getattr(model, "config", None)
+    for attr in ("max_position_embeddings", "n_positions", "max_sequence_length", "seq_length"):
+        value = getattr(config, attr, None)
+        if isinstance(value, int) and value > 0:
+            return value
+    # Tokenizers without a limit report a huge sentinel (int(1e30))
+    limit = getattr(tokenizer, "model_max_length", None)
+    if isinstance(limit, int) and 0 < limit < 1_000_000:
+        return limit
+    return None
+
+
+def _prompt_tokens(prompt: str, tokenizer: AutoTokenizer) -> int:
+    # Same tokenization generate_response applies to the rendered prompt
+    return len(tokenizer(prompt)["input_ids"])
+
+
+# (tokenizer, system prompt) -> (base, per_message) or None; system prompts are few, so a small LRU
+_overheads: "collections.OrderedDict[Tuple[Any, ...], Optional[Tuple[int, int]]]" = collections.OrderedDict()
+_overheads_lock = threading.Lock()
+
+
+def _template_overhead(system_prompt: str, tokenizer: AutoTokenizer) -> Optional[Tuple[int, int]]:
+    """(base, per_message) token counts the prompt format adds around message contents.
+
+    Measured by rendering probes with empty contents: one user turn, and
+    user/assistant/user. Returns None when the format can't render the probes.
+    Cached per tokenizer and system prompt.
+    """
+    key = (_tokenizer_key(tokenizer), system_prompt)
+    with _overheads_lock:
+        if key in _overheads:
+            _overheads.move_to_end(key)
+            return _overheads[key]
+    try:
+        one = _prompt_tokens(generate_prompt("chat", system_prompt, tokenizer, messages=[
+            {"role": "user", "content": ""},
+        ]), tokenizer)
+        three = _prompt_tokens(generate_prompt("chat", system_prompt, tokenizer, messages=[
+            {"role": "user", "content": ""},
+            {"role": "assistant", "content": ""},
+            {"role": "user", "content": ""},
+        ]), tokenizer)
+        per_message = max(0, (three - one) // 2)
+        result: Optional[Tuple[int, int]] = (max(0, one - per_message), per_message)
+    except Exception as e:
+        print(f"⚠️ Could not measure prompt template overhead ({e}); history packing will verify by rendering.")
+        result = None
+    with _overheads_lock:
+        _overheads[key] = result
+        while len(_overheads) > 64:
+            _overheads.popitem(last=False)
+    return result
+
+
+def pack_history(
+    messages: List[Dict[str, str]],
+    system_prompt: str,
+    tokenizer: AutoTokenizer,
+    budget: int,
+) -> List[Dict[str, str]]:
+    """Keeps a leading system message plus the most recent messages whose prompt fits in ``budget`` tokens.
+
+    Sizes are estimated from cached per-message token counts plus the template
+    overhead, so only new messages are tokenized. When the estimate is close to the
+    budget (or the overhead is unknown) the packed prompt is rendered and counted,
+    dropping further messages until it fits. The newest message is always kept, and
+    the kept history never starts with an assistant turn.
+    """
+    head = [messages[0]] if messages and messages[0].get("role") == "system" else []
+    turns = messages[len(head):]
+    if not turns:
+        return messages
+
+    overhead = _template_overhead(system_prompt, tokenizer)
+    base, per_message = overhead if overhead is not None else (token_counts.count(tokenizer, system_prompt), 8)
+
+    used = base
+    start = len(turns)
+    while start > 0:
+        cost = token_counts.count(tokenizer, turns[start - 1].get("content") or "") + per_message
+        if start < len(turns) and used + cost > budget:
+            break
+        used += cost
+        start -= 1
+
+    def trim(begin: int) -> int:
+        # A history cut mid-exchange should start with the user
+        while begin < len(turns) - 1 and turns[begin].get("role") == "assistant":
+            begin += 1
+        return begin
+
+    start = trim(start)
+    if overhead is None or used > 0.9 * budget:
+        while start < len(turns) - 1:
+            rendered = generate_prompt("chat", system_prompt, tokenizer, messages=head + turns[start:])
+            if _prompt_tokens(rendered, tokenizer) <= budget:
+                break
+            start = trim(start + 1)
+
+    if start:
+        print(f"✂️ History packing dropped the {start} oldest message(s) to fit {budget} prompt tokens.")
+        return head + turns[start:]
+    return messages
+
+
+def pack_for_context(
+    messages: List[Dict[str, str]],
+    system_prompt: str,
+    tokenizer: AutoTokenizer,
+    context_window: Optional[int],
+    max_new_tokens: Optional[int],
+) -> List[Dict[str, str]]:
+    """pack_history with the budget a generation of ``max_new_tokens`` leaves in ``context_window``."""
+    if not messages or not context_window or not settings.history_token_budget:
+        return messages
+    # An oversized max_tokens can't be honoured anyway; keep at least half the window for history
+    reserve = min(max(0, max_new_tokens or 0), context_window // 2)
+    return pack_history(messages, system_prompt, tokenizer, max(1, context_window - reserve))
+# --- END NEW ---
+
 
 # --- Helper Function for Prompt Generation ---
 def generate_prompt(
@@ -8,8 +187,14 @@ def generate_prompt(
     tokenizer: AutoTokenizer = None,
     message: Optional[str] = None,
     messages: Optional[List[Dict[str, str]]] = None,
+    context_window: Optional[int] = None,
+    max_new_tokens: Optional[int] = None,
 ) -> str:
-    """Generates the appropriate prompt string based on the mode."""
+    """Generates the appropriate prompt string based on the mode.
+
+    With ``context_window`` set, chat history is packed (see pack_history) so the
+    prompt leaves room for ``max_new_tokens`` generated tokens (at most half the window).
+    """
     # Detect prompt handling mode attached to tokenizer by model_loader
     if tokenizer is None:
         raise ValueError("Tokenizer is required to generate a prompt")
@@ -21,6 +206,9 @@ def generate_prompt(
     # Ensure messages is never None
     if messages is None:
         messages = []
+
+    if mode == "chat":
+        messages = pack_for_context(messages, system_prompt, tokenizer, context_window, max_new_tokens)
     
     prompt_mode = getattr(tokenizer, "prompt_mode", "template")
     custom_cfg = getattr(tokenizer, "custom_prompt_config", None)
@@ -0,0 +1,294 @@
+import collections
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from transformers import AutoTokenizer
+
+from .config import settings
+from .prompt_builder import _tokenizer_key, generate_prompt, pack_for_context
+
+# Probe conversation used to check that a prompt format renders messages independently
+_PROBE_MESSAGES = [
+    {"role": "user", "content": "alpha one"},
+    {"role": "assistant", "content": "bravo two"},
+    {"role": "user", "content": "charlie three"},
+]
+
+# Join keys of the layout's head and tail (message fingerprints are 20-byte digests)
+_HEAD, _TAIL = b"head", b"tail"
+
+
+class _Layout:
+    """How a prompt format wraps message segments for one tokenizer and system prompt.
+
+    A chat prompt renders as ``head + segment(m1) + ... + segment(mn) + tail``, where
+    each segment depends only on its own message. ``head``/``tail`` come from
+    rendering the conversation without messages and with a single one.
+    """
+
+    def __init__(self, head: str, tail: str, head_ids: List[int], tail_ids: List[int]):
+        self.head = head
+        self.tail = tail
+        self.head_ids = head_ids
+        self.tail_ids = tail_ids
+
+
+class _ThreadPrompt:
+    def __init__(self, layout_key: Tuple[Any, ...]):
+        self.layout_key = layout_key
+        self.segments: Dict[bytes, Tuple[str, List[int]]] = {}  # message fingerprint -> (text, token ids)
+        self.joins: Set[Tuple[bytes, bytes]] = set()  # Adjacent pieces whose boundary tokenized cleanly
+        self.text: Optional[str] = None  # Last prompt rendered for the thread
+        self.token_ids: Optional[List[int]] = None
+
+
+def _fingerprint(message: Dict[str, str]) -> bytes:
+    return hashlib.sha1(f"{message.get('role')}\x00{message.get('content') or ''}".encode("utf-8")).digest()
+
+
+class PromptSegmentCache:
+    """Per-thread cache of rendered and tokenized chat messages.
+
+    Every turn of a chat resends, re-renders and re-tokenizes the whole history.
+    For prompt formats whose messages render independently of each other this cache
+    keeps each message's rendered text and token ids per thread, so a new turn only
+    renders and tokenizes the messages that are new (or edited). inference reads the
+    token ids back through ``encode`` when the prompt text matches exactly.
+
+    Whether a format qualifies is checked once per tokenizer and system prompt by
+    comparing a stitched probe conversation, text and token ids, with its full
+    render. Formats that fail (e.g. a system prompt folded into the first user turn)
+    always use the full render. The probe can't rule out a BPE merge across the
+    boundary of two real messages, so each pair of neighbouring pieces is tokenized
+    together the first time it is stitched; a pair that merges makes that prompt use
+    the ids of a full tokenization. Every ``verify_interval``-th stitched prompt is
+    also compared with the full render as a backstop; a mismatch disables stitching
+    for that format.
+    """
+
+    def __init__(self, max_threads: int, verify_interval: int):
+        self.max_threads = max_threads
+        self.verify_interval = verify_interval
+        self._threads: "collections.OrderedDict[str, _ThreadPrompt]" = collections.OrderedDict()
+        self._layouts: Dict[Tuple[Any, ...], Optional[_Layout]] = {}
+        self._lock = threading.Lock()
+        self._stitched = 0
+        self.segments_reused = 0
+        self.segments_rendered = 0
+        self.full_renders = 0
+        self.mismatches = 0
+        self.boundary_merges = 0
+
+    def render(
+        self,
+        cache_key: Optional[str],
+        mode: str,
+        system_prompt: Optional[str],
+        tokenizer: AutoTokenizer,
+        message: Optional[str] = None,
+        messages: Optional[List[Dict[str, str]]] = None,
+        context_window: Optional[int] = None,
+        max_new_tokens: Optional[int] = None,
+    ) -> str:
+        """Drop-in for generate_prompt that reuses the thread's cached segments for chat prompts."""
+        if cache_key is None or mode != "chat" or not messages or not settings.prompt_segment_cache:
+            return generate_prompt(mode, system_prompt, tokenizer, message, messages, context_window, max_new_tokens)
+        if system_prompt is None:
+            system_prompt = "You are a helpful assistant."
+
+        messages = pack_for_context(messages, system_prompt, tokenizer, context_window, max_new_tokens)
+        lead = [dict(messages[0])] if messages[0].get("role") == "system" else []
+        turns = messages[len(lead):]
+        layout_key = (_tokenizer_key(tokenizer), system_prompt, lead[0]["content"] if lead else None)
+        layout = self._layout(layout_key, system_prompt, tokenizer, lead)
+        if layout is None or not turns:
+            return self._full_render(cache_key, layout_key, system_prompt, tokenizer, messages)
+
+        with self._lock:
+            entry = self._threads.get(cache_key)
+            if entry is None or entry.layout_key != layout_key:
+                entry = _ThreadPrompt(layout_key)
+            cached = dict(entry.segments)
+
+        segments: Dict[bytes, Tuple[str, List[int]]] = {}
+        pieces = [(_HEAD, layout.head, layout.head_ids)]
+        rendered = 0
+        for turn in turns:
+            fingerprint = _fingerprint(turn)
+            segment = cached.get(fingerprint) or segments.get(fingerprint)
+            if segment is None:
+                segment = self._render_segment(layout, system_prompt, tokenizer, lead, turn)
+                if segment is None:
+                    self._disable(layout_key, "a message rendered outside the probed layout")
+                    return self._full_render(cache_key, layout_key, system_prompt, tokenizer, messages)
+                rendered += 1
+            segments[fingerprint] = segment
+            pieces.append((fingerprint, segment[0], segment[1]))
+        pieces.append((_TAIL, layout.tail, layout.tail_ids))
+        text = "".join(piece[1] for piece in pieces)
+        token_ids = [token_id for piece in pieces for token_id in piece[2]]
+
+        # Check each boundary the first time its two pieces are stitched together
+        joins, merged = set(), False
+        for i, (left, right) in enumerate(zip(pieces, pieces[1:])):
+            join = (left[0], right[0])
+            if join not in entry.joins:
+                if merged:
+                    continue  # Checked on a later turn
+                # Only the head's ids carry the tokenizer's special tokens
+                if tokenizer(left[1] + right[1], add_special_tokens=i == 0)["input_ids"] != left[2] + right[2]:
+                    merged = True
+                    continue
+            joins.add(join)
+        if merged:
+            token_ids = tokenizer(text)["input_ids"]
+
+        with self._lock:
+            self.boundary_merges += merged
+            self._stitched += 1
+            self.segments_rendered += rendered
+            self.segments_reused += len(turns) - rendered
+            verify = self.verify_interval > 0 and self._stitched % self.verify_interval == 0
+        if verify:
+            full_text = generate_prompt("chat", system_prompt, tokenizer, messages=messages)
+            if full_text != text or tokenizer(full_text)["input_ids"] != token_ids:
+                self._disable(layout_key, "a stitched prompt differed from the full render")
+                return self._full_render(cache_key, layout_key, system_prompt, tokenizer, messages)
+
+        entry.segments = segments  # Segments of messages that left the history are dropped
+        entry.joins = joins
+        self._store(cache_key, entry, text, token_ids)
+        return text
+
+    def encode(self, cache_key: Optional[str], prompt: str, tokenizer: AutoTokenizer) -> List[int]:
+        """Token ids of ``prompt``: the cached ids when it is the thread's last rendered prompt, else tokenized."""
+        if cache_key is not None:
+            with self._lock:
+                entry = self._threads.get(cache_key)
+                if (
+                    entry is not None and entry.text == prompt and entry.token_ids is not None
+                    and entry.layout_key[0] == _tokenizer_key(tokenizer)
+                ):
+                    return list(entry.token_ids)
+        return tokenizer(prompt)["input_ids"]
+
+    def rekey(self, old_key: str, new_key: str) -> None:
+        with self._lock:
+            entry = self._threads.pop(old_key, None)
+            if entry is not None:
+                self._threads[new_key] = entry
+
+    def invalidate(self, cache_key: str) -> None:
+        with self._lock:
+            self._threads.pop(cache_key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._threads.clear()
+            self._layouts.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threads": len(self._threads),
+                "segments_reused": self.segments_reused,
+                "segments_rendered": self.segments_rendered,
+                "full_renders": self.full_renders,
+                "mismatches": self.mismatches,
+                "boundary_merges": self.boundary_merges,
+                "stitchable_formats": sum(1 for layout in self._layouts.values() if layout is not None),
+                "unstitchable_formats": sum(1 for layout in self._layouts.values() if layout is None),
+            }
+
+    # ------------------------------------------------------------------
+    def _layout(
+        self, layout_key: Tuple[Any, ...], system_prompt: str, tokenizer: AutoTokenizer, lead: List[Dict[str, str]],
+    ) -> Optional[_Layout]:
+        with self._lock:
+            if layout_key in self._layouts:
+                return self._layouts[layout_key]
+        layout = self._probe_layout(system_prompt, tokenizer, lead)
+        with self._lock:
+            self._layouts[layout_key] = layout
+        return layout
+
+    @staticmethod
+    def _probe_layout(system_prompt: str, tokenizer: AutoTokenizer, lead: List[Dict[str, str]]) -> Optional[_Layout]:
+        try:
+            empty = generate_prompt("chat", system_prompt, tokenizer, messages=[dict(m) for m in lead])
+            single = generate_prompt("chat", system_prompt, tokenizer, messages=[dict(m) for m in lead] + [_PROBE_MESSAGES[0]])
+        except Exception:
+            return None  # e.g. a format that can't render a conversation without messages
+        # empty == head + tail and single == head + segment + tail: split empty where single diverges
+        split = 0
+        while split < min(len(empty), len(single)) and empty[split] == single[split]:
+            split += 1
+        while split > 0 and not (single.endswith(empty[split:]) and len(single) - (len(empty) - split) >= split):
+            split -= 1
+        head, tail = empty[:split], empty[split:]
+        layout = _Layout(
+            head, tail,
+            tokenizer(head)["input_ids"],
+            tokenizer(tail, add_special_tokens=False)["input_ids"] if tail else [],
+        )
+
+        # The stitched probe must match the full render in text and token ids
+        full = generate_prompt("chat", system_prompt, tokenizer, messages=[dict(m) for m in lead] + _PROBE_MESSAGES)
+        texts, token_ids = [head], list(layout.head_ids)
+        for message in _PROBE_MESSAGES:
+            segment = PromptSegmentCache._render_segment(layout, system_prompt, tokenizer, lead, message)
+            if segment is None:
+                return None
+            texts.append(segment[0])
+            token_ids.extend(segment[1])
+        texts.append(tail)
+        token_ids.extend(layout.tail_ids)
+        if "".join(texts) != full or tokenizer(full)["input_ids"] != token_ids:
+            return None
+        return layout
+
+    @staticmethod
+    def _render_segment(
+        layout: _Layout, system_prompt: str, tokenizer: AutoTokenizer, lead: List[Dict[str, str]], message: Dict[str, str],
+    ) -> Optional[Tuple[str, List[int]]]:
+        """Renders one message in the conversation's position and cuts out its segment."""
+        try:
+            rendered = generate_prompt("chat", system_prompt, tokenizer, messages=[dict(m) for m in lead] + [dict(message)])
+        except Exception:
+            return None
+        end = len(rendered) - len(layout.tail)
+        if end < len(layout.head) or not rendered.startswith(layout.head) or not rendered.endswith(layout.tail):
+            return None
+        text = rendered[len(layout.head):end]
+        return text, tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def _full_render(
+        self, cache_key: str, layout_key: Tuple[Any, ...], system_prompt: str, tokenizer: AutoTokenizer,
+        messages: List[Dict[str, str]],
+    ) -> str:
+        text = generate_prompt("chat", system_prompt, tokenizer, messages=messages)
+        with self._lock:
+            self.full_renders += 1
+        self._store(cache_key, _ThreadPrompt(layout_key), text, tokenizer(text)["input_ids"])
+        return text
+
+    def _store(self, cache_key: str, entry: _ThreadPrompt, text: str, token_ids: List[int]) -> None:
+        entry.text, entry.token_ids = text, token_ids
+        with self._lock:
+            self._threads[cache_key] = entry
+            self._threads.move_to_end(cache_key)
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+
+    def _disable(self, layout_key: Tuple[Any, ...], reason: str) -> None:
+        print(f"⚠️ Prompt segment cache disabled for a prompt format: {reason}; using full renders.")
+        with self._lock:
+            self.mismatches += 1
+            self._layouts[layout_key] = None
+            for key in [k for k, entry in self._threads.items() if entry.layout_key == layout_key]:
+                del self._threads[key]
+
+
+# Singleton shared by the chat routes (render) and inference (encode)
+prompt_segments = PromptSegmentCache(settings.prompt_segment_cache_threads, settings.prompt_segment_verify_interval)
@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+from typing import Any, Optional, Tuple
+
+import torch
+from torch import nn
+import torch.ao.nn.quantized.dynamic as nnqd
+from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+from transformers.modeling_utils import no_init_weights
+
+from .weight_cache import cache_dir, is_fresh, write_meta
+
+INT8_CACHE_FORMAT = "sigil-int8-dynamic-1"
+INT8_QUANTIZATION = "int8-dynamic"
+
+
+def quantize_int8(model: Any) -> Any:
+    """Quantizes the Linear layers of ``model`` to int8 in place (dynamic quantization, CPU only).
+
+    Weights are stored as int8 with per-tensor scales; activations are quantized on the
+    fly during each matmul. Embeddings and norms stay in fp32.
+    """
+    model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+    model.sigil_quantization = INT8_QUANTIZATION
+    return model
+
+
+def _int8_skeleton(model_path: str) -> Any:
+    """Builds the model with uninitialised weights and int8 Linear layers, ready for a cached state dict."""
+    config = AutoConfig.from_pretrained(model_path, local_files_only=True, trust_remote_code=False)
+    with no_init_weights():
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=torch.float32)
+
+    def swap_linear(module):
+        for name, child in module.named_children():
+            if isinstance(child, nn.Linear):
+                setattr(module, name, nnqd.Linear(child.in_features, child.out_features, bias_=child.bias is not None, dtype=torch.qint8))
+            else:
+                swap_linear(child)
+
+    swap_linear(model)
+    # from_config() ignores generation_config.json (several EOS ids, sampling defaults)
+    try:
+        model.generation_config = GenerationConfig.from_pretrained(model_path, local_files_only=True)
+    except OSError:
+        model.generation_config = GenerationConfig.from_model_config(config)
+    model.sigil_quantization = INT8_QUANTIZATION
+    return model
+
+
+def _load_cached_int8(model_path: str) -> Optional[Any]:
+    """Returns the int8 model from the cache, or None if there is no valid cached copy."""
+    directory = cache_dir(model_path)
+    weights_path = os.path.join(directory, "int8-dynamic.pt")
+    meta_path = os.path.join(directory, "int8-dynamic.json")
+    if not (os.path.isfile(weights_path) and os.path.isfile(meta_path)):
+        return None
+    if not is_fresh(meta_path, INT8_CACHE_FORMAT, model_path):
+        print("   ⚠️ Cached int8 weights are stale (checkpoint or torch changed); re-quantizing.")
+        return None
+    try:
+        model = _int8_skeleton(model_path)
+        model.load_state_dict(torch.load(weights_path, map_location="cpu", weights_only=True), strict=True)
+        return model
+    except Exception as e:
+        print(f"   ⚠️ Could not use cached int8 weights ({e}); re-quantizing.", file=sys.stderr)
+        return None
+
+
+def _save_int8_cache(model_path: str, model: Any) -> None:
+    directory = cache_dir(model_path)
+    weights_path = os.path.join(directory, "int8-dynamic.pt")
+    meta_path = os.path.join(directory, "int8-dynamic.json")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Written to temporary names and renamed so a crash never leaves a partial cache
+        torch.save(model.state_dict(), f"{weights_path}.tmp")
+        os.replace(f"{weights_path}.tmp", weights_path)
+        write_meta(meta_path, INT8_CACHE_FORMAT, model_path)
+        print(f"   ✅ Cached int8 weights in '{directory}'.")
+    except OSError as e:
+        print(f"   ⚠️ Could not cache int8 weights in '{directory}': {e}", file=sys.stderr)
+
+
+def load_int8_model(model_path: str) -> Tuple[Any, bool]:
+    """Loads the checkpoint at ``model_path`` on CPU with int8 Linear weights.
+
+    Returns ``(model, from_cache)``. The first load quantizes the fp32 weights and
+    caches the result under ``.sigil_cache``; later loads read the cached int8 weights
+    directly.
+    """
+    model = _load_cached_int8(model_path)
+    if model is not None:
+        print("   ♻️ Loaded int8 weights from cache.")
+        return model, True
+
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path, local_files_only=True, trust_remote_code=False, device_map="cpu", torch_dtype=torch.float32,
+    )
+    quantize_start = time.perf_counter()
+    quantize_int8(model)
+    print(f"   ✅ Quantized Linear layers to int8 in {time.perf_counter() - quantize_start:.2f}s.")
+    _save_int8_cache(model_path, model)
+    return model, False
@@ -0,0 +1,471 @@
+import asyncio
+import collections
+import itertools
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, List, Optional
+
+import torch
+from transformers import (
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    DynamicCache,
+    LogitsProcessorList,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+
+from .config import settings
+from .executor import InferenceQueueFullError
+from .metrics import observe_generation
+from .stopping import StopStringMatcher
+from .cancellation import GenerationCancelledError
+
+
+class _Sequence:
+    """Book-keeping for one request while it waits for, and runs in, the batch."""
+
+    def __init__(
+        self,
+        request_id: int,
+        prompt_ids: List[int],
+        temperature: float,
+        top_p: float,
+        max_new_tokens: int,
+        repetition_penalty: float,
+        stop_matcher: StopStringMatcher,
+        cancel: Optional[Any] = None,
+    ):
+        self.request_id = request_id
+        self.cancel = cancel  # CancelToken checked before admission and after every decode step
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.stop_matcher = stop_matcher
+        self.generated: List[int] = []
+        self.future: Future = Future()
+        self.finish_reason: Optional[str] = None
+        # Same sampling pipeline model.generate builds for do_sample=True, top_k=50
+        self.processors = LogitsProcessorList()
+        if repetition_penalty and repetition_penalty != 1.0:
+            self.processors.append(RepetitionPenaltyLogitsProcessor(repetition_penalty))
+        if temperature and temperature != 1.0:
+            self.processors.append(TemperatureLogitsWarper(temperature))
+        self.processors.append(TopKLogitsWarper(top_k=50))
+        if top_p is not None and top_p < 1.0:
+            self.processors.append(TopPLogitsWarper(top_p))
+        # Timestamps (perf_counter)
+        self.submitted_at = time.perf_counter()
+        self.admitted_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def timings(self) -> Dict[str, Any]:
+        end = self.finished_at or time.perf_counter()
+        admitted = self.admitted_at or end
+        decode_time = end - (self.first_token_at or end)
+        return {
+            "queue_wait": admitted - self.submitted_at,
+            "time_to_first_token": (self.first_token_at - self.submitted_at) if self.first_token_at else None,
+            "latency": end - self.submitted_at,
+            # Prefill shares forward passes with other sequences' decode steps
+            "prefill_time": (self.first_token_at or end) - admitted,
+            "decode_time": decode_time,
+            "prompt_tokens": len(self.prompt_ids),
+            "completion_tokens": len(self.generated),
+            "tokens_per_second": (len(self.generated) - 1) / decode_time if decode_time > 0 else None,
+            "stop_tokens_saved": (self.max_new_tokens - len(self.generated)) if self.finish_reason == "stop" else 0,
+        }
+
+
+class BatchScheduler:
+    """Continuous-batching decoder for a single loaded model.
+
+    Requests are admitted into a shared running batch between decode steps: each
+    newcomer is prefilled on its own and its KV cache is left-padded into the
+    batch cache. Every step then decodes one token for all active sequences in a
+    single forward pass, and finished sequences (EOS, max_tokens or a stop
+    string) are retired individually without stalling the others.
+
+    Works with models whose forward pass accepts a DynamicCache plus a 2D
+    attention mask and explicit position_ids (Llama, Mistral, Qwen2, Phi, ...).
+    Unlike generate_response there is no automatic continuation pass:
+    ``max_new_tokens`` is a hard budget.
+    """
+
+    def __init__(
+        self,
+        model: AutoModelForCausalLM,
+        tokenizer: AutoTokenizer,
+        max_batch_size: int = 8,
+        max_queue_size: int = 8,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_queue_size = max(0, max_queue_size)
+        self.input_device = model.device
+
+        eos = getattr(model.generation_config, "eos_token_id", None)
+        if eos is None:
+            eos = tokenizer.eos_token_id
+        self.eos_token_ids = set(eos if isinstance(eos, (list, tuple)) else [eos]) - {None}
+
+        self._ids = itertools.count(1)
+        self._pending: Deque[_Sequence] = collections.deque()
+        self._condition = threading.Condition()
+        self._running = False
+        self._draining = False
+        self._thread: Optional[threading.Thread] = None
+
+        # Running batch state (only touched by the scheduler thread)
+        self._active: List[_Sequence] = []
+        self._cache: Optional[DynamicCache] = None
+        self._attention_mask: Optional[torch.Tensor] = None  # [batch, cached_len]
+        self._positions: List[int] = []  # Real tokens already in the cache, per row
+
+        # Aggregate counters
+        self._stats_lock = threading.Lock()
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._tokens_generated = 0
+        self._decode_steps = 0
+        self._batch_rows_decoded = 0
+        self._busy_time = 0.0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._loop, name="sigil-batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=30)
+        self._fail_all(RuntimeError("Batch scheduler stopped."))
+
+    def drain(self) -> None:
+        """Stops the scheduler once its queued and running sequences have finished.
+
+        Used when the active model is swapped: requests already handed to this
+        scheduler complete on the old model instead of failing.
+        """
+        with self._condition:
+            self._draining = True
+            self._condition.notify_all()
+
+    def submit(
+        self,
+        prompt: str,
+        temperature: float,
+        top_p: float,
+        max_new_tokens: int,
+        repetition_penalty: float = 1.0,
+        stop: Optional[List[str]] = None,
+        cancel: Optional[Any] = None,
+        prompt_ids: Optional[List[int]] = None,
+    ) -> Future:
+        """Queues a prompt for batched decoding.
+
+        The future resolves to a dict with ``text``, ``finish_reason`` and
+        ``timings`` (queue wait, time to first token, latency, tokens/s). Decoding of
+        the sequence ends once a ``stop`` string (default: DEFAULT_STOP_TOKENS) appears.
+        Once ``cancel`` (a CancelToken) is set the sequence leaves the batch at the next
+        step and the future fails with GenerationCancelledError. ``prompt_ids`` are the
+        prompt's token ids when already known (see prompt_cache).
+        """
+        prompt_ids = list(prompt_ids) if prompt_ids is not None else self.tokenizer(prompt)["input_ids"]
+        seq = _Sequence(next(self._ids), prompt_ids, temperature, top_p, max_new_tokens, repetition_penalty,
+                        StopStringMatcher(self.tokenizer, stop), cancel)
+        with self._condition:
+            if not self._running:
+                raise RuntimeError("Batch scheduler is not running.")
+            if len(self._pending) >= self.max_queue_size + self.max_batch_size:
+                raise InferenceQueueFullError(
+                    f"Batch scheduler queue is full ({len(self._pending)} requests waiting). Try again shortly."
+                )
+            self._pending.append(seq)
+            self._condition.notify()
+        return seq.future
+
+    async def generate(self, *args, **kwargs) -> Dict[str, Any]:
+        """Awaitable wrapper around submit()."""
+        return await asyncio.wrap_future(self.submit(*args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        """Aggregate throughput and latency figures since the scheduler started."""
+        with self._stats_lock:
+            completed = self._completed
+            return {
+                "running": self._running,
+                "active_sequences": len(self._active),
+                "pending_requests": len(self._pending),
+                "max_batch_size": self.max_batch_size,
+                "completed_requests": completed,
+                "failed_requests": self._failed,
+                "cancelled_requests": self._cancelled,
+                "tokens_generated": self._tokens_generated,
+                "decode_steps": self._decode_steps,
+                "average_batch_size": (self._batch_rows_decoded / self._decode_steps) if self._decode_steps else 0.0,
+                "busy_time": self._busy_time,
+                "throughput_tokens_per_second": (self._tokens_generated / self._busy_time) if self._busy_time else 0.0,
+                "average_latency": (self._latency_total / completed) if completed else 0.0,
+                "max_latency": self._latency_max,
+            }
+
+    # ------------------------------------------------------------------
+    # Scheduler thread
+    # ------------------------------------------------------------------
+    def _loop(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and not self._pending and not self._active and not self._draining:
+                    self._condition.wait()
+                if self._draining and not self._pending and not self._active:
+                    self._running = False
+                if not self._running:
+                    return
+                admitted = []
+                cancelled = [seq for seq in self._pending if seq.cancel is not None and seq.cancel.is_set()]
+                for seq in cancelled:
+                    self._pending.remove(seq)
+                while self._pending and len(self._active) + len(admitted) < self.max_batch_size:
+                    admitted.append(self._pending.popleft())
+            for seq in cancelled:
+                seq.finish_reason = "cancelled"
+                self._finish(seq)
+
+            step_started = time.perf_counter()
+            try:
+                with torch.no_grad():
+                    for seq in admitted:
+                        self._admit(seq)
+                    if self._active:
+                        self._decode_step()
+            except Exception as e:
+                print(f"❌ Batch scheduler step failed: {e}", file=sys.stderr)
+                self._fail_active(e)
+            finally:
+                with self._stats_lock:
+                    self._busy_time += time.perf_counter() - step_started
+
+    def _admit(self, seq: _Sequence) -> None:
+        """Prefills a new sequence and merges its KV cache into the running batch."""
+        seq.admitted_at = time.perf_counter()
+        input_ids = torch.tensor([seq.prompt_ids], device=self.input_device)
+        cache = DynamicCache()
+        try:
+            outputs = self.model(input_ids=input_ids, past_key_values=cache, use_cache=True)
+        except Exception as e:
+            self._finish(seq, error=e)
+            return
+        token = self._sample(seq, outputs.logits[:, -1, :])
+        seq.first_token_at = time.perf_counter()
+        seq.generated.append(token)
+        if self._is_finished(seq):
+            self._finish(seq)
+            return
+
+        new_mask = torch.ones((1, len(seq.prompt_ids)), dtype=torch.long, device=self.input_device)
+        if self._cache is None:
+            self._cache, self._attention_mask = outputs.past_key_values, new_mask
+        else:
+            self._cache, self._attention_mask = _merge_caches(
+                self._cache, self._attention_mask, outputs.past_key_values, new_mask
+            )
+        self._active.append(seq)
+        self._positions.append(len(seq.prompt_ids))
+
+    def _decode_step(self) -> None:
+        """Decodes one token for every active sequence and retires finished ones."""
+        batch = len(self._active)
+        input_ids = torch.tensor([[seq.generated[-1]] for seq in self._active], device=self.input_device)
+        attention_mask = torch.cat(
+            [self._attention_mask, torch.ones((batch, 1), dtype=self._attention_mask.dtype, device=self.input_device)],
+            dim=1,
+        )
+        position_ids = torch.tensor([[pos] for pos in self._positions], device=self.input_device)
+
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=self._cache,
+            use_cache=True,
+        )
+        self._cache = outputs.past_key_values
+        self._attention_mask = attention_mask
+        self._positions = [pos + 1 for pos in self._positions]
+
+        keep = []
+        for row, seq in enumerate(self._active):
+            seq.generated.append(self._sample(seq, outputs.logits[row:row + 1, -1, :]))
+            if self._is_finished(seq):
+                self._finish(seq)
+            else:
+                keep.append(row)
+
+        with self._stats_lock:
+            self._decode_steps += 1
+            self._batch_rows_decoded += batch
+
+        if len(keep) < batch:
+            self._retire(keep)
+
+    def _retire(self, keep: List[int]) -> None:
+        """Drops finished rows from the batch and trims padding nobody needs anymore."""
+        self._active = [self._active[row] for row in keep]
+        self._positions = [self._positions[row] for row in keep]
+        if not keep:
+            self._cache, self._attention_mask = None, None
+            return
+        index = torch.tensor(keep, device=self._attention_mask.device)
+        self._cache.batch_select_indices(index)
+        self._attention_mask = self._attention_mask[index]
+        real_columns = self._attention_mask.any(dim=0).nonzero()
+        first_real = int(real_columns[0]) if real_columns.numel() else 0
+        if first_real > 0:
+            _slice_cache(self._cache, first_real)
+            self._attention_mask = self._attention_mask[:, first_real:]
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    def _sample(self, seq: _Sequence, logits: torch.Tensor) -> int:
+        history = torch.tensor([seq.prompt_ids + seq.generated], device=logits.device)
+        scores = seq.processors(history, logits.float())
+        probs = torch.softmax(scores, dim=-1)
+        return int(torch.multinomial(probs, num_samples=1)[0, 0])
+
+    def _is_finished(self, seq: _Sequence) -> bool:
+        if seq.cancel is not None and seq.cancel.is_set():
+            seq.finish_reason = "cancelled"
+        elif seq.generated[-1] in self.eos_token_ids:
+            seq.finish_reason = "eos"
+        elif len(seq.generated) >= seq.max_new_tokens:
+            seq.finish_reason = "length"
+        elif seq.stop_matcher.matches(seq.generated):
+            seq.finish_reason = "stop"
+        return seq.finish_reason is not None
+
+    def _finish(self, seq: _Sequence, error: Optional[Exception] = None) -> None:
+        seq.finished_at = time.perf_counter()
+        timings = seq.timings()
+        if error is None and seq.finish_reason == "cancelled":
+            error = GenerationCancelledError(f"Generation cancelled after {len(seq.generated)} tokens.")
+        with self._stats_lock:
+            if isinstance(error, GenerationCancelledError):
+                self._cancelled += 1
+            elif error is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+                self._tokens_generated += len(seq.generated)
+                self._latency_total += timings["latency"]
+                self._latency_max = max(self._latency_max, timings["latency"])
+        if error is None:
+            observe_generation("batched", timings["prompt_tokens"], timings["completion_tokens"], timings["tokens_per_second"])
+        if seq.future.done():
+            return
+        if error is not None:
+            seq.future.set_exception(error)
+            return
+        text = self.tokenizer.decode(seq.generated, skip_special_tokens=True)
+        seq.future.set_result({"text": text, "finish_reason": seq.finish_reason, "timings": timings})
+
+    def _fail_active(self, error: Exception) -> None:
+        for seq in self._active:
+            self._finish(seq, error=error)
+        self._active, self._positions = [], []
+        self._cache, self._attention_mask = None, None
+
+    def _fail_all(self, error: Exception) -> None:
+        with self._condition:
+            pending = list(self._pending)
+            self._pending.clear()
+        for seq in pending:
+            self._finish(seq, error=error)
+        self._fail_active(error)
+
+
+def _left_pad(tensor: torch.Tensor, length: int, dim: int) -> torch.Tensor:
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    pad_shape = list(tensor.shape)
+    pad_shape[dim] = missing
+    return torch.cat([tensor.new_zeros(pad_shape), tensor], dim=dim)
+
+
+def _merge_caches(cache, mask, new_cache, new_mask):
+    """Concatenates two KV caches along the batch dim, left-padding the shorter one."""
+    length = max(mask.shape[1], new_mask.shape[1])
+    for layer in range(len(cache.key_cache)):
+        cache.key_cache[layer] = torch.cat(
+            [_left_pad(cache.key_cache[layer], length, 2), _left_pad(new_cache.key_cache[layer], length, 2)], dim=0
+        )
+        cache.value_cache[layer] = torch.cat(
+            [_left_pad(cache.value_cache[layer], length, 2), _left_pad(new_cache.value_cache[layer], length, 2)], dim=0
+        )
+    cache._seen_tokens = length
+    merged_mask = torch.cat([_left_pad(mask, length, 1), _left_pad(new_mask, length, 1)], dim=0)
+    return cache, merged_mask
+
+
+def _slice_cache(cache, start: int) -> None:
+    """Drops the first ``start`` positions (all padding) from every layer of the cache."""
+    for layer in range(len(cache.key_cache)):
+        cache.key_cache[layer] = cache.key_cache[layer][:, :, start:, :]
+        cache.value_cache[layer] = cache.value_cache[layer][:, :, start:, :]
+    cache._seen_tokens = cache.get_seq_length()
+
+
+# --- Module-level scheduler bound to the currently loaded model ---
+_scheduler: Optional[BatchScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_batch_scheduler(model: AutoModelForCausalLM, tokenizer: AutoTokenizer) -> BatchScheduler:
+    """Returns the running scheduler for ``model``, replacing one bound to an older model."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None and _scheduler.model is model:
+            return _scheduler
+        if _scheduler is not None:
+            _scheduler.drain()  # In-flight requests finish on the previous model
+        _scheduler = BatchScheduler(
+            model,
+            tokenizer,
+            max_batch_size=settings.max_batch_size,
+            max_queue_size=settings.inference_queue_size,
+        )
+        _scheduler.start()
+        return _scheduler
+
+
+def get_scheduler_stats() -> Optional[Dict[str, Any]]:
+    """Stats of the current scheduler, or None if batching has not been used yet."""
+    scheduler = _scheduler
+    return scheduler.stats() if scheduler is not None else None
+
+
+def shutdown_batch_scheduler() -> None:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.stop()
+            _scheduler = None
@@ -0,0 +1,199 @@
+import bisect
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# Index entries keep this much of the first user message: enough for the sidebar
+# title (50 characters plus "..." when longer)
+FIRST_MESSAGE_CHARS = 51
+
+
+def index_entry(session_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The listing fields of a session: what the sidebar shows without opening it."""
+    messages = session_data.get("messages")
+    if not isinstance(messages, list):
+        messages = []
+    first_user_message = next((m.get("content") for m in messages if m.get("role") == "user"), None)
+    metadata = session_data.get("metadata") or {}
+    return {
+        "custom_title": session_data.get("custom_title"),
+        "first_user_message": first_user_message[:FIRST_MESSAGE_CHARS] if first_user_message else None,
+        "created_at": metadata.get("created_at"),
+        "last_updated": metadata.get("last_updated"),
+        "message_count": len(messages),
+    }
+
+
+def recency_key(thread_id: str, entry: Dict[str, Any]) -> Tuple[str, str]:
+    """Listing order (newest first) is descending by this key; it is also the page cursor."""
+    return entry.get("last_updated") or entry.get("created_at") or "", thread_id
+
+
+def title_key(entry: Dict[str, Any]) -> str:
+    """What title_prefix filters match: the custom title, else the first user message."""
+    return (entry.get("custom_title") or entry.get("first_user_message") or "").lower()
+
+
+class SessionIndex:
+    """Persistent listing index of the JSON session files.
+
+    The index is a journal of JSON lines next to the sessions: each write path
+    appends the new entry of the session it touched (or a deletion), so an update
+    costs one small append instead of a rewrite. Reading folds the journal into a
+    dict that is kept in memory until the file changes on disk. Once the journal
+    holds far more lines than sessions it is rewritten with one line per session.
+    A missing index is rebuilt from the session files by the caller.
+
+    Next to the dict two sorted lists (by recency and by title) are kept up to date
+    with bisect, so page() finds a page without looking at the other sessions.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._by_recency: List[Tuple[str, str]] = []  # Ascending recency_key()
+        self._by_title: List[Tuple[str, str]] = []  # Ascending (title_key(), thread_id)
+        self._lines = 0
+        self._stamp: Optional[Tuple[int, int]] = None  # (size, mtime_ns) of the journal we last read or wrote
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        """thread_id -> entry for every indexed session (a copy)."""
+        with self._lock:
+            self._load()
+            return dict(self._entries)
+
+    def put(self, thread_id: str, entry: Dict[str, Any]) -> None:
+        self._append({"thread_id": thread_id, **entry})
+
+    def remove(self, thread_id: str) -> None:
+        self._append({"thread_id": thread_id, "deleted": True})
+
+    def page(
+        self,
+        limit: int,
+        before: Optional[Tuple[str, str]] = None,
+        updated_after: Optional[str] = None,
+        updated_before: Optional[str] = None,
+        title_prefix: Optional[str] = None,
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """Up to ``limit`` (thread_id, entry) pairs, newest first, whose recency_key() is
+        below ``before`` and whose timestamp is in [updated_after, updated_before).
+
+        Costs O(log n + limit); with ``title_prefix`` O(log n + m log m) for the m
+        sessions whose title starts with it.
+        """
+        with self._lock:
+            self._load()
+            if title_prefix is None:
+                lo = 0 if updated_after is None else bisect.bisect_left(self._by_recency, (updated_after, ""))
+                hi = len(self._by_recency)
+                if updated_before is not None:
+                    hi = bisect.bisect_left(self._by_recency, (updated_before, ""), lo, hi)
+                if before is not None:
+                    hi = bisect.bisect_left(self._by_recency, tuple(before), lo, hi)
+                keys = self._by_recency[max(lo, hi - limit):hi]
+                keys.reverse()
+            else:
+                prefix = title_prefix.lower()
+                start = bisect.bisect_left(self._by_title, (prefix, ""))
+                stop = bisect.bisect_left(self._by_title, (prefix + "\U0010ffff", ""), start)
+                keys = []
+                for _, thread_id in self._by_title[start:stop]:
+                    key = recency_key(thread_id, self._entries[thread_id])
+                    if updated_after is not None and key[0] < updated_after:
+                        continue
+                    if updated_before is not None and key[0] >= updated_before:
+                        continue
+                    if before is not None and key >= tuple(before):
+                        continue
+                    keys.append(key)
+                keys = sorted(keys, reverse=True)[:limit]
+            return [(thread_id, dict(self._entries[thread_id])) for _, thread_id in keys]
+
+    def replace_all(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        """Rewrites the journal with exactly ``entries`` (rebuilds and compaction)."""
+        with self._lock:
+            self._write_all(dict(entries))
+
+    # ------------------------------------------------------------------
+    def _append(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._load()
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+            self._lines += 1
+            thread_id = record["thread_id"]
+            self._unsort(thread_id)
+            self._apply(self._entries, record)
+            if thread_id in self._entries:
+                entry = self._entries[thread_id]
+                bisect.insort(self._by_recency, recency_key(thread_id, entry))
+                bisect.insort(self._by_title, (title_key(entry), thread_id))
+            self._stamp = self._stat()
+            if self._lines > 2 * len(self._entries) + 64:
+                self._write_all(self._entries)
+
+    def _load(self) -> None:
+        stamp = self._stat()
+        if self._entries is not None and stamp == self._stamp:
+            return
+        entries: Dict[str, Dict[str, Any]] = {}
+        lines = 0
+        if stamp is not None:
+            with open(self.path, "r") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        self._apply(entries, json.loads(line))
+                    except (json.JSONDecodeError, AttributeError, KeyError):
+                        # e.g. a line cut short by a crash mid-append
+                        logging.warning(f"Skipping unreadable line {lines} of session index {self.path}")
+        self._set_entries(entries)
+        self._lines, self._stamp = lines, stamp
+
+    def _write_all(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for thread_id, entry in entries.items():
+                f.write(json.dumps({"thread_id": thread_id, **entry}) + "\n")
+        os.replace(tmp_path, self.path)
+        self._set_entries(entries)
+        self._lines, self._stamp = len(entries), self._stat()
+
+    def _set_entries(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        self._entries = entries
+        self._by_recency = sorted(recency_key(thread_id, entry) for thread_id, entry in entries.items())
+        self._by_title = sorted((title_key(entry), thread_id) for thread_id, entry in entries.items())
+
+    def _unsort(self, thread_id: str) -> None:
+        """Takes a session's current keys out of the sorted lists."""
+        entry = self._entries.get(thread_id)
+        if entry is None:
+            return
+        for keys, key in ((self._by_recency, recency_key(thread_id, entry)), (self._by_title, (title_key(entry), thread_id))):
+            i = bisect.bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def _apply(entries: Dict[str, Dict[str, Any]], record: Dict[str, Any]) -> None:
+        record = dict(record)
+        thread_id = record.pop("thread_id")
+        if record.pop("deleted", False):
+            entries.pop(thread_id, None)
+        else:
+            entries[thread_id] = record
+
@@ -6,7 +6,7 @@ from typing import Literal
 
 from .config import settings, PrecisionType  # noqa: F401  (re-export)
 
-VALID_PRECISIONS = {"fp32", "fp16"}
+VALID_PRECISIONS = {"fp32", "fp16", "bf16", "int8"}
 
 
 def get_precision() -> PrecisionType:  # type: ignore[override]
@@ -0,0 +1,60 @@
+from typing import Any, List, Optional
+
+import torch
+from transformers import StoppingCriteria
+
+from .cleaner import DEFAULT_STOP_TOKENS
+
+
+class StopStringMatcher:
+    """Detects a stop string at the end of a growing list of generated token ids.
+
+    Only a tail window of tokens is decoded on each check, so the cost per step does
+    not grow with the response. Matching is done on decoded text, which means stop
+    strings split across several tokens (e.g. ``"\\n"`` + ``"User"`` + ``":"``) are
+    found as soon as their last piece is generated.
+    """
+
+    def __init__(self, tokenizer: Any, stop_strings: Optional[List[str]] = None):
+        self.tokenizer = tokenizer
+        self.stop_strings = [s for s in (stop_strings or DEFAULT_STOP_TOKENS) if s]
+        # A character can take several byte-level tokens, so leave generous headroom
+        longest = max((len(s) for s in self.stop_strings), default=0)
+        self.window = 4 * longest + 4
+
+    def matches(self, generated_ids: List[int]) -> bool:
+        if not self.stop_strings or not generated_ids:
+            return False
+        tail = self.tokenizer.decode(generated_ids[-self.window:], skip_special_tokens=True)
+        return any(s in tail for s in self.stop_strings)
+
+
+class StopSequenceCriteria(StoppingCriteria):
+    """model.generate stopping criterion backed by a StopStringMatcher.
+
+    ``prompt_length`` is the number of input ids passed to generate(); only tokens
+    after it are checked. ``stopped_at`` records how many tokens had been generated
+    when a stop string first appeared (None if it never did).
+    """
+
+    def __init__(self, matcher: StopStringMatcher, prompt_length: int):
+        self.matcher = matcher
+        self.prompt_length = prompt_length
+        self.stopped_at: Optional[int] = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        done = [self.matcher.matches(row[self.prompt_length:].tolist()) for row in input_ids]
+        if any(done) and self.stopped_at is None:
+            self.stopped_at = input_ids.shape[1] - self.prompt_length
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class CancellationCriteria(StoppingCriteria):
+    """Stops model.generate at the next decode step once ``token.is_set()`` (a CancelToken
+    or threading.Event) becomes true."""
+
+    def __init__(self, token: Any):
+        self.token = token
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.token.is_set(), dtype=torch.bool, device=input_ids.device)
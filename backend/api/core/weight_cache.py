@@ -0,0 +1,158 @@
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import torch
+
+# Converted weights are cached next to the checkpoint they came from:
+#   <model dir>/.sigil_cache/<precision>/   safetensors in the final dtype (fp32/fp16/bf16)
+#   <model dir>/.sigil_cache/int8-dynamic.* quantized state dict (see quantization.py)
+CACHE_DIR_NAME = ".sigil_cache"
+CONVERTED_CACHE_FORMAT = "sigil-converted-1"
+META_FILE = "sigil_cache.json"
+
+_SOURCE_WEIGHT_SUFFIXES = (".safetensors", ".bin", ".pt", ".pth")
+
+
+def cache_dir(model_path: str) -> str:
+    """Directory holding converted weights of the checkpoint at ``model_path``."""
+    return os.path.join(model_path, CACHE_DIR_NAME)
+
+
+def source_fingerprint(model_path: str) -> Dict[str, Any]:
+    """Identifies the checkpoint files a cached conversion was made from.
+
+    Any change to a weight file or config.json (size or mtime), or a different torch
+    version, invalidates the cache.
+    """
+    files = {}
+    for name in sorted(os.listdir(model_path)):
+        if name == "config.json" or name.endswith(_SOURCE_WEIGHT_SUFFIXES):
+            stat = os.stat(os.path.join(model_path, name))
+            files[name] = [stat.st_size, stat.st_mtime_ns]
+    return {"files": files, "torch": torch.__version__}
+
+
+def is_fresh(meta_path: str, cache_format: str, model_path: str) -> bool:
+    """Whether the cache described by ``meta_path`` was written from the current checkpoint."""
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return meta.get("format") == cache_format and meta.get("source") == source_fingerprint(model_path)
+
+
+def write_meta(meta_path: str, cache_format: str, model_path: str) -> None:
+    with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"format": cache_format, "source": source_fingerprint(model_path), "created_at": time.time()}, f)
+    os.replace(f"{meta_path}.tmp", meta_path)
+
+
+# --- Converted (dtype-cast) safetensors checkpoints ---
+def converted_dir(model_path: str, precision: str) -> str:
+    return os.path.join(cache_dir(model_path), precision)
+
+
+def cached_checkpoint(model_path: str, precision: str) -> Optional[str]:
+    """Returns the directory of an up-to-date converted checkpoint for ``precision``, else None.
+
+    Loading from it is an mmap of safetensors already in the final dtype: no
+    unpickling and no dtype conversion.
+    """
+    directory = converted_dir(model_path, precision)
+    if not is_fresh(os.path.join(directory, META_FILE), CONVERTED_CACHE_FORMAT, model_path):
+        return None
+    if not any(name.endswith(".safetensors") for name in os.listdir(directory)):
+        return None
+    return directory
+
+
+def needs_conversion(model_path: str, torch_dtype: torch.dtype) -> bool:
+    """Whether loading ``model_path`` as ``torch_dtype`` unpickles or casts weights.
+
+    Safetensors checkpoints already stored in the target dtype load as fast as a
+    cache would, so they are not duplicated.
+    """
+    names = os.listdir(model_path)
+    if not any(name.endswith(".safetensors") for name in names):
+        return True  # .bin/.pt checkpoints are unpickled into RAM on every load
+    try:
+        with open(os.path.join(model_path, "config.json"), "r", encoding="utf-8") as f:
+            stored_dtype = json.load(f).get("torch_dtype")
+    except (OSError, ValueError):
+        stored_dtype = None
+    return stored_dtype != str(torch_dtype).replace("torch.", "")
+
+
+def save_converted(model_path: str, precision: str, model: Any) -> bool:
+    """Writes ``model``'s weights as safetensors to the cache for ``precision``.
+
+    The checkpoint is written to a temporary directory, stamped with the source
+    fingerprint and renamed into place, so readers never see a partial cache.
+    Returns False if the cache could not be written (e.g. read-only model directory).
+    """
+    directory = converted_dir(model_path, precision)
+    tmp_directory = f"{directory}.tmp"
+    write_start = time.perf_counter()
+    try:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        model.save_pretrained(tmp_directory, safe_serialization=True)
+        write_meta(os.path.join(tmp_directory, META_FILE), CONVERTED_CACHE_FORMAT, model_path)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_directory, directory)
+    except Exception as e:
+        print(f"   ⚠️ Could not cache converted {precision} weights in '{directory}': {e}", file=sys.stderr)
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        return False
+    print(f"   ✅ Cached {precision} weights in '{directory}' ({time.perf_counter() - write_start:.2f}s).")
+    return True
+
+
+_pending_saves = set()
+_pending_saves_lock = threading.Lock()
+
+
+def save_converted_in_background(model_path: str, precision: str, model: Any) -> Optional[threading.Thread]:
+    """Runs save_converted() on a daemon thread, so the load that triggered it doesn't wait
+    for the copy. Returns the thread, or None when a save of the same cache is already running.
+    """
+    key = (model_path, precision)
+    with _pending_saves_lock:
+        if key in _pending_saves:
+            return None
+        _pending_saves.add(key)
+
+    def run():
+        try:
+            save_converted(model_path, precision, model)
+        finally:
+            with _pending_saves_lock:
+                _pending_saves.discard(key)
+
+    thread = threading.Thread(target=run, name=f"sigil-convert-{precision}", daemon=True)
+    thread.start()
+    return thread
+
+
+# --- Cold vs warm load times ---
+_load_times: Dict[str, Dict[str, Any]] = {}
+_load_times_lock = threading.Lock()
+
+
+def record_load_time(model_path: str, precision: str, seconds: float, warm: bool) -> None:
+    """Records a load from the source checkpoint (cold) or from the converted cache (warm)."""
+    with _load_times_lock:
+        entry = _load_times.setdefault(f"{model_path}|{precision}", {
+            "model_path": model_path, "precision": precision, "cold_load_time": None, "warm_load_time": None,
+        })
+        entry["warm_load_time" if warm else "cold_load_time"] = seconds
+
+
+def load_time_stats() -> Dict[str, Any]:
+    with _load_times_lock:
+        return {"models": [dict(entry) for entry in _load_times.values()]}
@@ -1,17 +1,30 @@
 from fastapi import FastAPI, HTTPException, status, Request
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import torch
 import os
 import sys
 from contextlib import asynccontextmanager
-from .core.model_loader import load_model_internal, load_model_by_name
+from .core.model_loader import (
+    load_model_internal, load_model_by_name, get_model_load_time, model_registry, model_swap_lock, finish_model_swap,
+    checkpoint_files, model_key_for_name, get_active_model_entry,
+)
+from .core.load_jobs import load_jobs, FAILED, CANCELLED
+from .core.inference import warm_up_model
+from .core.executor import inference_executor
+from .core.admission import admission_controller
+from .core.cancellation import DisconnectMiddleware
+from .core.scheduler import shutdown_batch_scheduler, get_scheduler_stats
+from .core.prefix_cache import start_idle_sweeper, stop_idle_sweeper
+from .core.gpu_check import get_cuda_memory
+from .core.metrics import MetricsMiddleware, render_gauge, render_registry
 from .routes.chat import router as chat_router
 from .routes.settings import router as settings_router
 from .routes.models import router as models_router
 from .routes.system import router as system_router
 
-from backend.api.schemas.common import VRAMInfoResponse
+from backend.api.schemas.common import VRAMInfoResponse, LoadJobRequest
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
@@ -34,8 +47,13 @@ async def lifespan(app: FastAPI):
     app.state.top_p = settings.default_top_p
     app.state.max_new_tokens = settings.default_max_new_tokens
     app.state.repetition_penalty = settings.default_repetition_penalty
+    start_idle_sweeper() # No-op unless SIGIL_KV_SNAPSHOTS_ENABLED
+    _start_default_model_preload() # No-op unless SIGIL_PRELOAD_DEFAULT_MODEL and a default model are set
     yield
     # Shutdown logic (if any) can go here
+    inference_executor.shutdown(wait=False)
+    shutdown_batch_scheduler()
+    stop_idle_sweeper() # Writes remaining thread caches to disk
     print("Shutting down API.") # Optional shutdown message
 
 app = FastAPI(
@@ -64,6 +82,11 @@ app.add_middleware(
     allow_headers=["*"],         # Allow all HTTP headers
 )
 
+# Per-router request counts and latency for /metrics
+app.add_middleware(MetricsMiddleware)
+# Lets running generations notice that their client has gone away
+app.add_middleware(DisconnectMiddleware)
+
 # --- Theme Listing Endpoint ---
 @app.get("/themes")
 def list_themes():
@@ -86,6 +109,28 @@ def list_models():
 
 # --- API Endpoints --- (Organized and updated)
 
+def _publish_model(app_state, tokenizer, model, device, model_path):
+    """Makes a freshly loaded model the one chat requests use."""
+    # Atomic with respect to requests picking up the model
+    with model_swap_lock:
+        app_state.tokenizer = tokenizer
+        app_state.model = model
+        app_state.device = device
+        app_state.model_path = model_path
+    finish_model_swap() # Hot swap: free the previous model once its requests drain
+
+def _load_and_wait(path, model_name, load_fn=None):
+    """Loads and publishes a model as a load job and waits for it (the synchronous endpoints).
+
+    Raises whatever the load raised (ValueError for a bad path, RuntimeError on failure).
+    """
+    def publish(job, tokenizer, model, device):
+        _publish_model(app.state, tokenizer, model, device, model_name)
+        job.load_time = get_model_load_time()
+
+    job = load_jobs.submit(model_name, path, checkpoint_files(path), load_fn or load_model_internal, publish)
+    return load_jobs.wait(job)
+
 # Endpoint to load the model
 @app.post("/api/v1/model/load", status_code=status.HTTP_200_OK)
 def load_model_endpoint(req: Request):
@@ -98,18 +143,14 @@ def load_model_endpoint(req: Request):
         if not model_path_to_load:
             raise ValueError("Model path is required")
 
-        tokenizer, model, device = load_model_internal(model_path_to_load)
-
-        # Update app state
-        app.state.tokenizer = tokenizer
-        app.state.model = model
-        app.state.device = device
-        app.state.model_path = model_path_to_load # Store the path used
+        # Queued behind any running load job so loads never interleave
+        _load_and_wait(model_path_to_load, model_path_to_load) # Store the path used
 
         return {
             "message": "Model loaded successfully.",
             "path": app.state.model_path,
-            "device": app.state.device
+            "device": app.state.device,
+            "load_time": get_model_load_time()
         }
 
     except ValueError as ve:
@@ -134,19 +175,17 @@ async def load_model_by_name_route(model_name: str, request: Request):
     #     )
     try:
         print(f"Received request to load model: {model_name}")
-        tokenizer, model, device = load_model_by_name(model_name)
-
-        # Update app state
-        request.app.state.tokenizer = tokenizer
-        request.app.state.model = model
-        request.app.state.device = device
+        # Loading takes a while; keep it off the event loop so chats keep being served
         # Use model_name or resolved path for model_path state? Using name for now.
-        request.app.state.model_path = model_name
+        job = await run_in_threadpool(
+            _load_and_wait, model_key_for_name(model_name), model_name, lambda _path: load_model_by_name(model_name)
+        )
+        device = job.device
         # Clear previous settings potentially? Or keep them?
         # request.app.state.system_prompt = "Default prompt for new model" # Example
 
         print(f"✅ Successfully loaded model '{model_name}' on device '{device}'")
-        return {"status": "ok", "message": f"Model '{model_name}' loaded successfully.", "device": device}
+        return {"status": "ok", "message": f"Model '{model_name}' loaded successfully.", "device": device, "load_time": get_model_load_time()}
 
     except ValueError as ve:
         # Specific error for unknown model name or invalid path from registry
@@ -162,11 +201,97 @@ async def load_model_by_name_route(model_name: str, request: Request):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred: {e}")
 # --- End New Endpoint ---
 
+# --- NEW: Asynchronous model load jobs ---
+@app.post("/api/v1/model/jobs", status_code=status.HTTP_202_ACCEPTED)
+def submit_load_job(req: LoadJobRequest):
+    """Queues a model load and returns its job right away; poll GET /api/v1/model/jobs/{job_id}."""
+    if bool(req.model_name) == bool(req.path):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Provide exactly one of 'model_name' or 'path'.")
+    model_name = req.model_name or req.path
+    # Same registry key as the synchronous loads, so the job's model is found by name afterwards
+    path = model_key_for_name(req.model_name) if req.model_name else req.path
+
+    def publish(job, tokenizer, model, device):
+        _publish_model(app.state, tokenizer, model, device, model_name)
+        job.load_time = get_model_load_time()
+
+    job = load_jobs.submit(model_name, path, checkpoint_files(path), load_model_internal, publish)
+    return job.to_dict()
+
+@app.get("/api/v1/model/jobs")
+def list_load_jobs():
+    """Queued, running and recently finished load jobs, newest first."""
+    return load_jobs.list()
+
+@app.get("/api/v1/model/jobs/{job_id}")
+def get_load_job(job_id: str):
+    """State and shard/byte progress of one load job."""
+    job = load_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Load job '{job_id}' not found.")
+    return job.to_dict()
+
+@app.post("/api/v1/model/jobs/{job_id}/cancel")
+def cancel_load_job(job_id: str):
+    """Cancels a queued job, or a running one at the next tensor it loads."""
+    job = load_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Load job '{job_id}' not found.")
+    return job.to_dict()
+# --- END NEW ---
+
 # Simplified health check
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
+# --- NEW: Startup preload of the default model + readiness ---
+# state: not_configured | loading | warming_up | ready | failed
+_readiness = {"state": "not_configured", "model": None, "job_id": None, "warmup_time": None, "error": None}
+
+def _default_model_location():
+    """Returns ``(model_name, path)`` for settings.default_model_path.
+
+    A bare name refers to a directory in the model base directory; anything else is
+    used as a path.
+    """
+    configured = settings.default_model_path
+    candidate = os.path.join(settings.model_base_directory, configured)
+    if not os.path.isabs(configured) and os.path.isdir(candidate):
+        return configured, candidate
+    return configured, configured
+
+def _start_default_model_preload():
+    """Queues the default model as a load job; it is warmed up before being published."""
+    if not settings.preload_default_model or not settings.default_model_path:
+        return
+    model_name, path = _default_model_location()
+
+    def publish(job, tokenizer, model, device):
+        _readiness["state"] = "warming_up"
+        _readiness["warmup_time"] = warm_up_model(model, tokenizer, device)
+        _publish_model(app.state, tokenizer, model, device, model_name)
+        job.load_time = get_model_load_time()
+        _readiness["state"] = "ready"
+        print(f"✅ Default model '{model_name}' preloaded and warm ({_readiness['warmup_time']:.2f}s warm-up).")
+
+    print(f"⏳ Preloading default model '{model_name}' in the background...")
+    job = load_jobs.submit(model_name, path, checkpoint_files(path), load_model_internal, publish)
+    _readiness.update({"state": "loading", "model": model_name, "job_id": job.id})
+
+# Readiness differs from /health: it stays 503 until the startup preload has warmed up
+@app.get("/ready")
+def readiness_check():
+    if _readiness["state"] in ("loading", "warming_up"):
+        job = load_jobs.get(_readiness["job_id"])
+        if job is not None and job.state in (FAILED, CANCELLED):
+            _readiness.update({"state": "failed", "error": job.error or f"Preload {job.state}."})
+    body = dict(_readiness)
+    if body["state"] in ("ready", "not_configured"):
+        return {"status": "ready", **body}
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"status": "not_ready", **body})
+# --- END NEW ---
+
 # VRAM endpoint - check device status
 @app.get("/api/v1/vram", response_model=VRAMInfoResponse)
 def get_vram_info():
@@ -179,18 +304,15 @@ def get_vram_info():
 
     if app.state.device == 'cuda' and torch.cuda.is_available():
         try:
-            total_mem = torch.cuda.get_device_properties(0).total_memory
-            reserved_mem = torch.cuda.memory_reserved(0)
-            allocated_mem = torch.cuda.memory_allocated(0)
-            free_mem = reserved_mem - allocated_mem
+            cuda_memory = get_cuda_memory()
             gb = 1024**3
             return {
                 "status": "ok",
-                "device": torch.cuda.get_device_name(0),
-                "total_gb": round(total_mem / gb, 2),
-                "reserved_gb": round(reserved_mem / gb, 2),
-                "allocated_gb": round(allocated_mem / gb, 2),
-                "free_in_reserved_gb": round(free_mem / gb, 2)
+                "device": cuda_memory["device_name"],
+                "total_gb": round(cuda_memory["total"] / gb, 2),
+                "reserved_gb": round(cuda_memory["reserved"] / gb, 2),
+                "allocated_gb": round(cuda_memory["allocated"] / gb, 2),
+                "free_in_reserved_gb": round(cuda_memory["free_in_reserved"] / gb, 2)
             }
         except Exception as e:
             return {
@@ -209,6 +331,66 @@ def get_vram_info():
             "message": "CUDA not available or device is not CUDA. No VRAM info.",
         }
 
+# --- NEW: Prometheus-style metrics ---
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text exposition. Counters/histograms are kept in-process; the gauges
+    below are read at scrape time and never touch the model or the GPU stream."""
+    lines = render_registry()
+
+    scheduler_stats = get_scheduler_stats() or {}
+    lines += render_gauge("sigil_inference_queue_depth", "Requests waiting for an inference slot.", [
+        ({"queue": "executor"}, inference_executor.queue_depth),
+        ({"queue": "batch_scheduler"}, scheduler_stats.get("pending_requests", 0)),
+    ])
+    lines += render_gauge("sigil_inference_in_flight", "Requests queued or running.", [
+        ({"queue": "executor"}, inference_executor.outstanding),
+        ({"queue": "batch_scheduler"}, scheduler_stats.get("active_sequences", 0) + scheduler_stats.get("pending_requests", 0)),
+    ])
+    admission_stats = admission_controller.stats()
+    lines += render_gauge("sigil_admission_active", "Generations admitted and running.", [({}, admission_stats["active"])])
+    lines += render_gauge("sigil_admission_waiting", "Requests waiting for admission.", [({}, admission_stats["waiting"])])
+    lines += render_gauge("sigil_admission_reserved_bytes", "Estimated KV/activation memory of admitted generations.", [
+        ({}, admission_stats["reserved_bytes"]),
+    ])
+    lines += render_gauge("sigil_admission_rejections_total", "Requests turned away by admission control.", [
+        ({"reason": "queue_full"}, admission_stats["rejected_queue_full"]),
+        ({"reason": "timeout"}, admission_stats["rejected_timeout"]),
+    ], metric_type="counter")
+    lines += render_gauge("sigil_model_load_duration_seconds", "Time the loaded model took to load onto its device.", [
+        ({}, get_model_load_time()),
+    ])
+    model_path = getattr(app.state, "model_path", None)
+    # The precision the weights were loaded in: settings.model_precision may have changed since
+    active = get_active_model_entry()
+    lines += render_gauge("sigil_model_loaded", "1 for the loaded model, labelled with its precision and device.", [
+        ({
+            "model": str(model_path),
+            "precision": str(active.variant if active else None),
+            "device": str(active.device if active else getattr(app.state, "device", None)),
+        }, 1),
+    ] if model_path else [])
+
+    registry_stats = model_registry.stats()
+    lines += render_gauge("sigil_resident_models", "Models kept loaded by the model registry.", [({}, len(registry_stats["resident"]))])
+    lines += render_gauge("sigil_resident_model_bytes", "Weight memory of the resident models.", [({}, registry_stats["resident_bytes"])])
+    lines += render_gauge("sigil_model_registry_events_total", "Model registry lookups, loads and evictions.", [
+        ({"event": event}, registry_stats[event]) for event in ("hits", "misses", "loads", "load_failures", "evictions")
+    ], metric_type="counter")
+
+    try:
+        cuda_memory = get_cuda_memory()
+    except Exception as e:
+        print(f"⚠️ Could not read CUDA memory for /metrics: {e}", file=sys.stderr)
+        cuda_memory = None
+    if cuda_memory is not None:
+        lines += render_gauge("sigil_cuda_memory_bytes", "CUDA memory of device 0.", [
+            ({"kind": kind}, cuda_memory[kind]) for kind in ("total", "reserved", "allocated", "free_in_reserved")
+        ])
+
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+# --- END NEW ---
+
 # Chat endpoint - check if model is loaded
 MIN_NARRATIVE_TOKENS = 350  # Keep constant here if needed elsewhere, or move to config
 
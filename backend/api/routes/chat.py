@@ -1,7 +1,14 @@
 import sys
 import os
-from fastapi import APIRouter, HTTPException, status, Request, Response
-from typing import Optional, List, Dict, Any
+import json
+import time
+import uuid
+from datetime import datetime
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, status, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from types import SimpleNamespace
+from typing import Optional, List, Dict, Any, Union
 from pydantic import BaseModel
 
 # Import Pydantic models from schemas.chat
@@ -10,11 +17,20 @@ from ..schemas.chat import (
 )
 
 # Import core logic functions using relative paths
-from ..core.inference import generate_response
-from ..core.prompt_builder import generate_prompt
-from ..core.cleaner import truncate_at_stop_token, clean_response
+from ..core.inference import generate_response, stream_response
+from ..core.executor import inference_executor, InferenceQueueFullError
+from ..core.admission import admission_controller, generation_cost, AdmissionRejectedError
+from ..core.cancellation import cancellations, client_disconnected, GenerationCancelledError
+from ..core.scheduler import get_batch_scheduler
+from ..core.prefix_cache import prefix_cache
+from ..core.model_loader import get_draft_model, lease_model_for_request, is_active_model, model_registry, model_swap_lock
+from ..core.model_registry import ModelBudgetError
+from ..core.config import settings
+from ..core.prompt_builder import model_context_window
+from ..core.prompt_cache import prompt_segments
+from ..core.cleaner import truncate_at_stop_token, clean_response, stop_token_holdback
 from ..core.history_manager import (
-    save_chat_messages, get_session, list_sessions, delete_session, update_session_title,
+    save_chat_messages, get_session, list_sessions, list_sessions_page, delete_session, update_session_title,
     edit_chat_message
 )
 
@@ -34,13 +50,18 @@ class EditMessageRequest(BaseModel):
 @router.post("/chat", response_model=ChatResponse)
 def chat(req: ChatRequest, request: Request): # Add request: Request
     app_state = request.app.state # Access app state
-    # Check if model is loaded
-    if not app_state.model or not app_state.tokenizer:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail="Model is not loaded. Please use the /model/load endpoint first."
-        )
-    
+    # Check if model is loaded (or load the model the request names)
+    target = _resolve_target_model(req, app_state)
+    try:
+        cancel = _register_cancellation(req, request)
+        try:
+            return _chat_on_target(req, target, cancel)
+        finally:
+            cancellations.release(cancel)
+    finally:
+        _release_target(target)
+
+def _chat_on_target(req: ChatRequest, target, cancel) -> ChatResponse:
     # Use the core module to generate a prompt
     messages = []
     if req.system_prompt:
@@ -53,27 +74,59 @@ def chat(req: ChatRequest, request: Request): # Add request: Request
     else:
         messages.append({"role": "user", "content": req.message})
     
-    prompt = generate_prompt(
+    cache_key = _prefix_cache_key(req)
+    prompt = prompt_segments.render(
+        cache_key,
         mode="chat",
         system_prompt=req.system_prompt,
-        tokenizer=app_state.tokenizer,
-        messages=messages
+        tokenizer=target.tokenizer,
+        messages=messages,
+        context_window=model_context_window(target.model, target.tokenizer),
+        max_new_tokens=req.max_tokens
     )
     
-    # Call inference with the generated prompt
-    raw_response = generate_response(
-        app_state.model, 
-        app_state.tokenizer, 
-        app_state.device,
-        prompt,
-        req.temperature,
-        req.top_p,
-        req.max_tokens,
-        req.repetition_penalty
-    )
+    draft_model = _resolve_draft_model(req, target)
+
+    # Call inference with the generated prompt on the shared inference executor.
+    # This endpoint is sync (FastAPI runs it in its threadpool), so block on the future.
+    ticket = _admit_generation(target, prompt, req.max_tokens, cancel)
+    try:
+        if target.batched:
+            raw_response = get_batch_scheduler(target.model, target.tokenizer).submit(
+                prompt,
+                req.temperature,
+                req.top_p,
+                req.max_tokens,
+                req.repetition_penalty,
+                req.stop,
+                cancel=cancel,
+                prompt_ids=prompt_segments.encode(cache_key, prompt, target.tokenizer)
+            ).result()["text"]
+        else:
+            raw_response = inference_executor.submit(
+                generate_response,
+                target.model, 
+                target.tokenizer, 
+                target.device,
+                prompt,
+                req.temperature,
+                req.top_p,
+                req.max_tokens,
+                req.repetition_penalty,
+                cache_key=cache_key,
+                stop=req.stop,
+                assistant_model=draft_model,
+                cancel=cancel
+            ).result()
+    except InferenceQueueFullError as e:
+        raise _queue_full_exception(e)
+    except GenerationCancelledError as e:
+        raise _cancelled_exception(e)
+    finally:
+        admission_controller.release(ticket)
     
-    # First truncate at stop tokens if provided
-    truncated_response = truncate_at_stop_token(raw_response, req.stop) if req.stop else raw_response
+    # First truncate at stop tokens (the default list when none were provided)
+    truncated_response = truncate_at_stop_token(raw_response, req.stop)
     
     # Then clean the response (remove speaker tags)
     content = clean_response(truncated_response)
@@ -108,8 +161,11 @@ def chat(req: ChatRequest, request: Request): # Add request: Request
                 "top_p": req.top_p,
                 "stop": req.stop
             },
-            system_prompt=req.system_prompt
+            system_prompt=req.system_prompt,
+            # Only the single message is new; a messages list repeats what the thread already holds
+            dedupe=bool(req.messages)
         )
+    _settle_prefix_cache(cache_key, thread_id)
     
     # Return properly formatted response to the user
     return ChatResponse(
@@ -117,69 +173,323 @@ def chat(req: ChatRequest, request: Request): # Add request: Request
         thread_id=thread_id
     )
 
-# Chat version 2 endpoint with extended functionality
-@router.post("/chat/v2", response_model=ChatResponseV2)
-async def chat_v2(req: ChatRequestV2, request: Request):
-    """Enhanced chat endpoint with additional features for narrative generation."""
-    try:
-        app_state = request.app.state
+# --- Helpers shared by the chat v2 endpoints ---
+def _build_v2_prompt(req: ChatRequestV2, target, cache_key: Optional[str] = None) -> str:
+    """Validates the request messages and renders the prompt for a v2 chat request.
+
+    With a ``cache_key`` the thread's cached message segments are reused (see prompt_cache).
+    """
+    # Debug info before generating prompt
+    print(f"DEBUG: Generating prompt with mode={req.mode}", file=sys.stderr)
+    print(f"DEBUG: message={req.message}", file=sys.stderr)
+    print(f"DEBUG: system_prompt={req.system_prompt}", file=sys.stderr)
+    print(f"DEBUG: messages={req.messages}", file=sys.stderr)
+    
+    # Validate the messages list before passing to generate_prompt
+    validated_messages = []
+    if req.messages:
+        try:
+            validated_messages = [
+                {"role": msg.role, "content": msg.content}
+                for msg in req.messages
+                if msg and hasattr(msg, 'role') and hasattr(msg, 'content')
+            ]
+        except Exception as msg_error:
+            print(f"WARNING: Error validating messages: {msg_error}", file=sys.stderr)
         
-        # Check if model is loaded
+    # Use the core module to generate a prompt
+    try:
+        prompt = prompt_segments.render(
+            cache_key,
+            mode=req.mode,
+            system_prompt=req.system_prompt or "You are a helpful assistant.", 
+            tokenizer=target.tokenizer,
+            message=req.message,
+            messages=validated_messages,
+            context_window=model_context_window(target.model, target.tokenizer),
+            max_new_tokens=req.max_tokens
+        )
+        print(f"DEBUG: Prompt generated successfully, length={len(prompt)}", file=sys.stderr)
+    except Exception as prompt_error:
+        print(f"ERROR: Failed to generate prompt: {prompt_error}", file=sys.stderr)
+        raise
+    return prompt
+
+def _prepare_v2_prompt(req: ChatRequestV2, target, cache_key: Optional[str] = None):
+    """``(prompt, prompt_ids)`` for chat_v2: the rendered prompt plus, for the batch
+    scheduler, its token ids, so both run in one threadpool call."""
+    prompt = _build_v2_prompt(req, target, cache_key)
+    prompt_ids = prompt_segments.encode(cache_key, prompt, target.tokenizer) if target.batched else None
+    return prompt, prompt_ids
+
+def _save_v2_exchange(req: ChatRequestV2, content: str, max_tokens: int) -> str:
+    """Persists the new user/assistant turn of the request and returns the thread_id."""
+    # Prepare new messages to be saved (context + request + response)
+    saved_messages = []
+    
+    # Add the system message first (if not empty)
+    if req.system_prompt and req.system_prompt.strip():
+        saved_messages.append({"role": "system", "content": req.system_prompt})
+    
+    # Add the existing context messages if req.messages is not None
+    if req.messages:
+        try:
+            saved_messages.extend([{"role": msg.role, "content": msg.content} for msg in req.messages if msg and hasattr(msg, 'role') and hasattr(msg, 'content')])
+        except Exception as msg_error:
+            print(f"WARNING: Error processing messages: {msg_error}", file=sys.stderr)
+    # Instruction mode only carries the new message
+    elif req.message:
+        saved_messages.append({"role": "user", "content": req.message})
+    
+    # Add the assistant's response to be saved
+    saved_messages.append({"role": "assistant", "content": content})
+    
+    # Save all messages with the provided or new thread_id
+    return save_chat_messages(
+        req.thread_id, 
+        saved_messages,
+        sampling_settings={
+            "temperature": req.temperature,
+            "max_tokens": max_tokens,
+            "top_p": req.top_p,
+            "stop": req.stop
+        },
+        system_prompt=req.system_prompt,
+        # The context repeats what the thread already holds; only the new turn is appended
+        dedupe=bool(req.messages)
+    )
+
+def _prefix_cache_key(req) -> Optional[str]:
+    """Key under which this request's KV cache is kept for the thread's next turn.
+
+    New chats don't have a thread_id until they are saved, so they get a provisional
+    key that _settle_prefix_cache moves once the id is known.
+    """
+    if req.thread_id:
+        return req.thread_id
+    if req.save_chat:
+        return f"pending:{uuid.uuid4().hex}"
+    return None
+
+def _settle_prefix_cache(cache_key: Optional[str], thread_id: Optional[str]) -> None:
+    if cache_key is None or cache_key == thread_id:
+        return
+    if thread_id:
+        prefix_cache.rekey(cache_key, thread_id)
+        prompt_segments.rekey(cache_key, thread_id)
+    else:
+        prefix_cache.invalidate(cache_key)
+        prompt_segments.invalidate(cache_key)
+
+def _resolve_target_model(req, app_state) -> SimpleNamespace:
+    """Picks the model a request runs on: the one named by ``req.model`` or the active model.
+
+    A named model that is not resident is loaded into the model registry (evicting
+    least-recently-used models over the budget) without replacing the active model.
+    Only the active model is served by the batch scheduler.
+
+    The returned target holds a registry lease on its model so a hot swap or an
+    eviction can't free it mid-generation; pass it to _release_target when done.
+    """
+    if req.model and not is_active_model(req.model):
+        try:
+            entry = lease_model_for_request(req.model)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+        except ModelBudgetError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+        return SimpleNamespace(
+            name=req.model, tokenizer=entry.tokenizer, model=entry.model, device=entry.device,
+            batched=False, lease=entry,
+        )
+
+    # Read the active model and lease it in one step (a hot swap publishes under the same lock)
+    with model_swap_lock:
         if not app_state.model or not app_state.tokenizer:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail="Model is not loaded. Please use the /model/load endpoint first."
             )
+        return SimpleNamespace(
+            name=getattr(app_state, "model_path", None),
+            tokenizer=app_state.tokenizer,
+            model=app_state.model,
+            device=app_state.device,
+            batched=settings.enable_batching,
+            lease=model_registry.lease(app_state.model),
+        )
+
+def _release_target(target: SimpleNamespace) -> None:
+    """Returns the target's model lease (once); a retired model is freed when its last lease is back."""
+    lease, target.lease = target.lease, None
+    model_registry.release(lease)
+
+def _resolve_draft_model(req, target):
+    """Returns the draft model to decode speculatively with, or None when it is off for this request.
+
+    Per-request ``speculative``/``draft_model`` override the settings defaults. The
+    batch scheduler does not support assisted generation, so batching disables it.
+    """
+    use_speculative = req.speculative
+    if use_speculative is None:
+        use_speculative = req.draft_model is not None or settings.speculative_decoding
+    if not use_speculative or target.batched:
+        return None
+    draft_name = req.draft_model or settings.draft_model_name
+    if not draft_name:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Speculative decoding requested but no draft model is configured (draft_model / SIGIL_DRAFT_MODEL_NAME)."
+        )
+    try:
+        return get_draft_model(draft_name, target.tokenizer, target.device)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+def _build_usage(
+    generation_stats: Dict[str, Any],
+    queue_wait: Optional[float],
+    elapsed_time: float,
+    time_to_first_token: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Per-request token and timing accounting returned as ``usage``.
+
+    ``generation_stats`` is what generate_response/stream_response filled in (or the
+    batch scheduler's timings). Time to first token is measured from when the job
+    left the queue unless the caller measured it end to end.
+    """
+    prompt_tokens = generation_stats.get("prompt_tokens", 0)
+    completion_tokens = generation_stats.get("completion_tokens", 0)
+    continuation_tokens = generation_stats.get("continuation_tokens", 0)
+    prefill_time = generation_stats.get("prefill_time")
+    if time_to_first_token is None and prefill_time is not None:
+        time_to_first_token = (queue_wait or 0.0) + prefill_time
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "continuation_tokens": continuation_tokens,
+        "total_tokens": prompt_tokens + completion_tokens + continuation_tokens,
+        "queue_wait": queue_wait,
+        "prefill_time": prefill_time,
+        "decode_time": generation_stats.get("decode_time"),
+        "time_to_first_token": time_to_first_token,
+        "tokens_per_second": generation_stats.get("tokens_per_second"),
+        "elapsed_time": elapsed_time,
+    }
+
+def _queue_full_exception(error: InferenceQueueFullError) -> HTTPException:
+    """Maps a rejected inference submission to a 503 with a Retry-After hint."""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(error),
+        headers={"Retry-After": "5"}
+    )
+
+def _admit_generation(target, prompt: str, max_tokens: int, cancel=None):
+    """Waits for an admission slot for this generation; 429/503 with Retry-After if none is available."""
+    try:
+        return admission_controller.acquire(generation_cost(target.model, target.tokenizer, prompt, max_tokens), cancel)
+    except AdmissionRejectedError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except GenerationCancelledError as e:
+        raise _cancelled_exception(e)
+
+def _register_cancellation(req, request: Request):
+    """Cancel token of this generation: set by POST /chat/cancel/{request_id} or when the client disconnects."""
+    try:
+        return cancellations.register(
+            req.request_id or request.headers.get("X-Request-ID"), client_disconnected(request.scope)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+def _cancelled_exception(error: GenerationCancelledError) -> HTTPException:
+    """499 (client closed request): nobody is waiting for the partial answer, so it is not saved."""
+    return HTTPException(status_code=499, detail=str(error))
+
+def _format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Formats a single Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Chat version 2 endpoint with extended functionality
+@router.post("/chat/v2", response_model=ChatResponseV2)
+async def chat_v2(req: ChatRequestV2, request: Request):
+    """Enhanced chat endpoint with additional features for narrative generation."""
+    start_time = time.perf_counter()
+    target = None
+    ticket = None
+    cancel = None
+    try:
+        app_state = request.app.state
         
-        # Debug info before generating prompt
-        print(f"DEBUG: Generating prompt with mode={req.mode}", file=sys.stderr)
-        print(f"DEBUG: message={req.message}", file=sys.stderr)
-        print(f"DEBUG: system_prompt={req.system_prompt}", file=sys.stderr)
-        print(f"DEBUG: messages={req.messages}", file=sys.stderr)
+        # Check if model is loaded; a model named by the request may have to be loaded first
+        target = await run_in_threadpool(_resolve_target_model, req, app_state)
         
-        # Validate the messages list before passing to generate_prompt
-        validated_messages = []
-        if req.messages:
-            try:
-                validated_messages = [
-                    {"role": msg.role, "content": msg.content}
-                    for msg in req.messages
-                    if msg and hasattr(msg, 'role') and hasattr(msg, 'content')
-                ]
-            except Exception as msg_error:
-                print(f"WARNING: Error validating messages: {msg_error}", file=sys.stderr)
-            
-        # Use the core module to generate a prompt
-        try:
-            prompt = generate_prompt(
-                mode=req.mode,
-                system_prompt=req.system_prompt or "You are a helpful assistant.", 
-                tokenizer=app_state.tokenizer,
-                message=req.message,
-                messages=validated_messages
-            )
-            print(f"DEBUG: Prompt generated successfully, length={len(prompt)}", file=sys.stderr)
-        except Exception as prompt_error:
-            print(f"ERROR: Failed to generate prompt: {prompt_error}", file=sys.stderr)
-            raise
+        cache_key = _prefix_cache_key(req)
+        # Packing, rendering and tokenizing are CPU work; keep them off the event loop
+        prompt, prompt_ids = await run_in_threadpool(_prepare_v2_prompt, req, target, cache_key)
     
         # Get max length
         max_tokens = req.max_tokens if req.max_tokens > 0 else 4096  # Default if not set
         
-        # Call inference with the generated prompt
-        raw_response = generate_response(
-            app_state.model, 
-            app_state.tokenizer, 
-            app_state.device,
-            prompt,
-            req.temperature,
-            req.top_p,
-            max_tokens,
-            req.repetition_penalty
-        )
+        # Call inference with the generated prompt. Generation runs on the dedicated
+        # inference executor (or the batch scheduler's thread) so the event loop
+        # stays free for control-plane requests.
+        generation_stats = {}
+        # Loading a draft model for the first time is slow; keep it off the event loop
+        draft_model = await run_in_threadpool(_resolve_draft_model, req, target)
+        cancel = _register_cancellation(req, request)
+        ticket = await run_in_threadpool(_admit_generation, target, prompt, max_tokens, cancel)
+        try:
+            if target.batched:
+                result = await get_batch_scheduler(target.model, target.tokenizer).generate(
+                    prompt,
+                    req.temperature,
+                    req.top_p,
+                    max_tokens,
+                    req.repetition_penalty,
+                    req.stop,
+                    cancel=cancel,
+                    prompt_ids=prompt_ids
+                )
+                raw_response, timings = result["text"], result["timings"]
+                timings["compute_time"] = timings["latency"] - timings["queue_wait"]
+                generation_stats = timings
+            else:
+                raw_response, timings = await inference_executor.run(
+                    generate_response,
+                    target.model, 
+                    target.tokenizer, 
+                    target.device,
+                    prompt,
+                    req.temperature,
+                    req.top_p,
+                    max_tokens,
+                    req.repetition_penalty,
+                    stats=generation_stats,
+                    cache_key=cache_key,
+                    stop=req.stop,
+                    assistant_model=draft_model,
+                    cancel=cancel
+                )
+        except InferenceQueueFullError as e:
+            raise _queue_full_exception(e)
+        except GenerationCancelledError as e:
+            raise _cancelled_exception(e)
+        finally:
+            admission_controller.release(ticket)
+            ticket = None
         
-        # First truncate at stop tokens if provided
-        truncated_response = truncate_at_stop_token(raw_response, req.stop) if req.stop else raw_response
+        # First truncate at stop tokens (the default list when none were provided)
+        truncated_response = truncate_at_stop_token(raw_response, req.stop)
         
         # Then clean the response (remove speaker tags)
         content = clean_response(truncated_response)
@@ -191,47 +501,40 @@ async def chat_v2(req: ChatRequestV2, request: Request):
         thread_id = req.thread_id
         
         if thread_id or req.save_chat:
-            # Prepare new messages to be saved (context + request + response)
-            saved_messages = []
-            
-            # Add the system message first (if not empty)
-            if req.system_prompt and req.system_prompt.strip():
-                saved_messages.append({"role": "system", "content": req.system_prompt})
-            
-            # Add the existing context messages if req.messages is not None
-            if req.messages:
-                try:
-                    saved_messages.extend([{"role": msg.role, "content": msg.content} for msg in req.messages if msg and hasattr(msg, 'role') and hasattr(msg, 'content')])
-                except Exception as msg_error:
-                    print(f"WARNING: Error processing messages: {msg_error}", file=sys.stderr)
-            
-            # Add the assistant's response to be saved
-            saved_messages.append({"role": "assistant", "content": content})
-            
-            # Save all messages with the provided or new thread_id
-            thread_id = save_chat_messages(
-                thread_id, 
-                saved_messages,
-                sampling_settings={
-                    "temperature": req.temperature,
-                    "max_tokens": max_tokens,
-                    "top_p": req.top_p,
-                    "stop": req.stop
-                },
-                system_prompt=req.system_prompt
-            )
+            # File I/O stays off the event loop as well
+            thread_id = await run_in_threadpool(_save_v2_exchange, req, content, max_tokens)
+        _settle_prefix_cache(cache_key, thread_id)
+    
+        usage = _build_usage(generation_stats, timings["queue_wait"], time.perf_counter() - start_time)
+        generated_tokens = usage["completion_tokens"] + usage["continuation_tokens"]
     
     # Return properly formatted response to the user
         return ChatResponseV2(
             content=content, 
             thread_id=thread_id,
             is_narrative=is_narrative,
+            token_count=generated_tokens,
+            usage=usage,
             metadata={
-                "total_tokens": len(content.split()),  # Simple approximation, replace with actual token count
-                "elapsed_time": 0,  # Placeholder, replace with actual timing if available
-                "model_used": "local",  # Placeholder
+                "total_tokens": generated_tokens,
+                "elapsed_time": usage["elapsed_time"],
+                "queue_wait_time": timings["queue_wait"],
+                "compute_time": timings["compute_time"],
+                "time_to_first_token": usage["time_to_first_token"],
+                "tokens_per_second": usage["tokens_per_second"],
+                "batched": target.batched,
+                "prefill_tokens_saved": generation_stats.get("prefill_tokens_saved", 0),
+                "prefix_tokens_reused": generation_stats.get("prefix_tokens_reused", 0),
+                "stop_tokens_saved": generation_stats.get("stop_tokens_saved", 0),
+                "speculative": draft_model is not None,
+                "acceptance_rate": generation_stats.get("acceptance_rate"),
+                "model_used": target.name,
+                "request_id": cancel.request_id,
             }
         )
+    except HTTPException:
+        # Already carries the right status (409 no model, 429/503 busy, 499 cancelled)
+        raise
     except Exception as e:
         print(f"❌ CRITICAL ERROR in chat_v2: {str(e)}", file=sys.stderr)
         print(f"Request details: mode={req.mode}, has_message={req.message is not None}, messages_provided={req.messages is not None}", file=sys.stderr)
@@ -269,14 +572,198 @@ async def chat_v2(req: ChatRequestV2, request: Request):
             detail=error_message,
             headers=headers
         )
+    finally:
+        admission_controller.release(ticket)
+        cancellations.release(cancel)
+        if target is not None:
+            _release_target(target)
+
+# --- NEW: Streaming variant of chat v2 (Server-Sent Events) ---
+@router.post("/chat/v2/stream")
+async def chat_v2_stream(req: ChatRequestV2, request: Request):
+    """Streams the chat v2 reply token by token as Server-Sent Events.
+
+    Emits ``token`` events while the model generates, then a single ``done`` event
+    carrying the stop-truncated, cleaned content, the thread_id and timing metadata
+    (including time to first token). Errors after the stream has started are
+    reported as an ``error`` event because the HTTP status has already been sent.
+    """
+    app_state = request.app.state
+    target = await run_in_threadpool(_resolve_target_model, req, app_state)
+    cache_key = _prefix_cache_key(req)
+    try:
+        # Packing and rendering tokenize history on a cache miss; keep it off the event loop
+        prompt = await run_in_threadpool(_build_v2_prompt, req, target, cache_key)
+    except Exception as e:
+        _release_target(target)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An error occurred while building the prompt: {str(e)}"
+        )
+    max_tokens = req.max_tokens if req.max_tokens > 0 else 4096  # Default if not set
+
+    try:
+        # Reject up front while we can still send a proper status code
+        if inference_executor.is_saturated():
+            raise _queue_full_exception(InferenceQueueFullError("Inference queue is full. Try again shortly."))
+
+        draft_model = await run_in_threadpool(_resolve_draft_model, req, target)
+        cancel = _register_cancellation(req, request)
+    except HTTPException:
+        _release_target(target)
+        raise
+    try:
+        # Admitted before the response starts so a busy server still answers 429/503
+        ticket = await run_in_threadpool(_admit_generation, target, prompt, max_tokens, cancel)
+    except HTTPException:
+        cancellations.release(cancel)
+        _release_target(target)
+        raise
+
+    def event_stream():
+        start_time = time.perf_counter()
+        time_to_first_token = None
+        raw_response = ""
+        emitted_chars = 0
+        stop_hit = False
+        generation_stats = {}
+        try:
+            for chunk in stream_response(
+                target.model,
+                target.tokenizer,
+                target.device,
+                prompt,
+                req.temperature,
+                req.top_p,
+                max_tokens,
+                req.repetition_penalty,
+                submit=inference_executor.submit,
+                cache_key=cache_key,
+                stop=req.stop,
+                assistant_model=draft_model,
+                stats=generation_stats,
+                cancel=cancel
+            ):
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start_time
+                if stop_hit:
+                    continue  # Drain the generator; nothing after a stop token is shown
+                raw_response += chunk
+
+                # Never emit text past (or partially into) a stop token
+                visible = truncate_at_stop_token(raw_response, req.stop)
+                stop_hit = len(visible) < len(raw_response)
+                if not stop_hit:
+                    visible = visible[:len(visible) - stop_token_holdback(visible, req.stop)]
+                if len(visible) > emitted_chars:
+                    yield _format_sse("token", {"text": visible[emitted_chars:]})
+                    emitted_chars = len(visible)
+
+            # Same post-processing as the non-streaming endpoint
+            truncated_response = truncate_at_stop_token(raw_response, req.stop)
+            content = clean_response(truncated_response)
+            is_narrative = len(content.split()) >= MIN_NARRATIVE_TOKENS
+
+            thread_id = req.thread_id
+            if thread_id or req.save_chat:
+                thread_id = _save_v2_exchange(req, content, max_tokens)
+            _settle_prefix_cache(cache_key, thread_id)
+
+            # Time to first token is measured end to end here (it includes any executor queueing)
+            usage = _build_usage(generation_stats, None, time.perf_counter() - start_time, time_to_first_token)
+            generated_tokens = usage["completion_tokens"] + usage["continuation_tokens"]
+            yield _format_sse("done", {
+                "content": content,
+                "thread_id": thread_id,
+                "is_narrative": is_narrative,
+                "token_count": generated_tokens,
+                "usage": usage,
+                "metadata": {
+                    "total_tokens": generated_tokens,
+                    "time_to_first_token": time_to_first_token,
+                    "elapsed_time": usage["elapsed_time"],
+                    "model_used": target.name,
+                    "request_id": cancel.request_id,
+                },
+            })
+        except GenerationCancelledError as e:
+            # Only reaches a client that is still connected (explicit cancel)
+            yield _format_sse("cancelled", {"detail": str(e), "request_id": cancel.request_id})
+        except Exception as e:
+            print(f"❌ ERROR in chat_v2_stream: {str(e)}", file=sys.stderr)
+            yield _format_sse("error", {"detail": f"An error occurred during chat generation: {str(e)}"})
+        finally:
+            # Closed early (client gone): stop the generation thread at its next step
+            cancel.cancel()
+            admission_controller.release(ticket)
+            cancellations.release(cancel)
+            _release_target(target)
+
+    async def closing_stream():
+        # When the client disconnects Starlette stops iterating without closing the
+        # generator; close it here so its cleanup (slot, lease) runs right away
+        stream = event_stream()
+        try:
+            async for frame in iterate_in_threadpool(stream):
+                yield frame
+        finally:
+            await run_in_threadpool(stream.close)
+
+    return StreamingResponse(
+        closing_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+# --- END NEW ENDPOINT ---
+
+@router.post("/chat/cancel/{request_id}")
+def cancel_generation(request_id: str):
+    """Stops a running generation at its next decode step and frees its slot.
+
+    The cancelled request answers 499 (or a ``cancelled`` event when streaming) and
+    nothing is saved to its thread.
+    """
+    if not cancellations.cancel(request_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No running generation with request id '{request_id}'."
+        )
+    return {"status": "cancelling", "request_id": request_id}
 
 # --- NEW: Endpoint to List Sessions ---
-@router.get("/sessions", response_model=List[Dict[str, Any]])
-def get_saved_sessions():
-    """Gets a list of all saved chat sessions using the history manager."""
+@router.get("/sessions", response_model=Union[List[Dict[str, Any]], Dict[str, Any]])
+def get_saved_sessions(
+    limit: Optional[int] = Query(None, ge=1, le=settings.session_page_size_max),
+    cursor: Optional[str] = None,
+    updated_after: Optional[datetime] = None,
+    updated_before: Optional[datetime] = None,
+    title_prefix: Optional[str] = None,
+):
+    """
+    Gets the saved chat sessions using the history manager, most recent first.
+
+    Without parameters returns the full list. With any of ``limit``, ``cursor``,
+    ``updated_after``, ``updated_before`` or ``title_prefix`` returns one page:
+    {"sessions": [...], "next_cursor": ...}; pass next_cursor back as ``cursor``
+    (with the same filters) for the following page.
+
+    A page costs O(log n + limit) for n sessions. ``title_prefix`` pages instead
+    sort every session whose title matches, O(m log m) for m matches, so a short
+    prefix over a large history is slower than a longer one.
+    """
+    paged = any(param is not None for param in (limit, cursor, updated_after, updated_before, title_prefix))
     try:
-        sessions = list_sessions()
-        return sessions
+        if not paged:
+            return list_sessions()
+        return list_sessions_page(
+            limit=limit,
+            cursor=cursor,
+            updated_after=updated_after,
+            updated_before=updated_before,
+            title_prefix=title_prefix,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         print(f"Error listing saved sessions: {e}", file=sys.stderr)
         raise HTTPException(
@@ -287,7 +774,7 @@ def get_saved_sessions():
 
 # --- NEW: Endpoint to Get a Specific Session ---
 @router.get("/session/{thread_id}", response_model=Dict[str, Any])
-def get_specific_session(thread_id: str):
+def get_specific_session(thread_id: str, request: Request, background_tasks: BackgroundTasks):
     """Gets a specific chat session using the history manager."""
     try:
         session_data = get_session(thread_id)
@@ -296,6 +783,10 @@ def get_specific_session(thread_id: str):
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Session with ID '{thread_id}' not found."
             )
+        # Reopening a session usually means another turn is coming: load its KV snapshot now
+        model = getattr(request.app.state, "model", None)
+        if settings.kv_snapshots_enabled and settings.prefix_cache_enabled and model is not None:
+            background_tasks.add_task(prefix_cache.prefetch, thread_id, model)
         return session_data
     except ValueError as e:
         # Raised by get_session (via get_session_filepath) for invalid thread_id format
@@ -384,6 +875,9 @@ def edit_message_in_session(thread_id: str, message_index: int, req: EditMessage
                 detail=f"Session with ID '{thread_id}' not found or message could not be edited."
             )
         
+        # The cached KV state no longer matches the edited history
+        prefix_cache.invalidate(thread_id)
+
         # If success is True, return a success response
         print(f"API: Successfully edited message {message_index} in thread {thread_id}")
         return {
@@ -420,6 +914,7 @@ def delete_specific_session(thread_id: str):
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Session with ID '{thread_id}' not found or could not be deleted."
             )
+        prefix_cache.invalidate(thread_id)
         # If deleted is True, success!
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
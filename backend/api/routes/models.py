@@ -18,6 +18,7 @@ from backend.utils.huggingface_utils import (
 )
 # Import common schemas used
 from ..schemas.common import ModelStatusResponse
+from ..core.model_loader import get_model_load_time
 
 # ---------------------------------------------------------------------------
 # Router Setup
@@ -110,7 +111,8 @@ def get_model_status(request: Request):
         return {
             "loaded": True,
             "path": app_state.model_path,
-            "device": app_state.device
+            "device": app_state.device,
+            "load_time": get_model_load_time()
         }
     else:
         return {"loaded": False}
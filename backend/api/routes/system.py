@@ -2,6 +2,13 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from backend.api.core.gpu_check import get_device_status
 from backend.api.core.settings_manager import get_precision, set_precision, VALID_PRECISIONS
+from backend.api.core.scheduler import get_scheduler_stats
+from backend.api.core.prefix_cache import prefix_cache
+from backend.api.core.prompt_cache import prompt_segments
+from backend.api.core.model_loader import model_registry
+from backend.api.core.config import settings
+from backend.api.core import weight_cache
+from backend.api.core.admission import admission_controller
 
 router = APIRouter()
 
@@ -12,7 +19,7 @@ def read_device_status():
 
 @router.get("/get_precision", tags=["System"])
 def read_precision():
-    """Returns the current global precision setting (fp32 or fp16)."""
+    """Returns the current global precision setting (fp32, fp16, bf16 or int8)."""
     return {"current_precision": get_precision()}
 
 class PrecisionRequest(BaseModel):
@@ -20,8 +27,41 @@ class PrecisionRequest(BaseModel):
 
 @router.post("/set_precision", tags=["System"])
 def update_precision(req: PrecisionRequest):
-    """Sets the global precision setting. Accepts 'fp32' or 'fp16'."""
+    """Sets the global precision setting. Accepts 'fp32', 'fp16', 'bf16' or 'int8' (CPU, quantized at load)."""
     if req.precision not in VALID_PRECISIONS:
         raise HTTPException(status_code=400, detail=f"Invalid precision '{req.precision}'. Must be one of {VALID_PRECISIONS}.")
     set_precision(req.precision)
-    return {"status": "ok", "new_precision": get_precision()}
\ No newline at end of file
+    return {"status": "ok", "new_precision": get_precision()}
+
+@router.get("/scheduler", tags=["System"])
+def read_scheduler_stats():
+    """Returns continuous-batching throughput and latency figures (if batching is in use)."""
+    return {
+        "enabled": settings.enable_batching,
+        "stats": get_scheduler_stats(),
+    }
+
+@router.get("/prefix_cache", tags=["System"])
+def read_prefix_cache_stats():
+    """Returns hit/miss counters and memory use of the per-thread prefix KV cache."""
+    return prefix_cache.stats()
+
+@router.get("/prompt_cache", tags=["System"])
+def read_prompt_cache_stats():
+    """Returns reuse counters of the per-thread rendered/tokenized message segment cache."""
+    return prompt_segments.stats()
+
+@router.get("/admission", tags=["System"])
+def read_admission_stats():
+    """Returns running and waiting generations, reserved memory and rejection counters of admission control."""
+    return admission_controller.stats()
+
+@router.get("/model_registry", tags=["System"])
+def read_model_registry_stats():
+    """Returns the resident models and hit/miss/load/eviction counters of the model registry."""
+    return model_registry.stats()
+
+@router.get("/weight_cache", tags=["System"])
+def read_weight_cache_stats():
+    """Returns cold (source checkpoint) and warm (converted-weights cache) load times per model and precision."""
+    return {"enabled": settings.converted_weights_cache, **weight_cache.load_time_stats()}
@@ -18,6 +18,10 @@ class ChatRequest(BaseModel):
     repetition_penalty: Optional[float] = 1.0
     stop: Optional[List[str]] = None
     save_chat: Optional[bool] = False
+    speculative: Optional[bool] = None  # None -> settings.speculative_decoding
+    draft_model: Optional[str] = None  # None -> settings.draft_model_name
+    model: Optional[str] = None  # Directory in backend/models; None -> the active model
+    request_id: Optional[str] = None  # Client-chosen id for POST /chat/cancel/{request_id}; None -> generated
 
 class ChatResponse(BaseModel):
     content: str
@@ -40,6 +44,10 @@ class ChatRequestV2(BaseModel):
     repetition_penalty: Optional[float] = 1.0
     stop: Optional[List[str]] = None
     save_chat: Optional[bool] = False
+    speculative: Optional[bool] = None  # None -> settings.speculative_decoding
+    draft_model: Optional[str] = None  # None -> settings.draft_model_name
+    model: Optional[str] = None  # Directory in backend/models; None -> the active model
+    request_id: Optional[str] = None  # Client-chosen id for POST /chat/cancel/{request_id}; None -> generated
 
     @field_validator('message', mode='before')
     @classmethod
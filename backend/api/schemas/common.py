@@ -11,10 +11,15 @@ class LoadModelResponse(BaseModel):
     path: str
     device: str
 
+class LoadJobRequest(BaseModel):
+    model_name: Optional[str] = Field(None, description="Directory name inside backend/models.")
+    path: Optional[str] = Field(None, description="Absolute or project-relative model directory (instead of model_name).")
+
 class ModelStatusResponse(BaseModel):
     loaded: bool
     path: Optional[str] = None
     device: Optional[str] = None
+    load_time: Optional[float] = None  # Seconds to load weights onto the inference device
 
 class ModelSettings(BaseModel):
     system_prompt: Optional[str] = None
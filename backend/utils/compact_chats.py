@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+One-time compaction of saved chats.
+
+Before chat saves were deduplicated every turn stored the system prompt and the
+whole conversation again, so saved_chats/*.json files grew quadratically. This
+rewrites them with each message stored once (originals kept as *.json.bak).
+
+Usage (from the project root):
+    python -m backend.utils.compact_chats [--dry-run] [--no-backup] [thread_id ...]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Allow running as a plain script as well as with -m
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from backend.api.core import history_manager
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Remove duplicated history from saved chat sessions.")
+    parser.add_argument("thread_ids", nargs="*", help="Sessions to compact (default: all)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--no-backup", action="store_true", help="Don't keep <thread_id>.json.bak copies")
+    args = parser.parse_args(argv)
+
+    backup = not args.no_backup
+    if args.thread_ids:
+        results = {}
+        for thread_id in args.thread_ids:
+            result = history_manager.compact_session(thread_id, dry_run=args.dry_run, backup=backup)
+            if result is None:
+                print(f"❌ Could not read session {thread_id}")
+            elif result["after"] < result["before"]:
+                results[thread_id] = result
+    else:
+        results = history_manager.compact_all_sessions(dry_run=args.dry_run, backup=backup)
+
+    verb = "Would compact" if args.dry_run else "Compacted"
+    for thread_id, result in results.items():
+        print(f"🗜️ {verb} {thread_id}: {result['before']} -> {result['after']} messages")
+    print(f"✅ {verb} {len(results)} session(s) in {history_manager.HISTORY_DIR}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
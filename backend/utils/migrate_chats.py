@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Imports the saved_chats/*.json sessions into the SQLite history store.
+
+Usage (from the project root):
+    python -m backend.utils.migrate_chats [--db PATH] [--compact] [--overwrite]
+
+Afterwards set SIGIL_HISTORY_BACKEND=sqlite (and SIGIL_HISTORY_DB_PATH if --db was
+used). The JSON files are not modified.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Allow running as a plain script as well as with -m
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from backend.api.core import history_manager
+from backend.api.core.history_store import SQLiteHistoryStore
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import saved chat JSON files into the SQLite history store.")
+    parser.add_argument("--db", default=None, help="Database file (default: SIGIL_HISTORY_DB_PATH or saved_chats/history.sqlite3)")
+    parser.add_argument("--compact", action="store_true", help="Drop history duplicated by older versions while importing")
+    parser.add_argument("--overwrite", action="store_true", help="Replace sessions that are already in the database")
+    args = parser.parse_args(argv)
+
+    db_path = args.db or history_manager.get_history_db_path()
+    store = SQLiteHistoryStore(db_path)
+    try:
+        counts = history_manager.import_json_sessions(store, compact=args.compact, overwrite=args.overwrite)
+    finally:
+        store.close()
+
+    print(f"📦 Imported {counts['imported']} session(s) into {db_path} "
+          f"({counts['skipped']} already present, {counts['failed']} failed)")
+    print("✅ Set SIGIL_HISTORY_BACKEND=sqlite to use it.")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
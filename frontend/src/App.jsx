@@ -464,6 +464,7 @@ function App() {
             userInput={chatHook.userInput}
             setUserInput={chatHook.setUserInput}
             sendMessage={chatHook.sendMessage}
+            cancelMessage={chatHook.cancelMessage}
             appModelLoadStatus={appModelLoadStatus}
             globalIsLoading={isLoading}
             globalError={error}
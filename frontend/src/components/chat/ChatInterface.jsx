@@ -9,6 +9,7 @@ function ChatInterface({
   userInput,
   setUserInput,
   sendMessage,
+  cancelMessage,
   appModelLoadStatus,
   globalIsLoading,
   globalError,
@@ -98,18 +99,25 @@ function ChatInterface({
           rows="3"
           disabled={globalIsLoading || isSendingMessage || appModelLoadStatus !== 'loaded'}
         />
-        <button
-          id="send-button"
-          onClick={() => sendMessage(chatHistory)}
-          disabled={
-            globalIsLoading ||
-            isSendingMessage ||
-            !userInput.trim() ||
-            appModelLoadStatus !== 'loaded'
-          }
-        >
-          Send
-        </button>
+        {isSendingMessage && cancelMessage ? (
+          /* Cancels the request on the backend (frees its generation slot) and aborts the fetch */
+          <button id="stop-button" onClick={cancelMessage} title="Stop generating">
+            Stop
+          </button>
+        ) : (
+          <button
+            id="send-button"
+            onClick={() => sendMessage(chatHistory)}
+            disabled={
+              globalIsLoading ||
+              isSendingMessage ||
+              !userInput.trim() ||
+              appModelLoadStatus !== 'loaded'
+            }
+          >
+            Send
+          </button>
+        )}
       </div>
     </div>
   );
@@ -3,6 +3,9 @@ import PropTypes from 'prop-types';
 import { API_BASE_URL } from '../../../constants'; // Import shared constant
 import './ModelLoadPanel.css'; // <-- Import the new CSS file
 
+// How often a running model load job is polled for progress
+const LOAD_JOB_POLL_MS = 500;
+
 // Base API URL - Moved to constants.js
 // const API_BASE_URL = 'http://localhost:8000';
 
@@ -132,7 +135,7 @@ function ModelLoadPanel({
     checkModelStatus();
   }, [checkModelStatus]);
 
-  // --- Updated handleLoadModel ---
+  // --- Updated handleLoadModel: submit a background load job and poll its progress ---
   const handleLoadModel = async (modelName) => {
     if (!modelName) {
       setLoadStatus('error', 'Invalid model selected.'); // Use updated callback format
@@ -144,8 +147,10 @@ function ModelLoadPanel({
       // Use updated callback format for loading status
       setLoadStatus('loading', `Loading ${modelName}...`);
 
-      const response = await fetch(`${API_BASE_URL}/api/v1/model/load/${modelName}`, {
+      const response = await fetch(`${API_BASE_URL}/api/v1/model/jobs`, {
         method: "POST",
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ model_name: modelName })
       });
 
       if (!response.ok) {
@@ -159,9 +164,28 @@ function ModelLoadPanel({
         throw new Error(errorDetail);
       }
 
-      const result = await response.json();
+      let job = await response.json();
+      // The backend loads in the background; poll the (cheap) job status until it finishes
+      while (job.state === 'queued' || job.state === 'loading') {
+        await new Promise((resolve) => setTimeout(resolve, LOAD_JOB_POLL_MS));
+        const statusResponse = await fetch(`${API_BASE_URL}/api/v1/model/jobs/${job.job_id}`);
+        if (!statusResponse.ok) {
+          throw new Error(`Could not read load progress (status: ${statusResponse.status})`);
+        }
+        job = await statusResponse.json();
+        if (job.state === 'loading') {
+          const percent = Math.round((job.progress || 0) * 100);
+          const shards = job.shards_total > 1 ? ` (shard ${Math.min(job.shards_loaded + 1, job.shards_total)}/${job.shards_total})` : '';
+          setLoadStatus('loading', `Loading ${modelName}... ${percent}%${shards}`);
+        }
+      }
+
+      if (job.state !== 'loaded') {
+        throw new Error(job.error || `Load ${job.state}.`);
+      }
       // Pass the status string and the model name separately to the handler in App.jsx
       setLoadStatus('loaded', modelName);
+      onDeviceUpdate(job.device);
     } catch (err) {
       console.error("Error loading model:", err);
       // Pass the 'error' status string and potentially the error message
@@ -26,8 +26,15 @@ const apiClient = {
   },
 };
 
+const PRECISION_TO_OPTION = {
+  fp32: 'gpu-fp32',
+  fp16: 'gpu-fp16',
+  bf16: 'bf16',
+  int8: 'cpu-int8',
+};
+
 function PrecisionSettingsPanel() {
-  const [selectedPrecision, setSelectedPrecision] = useState('loading'); // 'loading', 'cpu', 'gpu-fp32', 'gpu-fp16', 'error'
+  const [selectedPrecision, setSelectedPrecision] = useState('loading'); // 'loading', 'cpu', 'gpu-fp32', 'gpu-fp16', 'bf16', 'cpu-int8', 'error'
   const [isUpdating, setIsUpdating] = useState(false);
 
   // Fetch initial precision setting on component mount
@@ -53,10 +60,10 @@ function PrecisionSettingsPanel() {
 
         const data = JSON.parse(responseText); // Now parse the text
 
-        // Map backend 'fp32'/'fp16' to frontend options
+        // Map backend precision values to frontend options
         // Assuming 'fp32' could mean either CPU was forced OR GPU is using fp32.
         // Defaulting to 'gpu-fp32' if CUDA is available (which is why this panel is shown).
-        setSelectedPrecision(data.current_precision === 'fp16' ? 'gpu-fp16' : 'gpu-fp32');
+        setSelectedPrecision(PRECISION_TO_OPTION[data.current_precision] || 'gpu-fp32');
       } catch (error) {
         console.error("Failed to fetch initial precision:", error);
         setSelectedPrecision('error');
@@ -75,6 +82,10 @@ function PrecisionSettingsPanel() {
     let backendValue;
     if (newPrecisionFrontend === 'gpu-fp16') {
         backendValue = 'fp16';
+    } else if (newPrecisionFrontend === 'bf16') {
+        backendValue = 'bf16';
+    } else if (newPrecisionFrontend === 'cpu-int8') {
+        backendValue = 'int8';
     } else {
         // Both 'cpu' and 'gpu-fp32' map to 'fp32' on the backend.
         // 'fp32' is the safe default and required for CPU.
@@ -112,7 +123,7 @@ function PrecisionSettingsPanel() {
       <div className="precision-settings-content">
         <h3>Precision Settings</h3>
         <p className="precision-settings-description">
-          Choose your preferred inference precision. Half precision (fp16) is faster but slightly less accurate. Changes apply on next model load.
+          Choose your preferred inference precision. Half precision (fp16) is faster but slightly less accurate. Quantized int8 runs on CPU and is fastest there; the first load converts the weights and caches them. Changes apply on next model load.
         </p>
         <form>
           <div className="precision-options">
@@ -144,6 +155,34 @@ function PrecisionSettingsPanel() {
               />
               <span className="precision-option-name">GPU (Half Precision - fp16)</span>
             </label>
+            <label 
+              className={`precision-option-label ${selectedPrecision === 'bf16' ? 'selected' : ''} ${(isUpdating || selectedPrecision === 'error') ? 'disabled' : ''}`}
+            >
+              <input
+                className="precision-option-input"
+                type="radio"
+                name="precision"
+                value="bf16"
+                checked={selectedPrecision === 'bf16'}
+                onChange={handlePrecisionChange}
+                disabled={isUpdating || selectedPrecision === 'error'}
+              />
+              <span className="precision-option-name">CPU or GPU (Brain Float - bf16)</span>
+            </label>
+            <label 
+              className={`precision-option-label ${selectedPrecision === 'cpu-int8' ? 'selected' : ''} ${(isUpdating || selectedPrecision === 'error') ? 'disabled' : ''}`}
+            >
+              <input
+                className="precision-option-input"
+                type="radio"
+                name="precision"
+                value="cpu-int8"
+                checked={selectedPrecision === 'cpu-int8'}
+                onChange={handlePrecisionChange}
+                disabled={isUpdating || selectedPrecision === 'error'}
+              />
+              <span className="precision-option-name">CPU (Quantized - int8)</span>
+            </label>
             {/*
               Note: The "CPU Only" option is removed as it's implicitly handled.
               Selecting 'GPU (Standard Precision - fp32)' sets the backend to 'fp32',
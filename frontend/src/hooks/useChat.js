@@ -32,6 +32,7 @@ export const useChat = ({
   const preservedHistoryRef = useRef(null); // Ref to store chat history during tab transitions
   const preservedSettingsRef = useRef(null); // Ref to store settings during tab transitions
   const directFetchInProgressRef = useRef(false); // Prevent duplicate fetches
+  const inFlightRequestRef = useRef(null); // { id, controller } of the generation being waited on
 
   // This internal isLoading is specific to the send message operation
   const [isSendingMessage, setIsSendingMessage] = useState(false); 
@@ -273,11 +274,17 @@ export const useChat = ({
     loadingMessageIdRef.current = loadingId;
     setChatHistory(prev => [...prev, { sender: 'backend', text: '', id: loadingId }]);
 
+    // Lets cancelMessage abort the fetch and stop the generation on the backend
+    const requestId = `req-${Date.now()}-${Math.random().toString(36).slice(2, 10)}`;
+    const abortController = new AbortController();
+    inFlightRequestRef.current = { id: requestId, controller: abortController };
+
     try {
       // Use the mode (instruction or chat) to format the payload correctly
       const payload = {
         mode: appChatMode,
         thread_id: currentThreadId, // Use hook's currentThreadId
+        request_id: requestId,
       };
 
       if (activeTabId === NEW_CHAT_TAB_ID || currentThreadId === null) {
@@ -310,6 +317,7 @@ export const useChat = ({
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload),
+        signal: abortController.signal,
       });
 
       if (!response.ok) {
@@ -419,8 +427,12 @@ export const useChat = ({
         }, 250); // Longer delay to ensure tab switching completes
       }
     } catch (e) {
-      console.error("useChat - Error sending message:", e);
-      setSendError(e.message || "Failed to get response from backend.");
+      if (e.name === 'AbortError') {
+        console.log(`useChat: Request ${requestId} was cancelled.`);
+      } else {
+        console.error("useChat - Error sending message:", e);
+        setSendError(e.message || "Failed to get response from backend.");
+      }
       
       const errLoadingId = loadingMessageIdRef.current;
       if (errLoadingId) {
@@ -430,6 +442,9 @@ export const useChat = ({
       preservedHistoryRef.current = null; // Clear preserved history on error
       preservedSettingsRef.current = null; // Clear preserved settings on error
     } finally {
+      if (inFlightRequestRef.current?.id === requestId) {
+        inFlightRequestRef.current = null;
+      }
       setIsSendingMessage(false);
       onSetAppIsLoading?.(false); // Inform App about global loading state
       
@@ -461,6 +476,19 @@ export const useChat = ({
     setSendError,
   ]);
 
+  // Stops the generation in flight: the backend frees its slot, the fetch is aborted
+  const cancelMessage = useCallback(() => {
+    const inFlight = inFlightRequestRef.current;
+    if (!inFlight) return;
+    inFlightRequestRef.current = null;
+    fetch(`${API_BASE_URL}/api/v1/chat/chat/cancel/${encodeURIComponent(inFlight.id)}`, { method: 'POST' })
+      .catch(e => console.warn("useChat - Cancel request failed:", e));
+    inFlight.controller.abort();
+  }, []);
+
+  // Abort a pending generation when the component using the hook unmounts
+  useEffect(() => () => inFlightRequestRef.current?.controller.abort(), []);
+
   return {
     chatHistory,
     setChatHistory,
@@ -470,6 +498,7 @@ export const useChat = ({
     isSendingMessage,
     sendError,
     sendMessage,
+    cancelMessage,
     loadChatState,
     clearChatStateAndSettings,
   };
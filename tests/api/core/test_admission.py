@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+import torch
+
+# Adjust the import path to access the admission module
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from backend.api.core.admission import AdmissionController, AdmissionRejectedError, estimate_generation_bytes
+
+
+class TestAdmissionController(unittest.TestCase):
+    def _wait_in_background(self, controller, cost=0):
+        """Starts a thread blocked in acquire(); returns (thread, result dict)."""
+        result = {}
+
+        def run():
+            try:
+                result["ticket"] = controller.acquire(cost)
+            except AdmissionRejectedError as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        deadline = time.time() + 5
+        while controller.stats()["waiting"] == 0 and "ticket" not in result and time.time() < deadline:
+            time.sleep(0.005)
+        return thread, result
+
+    def test_full_queue_is_rejected_with_429(self):
+        """Beyond max_concurrent requests wait; beyond the queue they are refused at once"""
+        controller = AdmissionController(max_concurrent=1, max_waiting=1, wait_timeout=5, memory_budget=0)
+        running = controller.acquire()
+        thread, waiter = self._wait_in_background(controller)
+
+        with self.assertRaises(AdmissionRejectedError) as ctx:
+            controller.acquire()
+        self.assertEqual(ctx.exception.status_code, 429)
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+
+        controller.release(running)
+        thread.join(5)
+        self.assertIn("ticket", waiter)
+        self.assertEqual(controller.stats()["active"], 1)
+
+    def test_wait_times_out_with_503(self):
+        controller = AdmissionController(max_concurrent=1, max_waiting=4, wait_timeout=0.05, memory_budget=0)
+        controller.acquire()
+        with self.assertRaises(AdmissionRejectedError) as ctx:
+            controller.acquire()
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertEqual(controller.stats()["waiting"], 0)
+
+    def test_memory_budget_limits_concurrency(self):
+        """Requests wait for reserved memory to be released; an oversized request runs alone"""
+        controller = AdmissionController(max_concurrent=4, max_waiting=4, wait_timeout=5, memory_budget=100)
+        first = controller.acquire(60)
+        thread, waiter = self._wait_in_background(controller, 60)
+        self.assertNotIn("ticket", waiter)
+
+        controller.release(first)
+        thread.join(5)
+        self.assertEqual(controller.stats()["reserved_bytes"], 60)
+        controller.release(waiter["ticket"])
+
+        oversized = controller.acquire(500)  # Nothing else is running
+        self.assertEqual(controller.stats()["active"], 1)
+        controller.release(oversized)
+
+    def test_estimate_covers_kv_cache_for_prompt_and_new_tokens(self):
+        config = SimpleNamespace(
+            num_attention_heads=4, num_key_value_heads=2, hidden_size=32, num_hidden_layers=3, intermediate_size=64,
+        )
+        model = SimpleNamespace(config=config, dtype=torch.float16)
+        # KV: 2 * 3 layers * 2 heads * 8 dims * 2 bytes * 30 tokens; prefill: 2 * 10 * (32 + 64) * 2 bytes
+        self.assertEqual(estimate_generation_bytes(model, 10, 20), 5760 + 3840)
+
+
+if __name__ == "__main__":
+    unittest.main()
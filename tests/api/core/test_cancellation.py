@@ -0,0 +1,77 @@
+import threading
+import time
+import unittest
+
+import torch
+
+# Adjust the import path to access the cancellation module
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from backend.api.core.admission import AdmissionController
+from backend.api.core.cancellation import CancellationRegistry, GenerationCancelledError
+from backend.api.core.stopping import CancellationCriteria
+
+
+class TestCancellation(unittest.TestCase):
+    def test_token_is_set_by_cancel_or_disconnect(self):
+        registry = CancellationRegistry()
+        disconnected = threading.Event()
+        token = registry.register("req-1", disconnected)
+        self.assertFalse(token.is_set())
+
+        disconnected.set()
+        self.assertTrue(token.is_set())
+        self.assertEqual(token.reason, "client_disconnected")
+
+        self.assertTrue(registry.cancel("req-1"))
+        self.assertEqual(token.reason, "cancelled")
+
+    def test_registry_rejects_running_ids_and_forgets_released_ones(self):
+        registry = CancellationRegistry()
+        token = registry.register("req-1")
+        with self.assertRaises(ValueError):
+            registry.register("req-1")
+        self.assertEqual(registry.active(), ["req-1"])
+
+        registry.release(token)
+        self.assertFalse(registry.cancel("req-1"))
+        self.assertEqual(registry.active(), [])
+        self.assertTrue(registry.register().request_id)  # Generated id
+
+    def test_stopping_criteria_stops_generation_once_cancelled(self):
+        token = CancellationRegistry().register("req-1")
+        criteria = CancellationCriteria(token)
+        input_ids = torch.zeros((1, 4), dtype=torch.long)
+        self.assertFalse(bool(criteria(input_ids, None)))
+        token.cancel()
+        self.assertTrue(bool(criteria(input_ids, None)))
+
+    def test_cancelled_request_leaves_admission_queue(self):
+        controller = AdmissionController(max_concurrent=1, max_waiting=4, wait_timeout=10, memory_budget=0)
+        running = controller.acquire()
+        token = CancellationRegistry().register("req-1")
+        result = {}
+
+        def wait():
+            try:
+                controller.acquire(cancel=token)
+            except GenerationCancelledError as e:
+                result["error"] = e
+
+        thread = threading.Thread(target=wait, daemon=True)
+        thread.start()
+        deadline = time.time() + 5
+        while controller.stats()["waiting"] == 0 and time.time() < deadline:
+            time.sleep(0.005)
+
+        token.cancel()
+        thread.join(5)
+        self.assertIn("error", result)
+        self.assertEqual(controller.stats()["waiting"], 0)
+        controller.release(running)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import unittest
+
+# Adjust the import path to access the executor module
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from backend.api.core.executor import InferenceExecutor, InferenceQueueFullError
+
+
+class TestInferenceExecutor(unittest.TestCase):
+    """Tests for the bounded inference executor"""
+
+    def setUp(self):
+        self.executor = InferenceExecutor(max_workers=1, max_queue_size=1)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown(wait=True)
+
+    def test_rejects_when_queue_is_full(self):
+        """One running job plus one queued job fill the executor; the next is rejected"""
+        running = self.executor.submit(self.release.wait)
+        queued = self.executor.submit(lambda: "queued")
+
+        self.assertEqual(self.executor.outstanding, 2)
+        self.assertEqual(self.executor.queue_depth, 1)
+        self.assertTrue(self.executor.is_saturated())
+        with self.assertRaises(InferenceQueueFullError):
+            self.executor.submit(lambda: "rejected")
+
+        self.release.set()
+        self.assertTrue(running.result(timeout=5))
+        self.assertEqual(queued.result(timeout=5), "queued")
+        self.assertEqual(self.executor.outstanding, 0)
+
+    def test_run_reports_queue_wait_and_compute_time(self):
+        """run() returns the job result together with separate queue/compute timings"""
+        blocker = self.executor.submit(self.release.wait, 0.05)
+
+        result, timings = asyncio.run(self.executor.run(lambda x: x * 2, 21))
+        blocker.result(timeout=5)
+
+        self.assertEqual(result, 42)
+        self.assertGreater(timings["queue_wait"], 0.0)
+        self.assertGreaterEqual(timings["compute_time"], 0.0)
+
+    def test_errors_release_the_slot(self):
+        """A failing job propagates its exception and frees its slot"""
+        def boom():
+            raise RuntimeError("generation failed")
+
+        future = self.executor.submit(boom)
+        with self.assertRaises(RuntimeError):
+            future.result(timeout=5)
+        self.assertEqual(self.executor.outstanding, 0)
+
+    def test_accepts_work_again_after_shutdown(self):
+        """Each shutdown ends the current pool; the next submit starts a fresh one"""
+        for _ in range(2):
+            self.assertEqual(self.executor.submit(lambda: "before").result(timeout=5), "before")
+            self.executor.shutdown(wait=True)
+        self.assertEqual(self.executor.submit(lambda: "after").result(timeout=5), "after")
+        self.assertEqual(self.executor.outstanding, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
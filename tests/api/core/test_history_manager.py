@@ -13,12 +13,16 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
 
 from backend.api.core.history_manager import (
+    compact_session,
     edit_chat_message,
+    get_session,
     save_chat_messages,
     delete_session,
     HISTORY_DIR,
-    get_session_filepath
+    get_session_filepath,
+    get_session_log_filepath,
 )
+from backend.api.core.config import settings
 
 
 class TestHistoryManager(unittest.TestCase):
@@ -210,6 +214,63 @@ class TestHistoryManager(unittest.TestCase):
         # Assert the edit failed
         self.assertFalse(result)
 
+    def test_dedupe_appends_only_the_new_turn(self):
+        """A client resending the whole conversation only adds its new messages"""
+        conversation = self.test_messages + [
+            {"role": "user", "content": "What's the weather?"},
+            {"role": "assistant", "content": "Sunny."},
+        ]
+        save_chat_messages(self.test_thread_id, conversation, system_prompt="You are a helpful assistant.", dedupe=True)
+        save_chat_messages(self.test_thread_id, conversation, dedupe=True)  # Retried save: nothing new
+
+        self.assertEqual(get_session(self.test_thread_id)["messages"], conversation)
+
+    def test_saves_append_to_the_message_log(self):
+        """A save appends the new messages to the log; the session file is rewritten only when the log is folded in"""
+        log_path = get_session_log_filepath(self.test_thread_id)
+        with open(self.session_path, 'r') as f:
+            saved_file = f.read()
+        conversation = list(self.test_messages)
+        with patch.object(settings, 'history_log_compact_entries', 3):
+            for i in range(2):
+                conversation += [{"role": "user", "content": f"Question {i}"}, {"role": "assistant", "content": f"Answer {i}"}]
+                save_chat_messages(self.test_thread_id, conversation, sampling_settings={"temperature": i}, dedupe=True)
+            with open(self.session_path, 'r') as f:
+                self.assertEqual(f.read(), saved_file)
+            with open(log_path, 'r') as f:
+                self.assertEqual(len(f.readlines()), 2)
+            session = get_session(self.test_thread_id)
+            self.assertEqual(session["messages"], conversation)
+            self.assertEqual(session["sampling_settings"], {"temperature": 1})
+
+            conversation += [{"role": "user", "content": "Question 2"}, {"role": "assistant", "content": "Answer 2"}]
+            save_chat_messages(self.test_thread_id, conversation, dedupe=True)
+            self.assertFalse(os.path.exists(log_path))
+            with open(self.session_path, 'r') as f:
+                self.assertEqual(json.load(f)["messages"], conversation)
+
+        # A log the file already holds (e.g. left behind by a crash) is not applied twice
+        with open(log_path, 'w') as f:
+            f.write(json.dumps({"position": 3, "messages": [{"role": "user", "content": "Question 0"}]}) + "\n")
+        self.assertEqual(get_session(self.test_thread_id)["messages"], conversation)
+        self.assertTrue(edit_chat_message(self.test_thread_id, 1, "Edited"))
+        self.assertFalse(os.path.exists(log_path))
+        self.assertTrue(delete_session(self.test_thread_id))
+
+    def test_compact_session_removes_replayed_history(self):
+        """Files saved before deduplication repeat the conversation on every turn"""
+        system, u1, a1 = self.test_messages
+        u2, a2 = {"role": "user", "content": "Again"}, {"role": "assistant", "content": "Sure"}
+        with open(self.session_path, 'r') as f:
+            session_data = json.load(f)
+        session_data["messages"] = [system, u1, a1, system, u1, a1, u2, a2, system, u1, a1, u2, a2, u1, a1]
+        with open(self.session_path, 'w') as f:
+            json.dump(session_data, f)
+
+        self.assertEqual(compact_session(self.test_thread_id), {"before": 15, "after": 7})
+        self.assertEqual(get_session(self.test_thread_id)["messages"], [system, u1, a1, u2, a2, u1, a1])
+        self.assertTrue(os.path.exists(self.session_path + ".bak"))
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,186 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Adjust the import path to access the history modules
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from backend.api.core import history_manager
+from backend.api.core.config import settings
+from backend.api.core.history_store import HistoryStore, SQLiteHistoryStore, new_messages
+
+
+class TestSQLiteHistoryBackend(unittest.TestCase):
+    """The history_manager API behaves the same on the SQLite backend"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self._patchers = [
+            patch('backend.api.core.history_manager.HISTORY_DIR', self.temp_dir),
+            patch.object(settings, 'history_backend', 'sqlite'),
+            patch.object(settings, 'history_db_path', None),
+        ]
+        for patcher in self._patchers:
+            patcher.start()
+        self.messages = [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": "Hello there!"},
+            {"role": "assistant", "content": "Hi! How can I help you today?"},
+        ]
+
+    def tearDown(self):
+        store = history_manager.get_history_store()
+        for patcher in reversed(self._patchers):
+            patcher.stop()
+        store.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_session_round_trip(self):
+        thread_id = history_manager.save_chat_messages(None, self.messages, {"temperature": 0.7}, "You are a helpful assistant.")
+        conversation = self.messages + [{"role": "user", "content": "Thanks"}, {"role": "assistant", "content": "Anytime."}]
+        history_manager.save_chat_messages(thread_id, conversation, dedupe=True)
+
+        session = history_manager.get_session(thread_id)
+        self.assertEqual(session["messages"], conversation)
+        self.assertEqual(session["sampling_settings"], {"temperature": 0.7})
+        self.assertIn("last_updated", session["metadata"])
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, f"{thread_id}.json")))
+
+        self.assertTrue(history_manager.edit_chat_message(thread_id, 1, "Hey!"))
+        self.assertEqual(history_manager.get_session(thread_id)["messages"][1], {"role": "user", "content": "Hey!", "edited": True})
+        with self.assertRaises(ValueError):
+            history_manager.edit_chat_message(thread_id, 99, "out of range")
+
+        self.assertEqual(history_manager.list_sessions()[0]["title"], "Hey!")
+        self.assertTrue(history_manager.update_session_title(thread_id, "  Greetings  "))
+        self.assertEqual(history_manager.list_sessions()[0]["title"], "Greetings")
+
+        self.assertTrue(history_manager.delete_session(thread_id))
+        self.assertIsNone(history_manager.get_session(thread_id))
+        self.assertFalse(history_manager.delete_session(thread_id))
+
+    def test_database_uses_wal_journal(self):
+        history_manager.save_chat_messages("chat_000001", self.messages)
+        conn = sqlite3.connect(history_manager.get_history_db_path())
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        conn.close()
+
+    def test_session_pages_use_the_indexes(self):
+        thread_ids = [history_manager.save_chat_messages(None, [{"role": "user", "content": f"Question {i}"}]) for i in range(5)]
+        first = history_manager.list_sessions_page(limit=3)
+        rest = history_manager.list_sessions_page(limit=3, cursor=first["next_cursor"])
+        self.assertEqual([s["thread_id"] for s in first["sessions"] + rest["sessions"]], thread_ids[::-1])
+        self.assertIsNone(rest["next_cursor"])
+        self.assertEqual([s["thread_id"] for s in history_manager.list_sessions_page(title_prefix="question 3")["sessions"]], [thread_ids[3]])
+
+        conn = sqlite3.connect(history_manager.get_history_db_path())
+        for query in (
+            "SELECT * FROM sessions WHERE (COALESCE(last_updated, created_at, ''), thread_id) < ('z', 'z') "
+            "ORDER BY COALESCE(last_updated, created_at, '') DESC, thread_id DESC LIMIT 3",
+            "SELECT * FROM sessions WHERE title_key >= 'q' AND title_key < 'r'",
+        ):
+            plan = " ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + query))
+            self.assertIn("USING INDEX", plan)
+        # Title pages seek the title range; the cursor is checked on the same index
+        plan = " ".join(row[-1] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM sessions WHERE title_key >= 'q' AND title_key < 'r' "
+            "AND (COALESCE(last_updated, created_at, ''), thread_id) < ('z', 'z') "
+            "ORDER BY COALESCE(last_updated, created_at, '') DESC, thread_id DESC LIMIT 3"
+        ))
+        self.assertIn("USING INDEX sessions_by_title ", plan)
+        conn.close()
+
+    def test_title_prefix_folds_non_ascii_case(self):
+        thread_id = history_manager.save_chat_messages(None, [{"role": "user", "content": "École de cuisine"}])
+        history_manager.save_chat_messages(None, [{"role": "user", "content": "Ecole primaire"}])
+        self.assertEqual([s["thread_id"] for s in history_manager.list_sessions_page(title_prefix="éc")["sessions"]], [thread_id])
+
+        history_manager.update_session_title(thread_id, "ÜBER")
+        self.assertEqual([s["thread_id"] for s in history_manager.list_sessions_page(title_prefix="üb")["sessions"]], [thread_id])
+
+    def test_adds_title_keys_to_older_databases(self):
+        path = os.path.join(self.temp_dir, "older.sqlite3")
+        conn = sqlite3.connect(path)
+        conn.executescript(
+            "CREATE TABLE sessions (thread_id TEXT PRIMARY KEY, custom_title TEXT, system_prompt TEXT, "
+            "sampling_settings TEXT, created_at TEXT, last_updated TEXT, message_count INTEGER NOT NULL DEFAULT 0, "
+            "first_user_message TEXT);"
+            "INSERT INTO sessions (thread_id, first_user_message) VALUES ('chat_000001', 'Équipe');"
+        )
+        conn.close()
+        store = SQLiteHistoryStore(path)
+        try:
+            self.assertEqual([s["thread_id"] for s in store.list_session_page(10, title_prefix="éq")], ["chat_000001"])
+        finally:
+            store.close()
+
+    def test_dedupe_reads_a_bounded_window(self):
+        history = [{"role": "system", "content": "Be brief."}]
+        for i in range(50):
+            history += [{"role": "user", "content": f"Question {i % 3}"}, {"role": "assistant", "content": f"Answer {i % 3}"}]
+        reply = [{"role": "user", "content": "Question 9"}, {"role": "assistant", "content": "Answer 9"}]
+        cases = [
+            history + reply,  # Full conversation
+            history[-4:] + reply,  # Trimmed to the context window
+            history[:3] + reply,  # Edited after the first exchange
+            [{"role": "system", "content": "Be brief."}] + reply,
+        ]
+        store = SQLiteHistoryStore(os.path.join(self.temp_dir, "window.sqlite3"))
+        try:
+            for i, incoming in enumerate(cases):
+                thread_id = store.save_chat_messages(f"chat_{i:06d}", history)
+                expected = store.get_session(thread_id)["messages"] + new_messages(history, incoming)
+                rows_read = []
+                store._connection().set_trace_callback(rows_read.append)
+                store.save_chat_messages(thread_id, incoming, dedupe=True)
+                store._connection().set_trace_callback(None)
+                self.assertEqual(store.get_session(thread_id)["messages"], expected)
+                self.assertFalse(any("ORDER BY position" in q and "LIMIT" not in q for q in rows_read))
+        finally:
+            store.close()
+
+    def test_import_json_sessions(self):
+        session = {
+            "thread_id": "chat_000007",
+            "messages": self.messages + self.messages,  # Saved with duplicated history
+            "metadata": {"created_at": "2025-01-01T00:00:00+00:00", "last_updated": "2025-01-02T00:00:00+00:00"},
+            "sampling_settings": {"temperature": 0.5},
+            "system_prompt": "You are a helpful assistant.",
+            "custom_title": "Imported",
+        }
+        with open(os.path.join(self.temp_dir, "chat_000007.json"), 'w') as f:
+            json.dump(session, f)
+
+        store = SQLiteHistoryStore(os.path.join(self.temp_dir, "imported.sqlite3"))
+        try:
+            self.assertEqual(history_manager.import_json_sessions(store, compact=True), {"imported": 1, "skipped": 0, "failed": 0})
+            self.assertEqual(history_manager.import_json_sessions(store), {"imported": 0, "skipped": 1, "failed": 0})
+
+            imported = store.get_session("chat_000007")
+            self.assertEqual(imported["messages"], self.messages)
+            self.assertEqual(imported["metadata"], session["metadata"])
+            self.assertEqual(imported["custom_title"], "Imported")
+            # Generated ids continue after the imported ones
+            self.assertEqual(store.save_chat_messages(None, self.messages), "chat_000008")
+        finally:
+            store.close()
+
+
+class TestHistoryStoreInterface(unittest.TestCase):
+    def test_incomplete_store_cannot_be_created(self):
+        class GetOnlyStore(HistoryStore):
+            def get_session(self, thread_id):
+                return None
+
+        with self.assertRaises(TypeError):
+            GetOnlyStore()
+
+
+if __name__ == "__main__":
+    unittest.main()
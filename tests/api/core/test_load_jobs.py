@@ -0,0 +1,122 @@
+import unittest
+import threading
+import time
+
+# Adjust the import path to access the load_jobs module
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from backend.api.core import load_jobs as load_jobs_module
+from backend.api.core.load_jobs import LoadJobManager
+
+
+def wait_for(job, states, timeout=5.0):
+    deadline = time.time() + timeout
+    while job.to_dict()["state"] not in states:
+        if time.time() > deadline:
+            raise AssertionError(f"job stuck in {job.to_dict()['state']}")
+        time.sleep(0.01)
+    return job.to_dict()
+
+
+class TestLoadJobs(unittest.TestCase):
+    def setUp(self):
+        self.manager = LoadJobManager()
+        self.published = []
+        self.shards = [("model-00001-of-00002.safetensors", 100), ("model-00002-of-00002.safetensors", 50)]
+
+    def _publish(self, job, tokenizer, model, device):
+        self.published.append((job.id, model))
+
+    def test_progress_is_reported_per_shard_and_byte(self):
+        """Shard and tensor hooks drive shards_loaded and bytes_loaded; the loaded model is published"""
+        midway = {}
+
+        def load(path):
+            job = load_jobs_module._job_context.job
+            job._shard_started("/models/x/model-00001-of-00002.safetensors")
+            job._tensor_loaded(60)
+            midway.update(job.to_dict())
+            job._tensor_loaded(40)
+            job._shard_finished("/models/x/model-00001-of-00002.safetensors")
+            job._shard_started("/models/x/model-00002-of-00002.safetensors")
+            job._tensor_loaded(50)
+            job._shard_finished("/models/x/model-00002-of-00002.safetensors")
+            return "tokenizer", "model", "cpu"
+
+        job = self.manager.submit("x", "backend/models/x", self.shards, load, self._publish)
+        status = wait_for(job, ("loaded", "failed"))
+
+        self.assertEqual(midway["bytes_loaded"], 60)
+        self.assertEqual(midway["current_shard"], "model-00001-of-00002.safetensors")
+        self.assertEqual(status["state"], "loaded")
+        self.assertEqual((status["shards_loaded"], status["bytes_loaded"], status["progress"]), (2, 150, 1.0))
+        self.assertEqual(self.published, [(job.id, "model")])
+
+    def test_running_job_is_cancelled_at_the_next_tensor(self):
+        """Cancelling a running job aborts the load and nothing is published"""
+        started = threading.Event()
+        proceed = threading.Event()
+
+        def load(path):
+            job = load_jobs_module._job_context.job
+            job._shard_started("model-00001-of-00002.safetensors")
+            started.set()
+            proceed.wait(5)
+            job._tensor_loaded(10)  # Raises once cancelled
+            return "tokenizer", "model", "cpu"
+
+        job = self.manager.submit("x", "backend/models/x", self.shards, load, self._publish)
+        started.wait(5)
+        self.manager.cancel(job.id)
+        proceed.set()
+
+        self.assertEqual(wait_for(job, ("loaded", "failed", "cancelled"))["state"], "cancelled")
+        self.assertEqual(self.published, [])
+
+    def test_failures_are_reported(self):
+        """A load error ends the job as failed with the error message"""
+        def load(path):
+            raise RuntimeError("weights are corrupt")
+
+        job = self.manager.submit("x", "backend/models/x", self.shards, load, self._publish)
+        status = wait_for(job, ("loaded", "failed"))
+        self.assertEqual(status["state"], "failed")
+        self.assertIn("corrupt", status["error"])
+
+
+    def test_waiting_loads_run_one_at_a_time(self):
+        """Synchronous loads wait behind each other and get their own result or error back"""
+        active, overlaps = [], []
+
+        def load(path):
+            if active:
+                overlaps.append(path)
+            active.append(path)
+            time.sleep(0.05)
+            active.remove(path)
+            if path == "bad":
+                raise ValueError("no such directory")
+            return "tokenizer", path, "cpu"
+
+        results = {}
+
+        def load_and_wait(path):
+            job = self.manager.submit(path, path, [], load, self._publish)
+            try:
+                results[path] = self.manager.wait(job, timeout=5).to_dict()["state"]
+            except ValueError as e:
+                results[path] = str(e)
+
+        threads = [threading.Thread(target=load_and_wait, args=(path,)) for path in ("a", "b", "bad")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [])
+        self.assertEqual(results, {"a": "loaded", "b": "loaded", "bad": "no such directory"})
+
+
+if __name__ == "__main__":
+    unittest.main()
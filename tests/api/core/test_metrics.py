@@ -0,0 +1,57 @@
+import unittest
+
+# Adjust the import path to access the metrics module
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.api.core.metrics import Counter, Histogram, MetricsMiddleware, render_gauge, router_label
+
+
+class TestMetricsRendering(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        """Observations land in the first bucket >= value and bucket counts accumulate"""
+        histogram = Histogram("test_latency_seconds", "Test latency.", ("router",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(value, "chat")
+
+        lines = histogram.render()
+        self.assertIn('test_latency_seconds_bucket{router="chat",le="0.1"} 1', lines)
+        self.assertIn('test_latency_seconds_bucket{router="chat",le="1"} 3', lines)
+        self.assertIn('test_latency_seconds_bucket{router="chat",le="+Inf"} 4', lines)
+        self.assertIn('test_latency_seconds_count{router="chat"} 4', lines)
+        self.assertIn('test_latency_seconds_sum{router="chat"} 4.05', lines)
+
+    def test_counter_and_gauge_labels(self):
+        """Counters accumulate per label set; gauges skip missing values and escape labels"""
+        counter = Counter("test_requests_total", "Test requests.", ("status",))
+        counter.inc(1, "200")
+        counter.inc(2, "200")
+        self.assertIn('test_requests_total{status="200"} 3', counter.render())
+
+        lines = render_gauge("test_model_loaded", "Test gauge.", [({"model": 'a"b'}, 1), ({"model": "c"}, None)])
+        self.assertEqual(lines[2:], ['test_model_loaded{model="a\\"b"} 1'])
+
+    def test_middleware_labels_requests_by_router(self):
+        """Requests are counted under the router their path belongs to"""
+        from backend.api.core import metrics
+
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get("/api/v1/system/ping")
+        def ping():
+            return {"ok": True}
+
+        before = metrics.http_requests_total._values.get(("system", "GET", "200"), 0)
+        TestClient(app).get("/api/v1/system/ping")
+        self.assertEqual(metrics.http_requests_total._values[("system", "GET", "200")], before + 1)
+        self.assertEqual(router_label("/api/v1/model/load/tiny"), "models")
+        self.assertEqual(router_label("/health"), "other")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+
+# Adjust the import path to access the model_registry module
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from backend.api.core.model_registry import ModelBudgetError, ModelRegistry
+
+
+class FakeModel:
+    def __init__(self, key, nbytes):
+        self.key = key
+        self.nbytes = nbytes
+
+    def get_memory_footprint(self):
+        return self.nbytes
+
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.sizes = {"a": 100, "b": 100, "c": 150}
+        self.loaded = []
+        self.unloaded = []
+
+    def _registry(self, max_models, max_bytes=0):
+        def load(key):
+            self.loaded.append(key)
+            return "tok-" + key, FakeModel(key, self.sizes[key]), "cpu", 0.1
+
+        return ModelRegistry(
+            load, lambda entry: self.unloaded.append(entry.key),
+            estimate_fn=lambda key: self.sizes[key], max_models=max_models, max_bytes=max_bytes,
+        )
+
+    def test_hits_do_not_reload_and_lru_is_evicted_by_count(self):
+        """Switching between resident models is a hit; the least recently used model is evicted"""
+        registry = self._registry(max_models=2)
+        registry.get("a")
+        registry.get("b")
+        registry.get("a")  # a is now most recently used
+        registry.get("c")
+
+        self.assertEqual(self.loaded, ["a", "b", "c"])
+        self.assertEqual(self.unloaded, ["b"])
+        stats = registry.stats()
+        self.assertEqual([entry["key"] for entry in stats["resident"]], ["c", "a"])
+        self.assertEqual((stats["hits"], stats["misses"], stats["loads"], stats["evictions"]), (1, 3, 3, 1))
+
+    def test_memory_budget_evicts_before_loading(self):
+        """The estimated size of the incoming model makes room first; pinned models stay resident"""
+        registry = self._registry(max_models=3, max_bytes=260)
+        registry.get("a", pin=True)
+        registry.get("b")
+        registry.get("c")  # 100 + 100 + 150 > 260: b goes, pinned a stays
+
+        self.assertEqual(self.unloaded, ["b"])
+        self.assertEqual(registry.stats()["resident_bytes"], 250)
+
+    def test_pinned_models_are_never_evicted_for_another_model(self):
+        """A request that needs the active model's slot is refused instead of unloading it"""
+        registry = self._registry(max_models=1)
+        registry.get("a", pin=True)
+        with self.assertRaises(ModelBudgetError):
+            registry.get("b")
+        self.assertEqual(self.unloaded, [])
+        self.assertIsNotNone(registry.peek("a"))
+
+        registry.unpin("a")
+        registry.get("b")
+        self.assertEqual(self.unloaded, ["a"])
+
+    def test_variant_change_replaces_resident_model(self):
+        """A model resident in another precision is reloaded, keeping its pin"""
+        registry = self._registry(max_models=1)
+        registry.get("a", pin=True, variant="fp32")
+        entry = registry.get("a", variant="fp16")
+
+        self.assertEqual(self.loaded, ["a", "a"])
+        self.assertEqual(entry.variant, "fp16")
+        self.assertTrue(entry.pinned)
+
+    def test_hot_swap_frees_old_model_after_leases_drain(self):
+        """The replacement loads alongside the leased active model, which is unloaded only when released"""
+        registry = self._registry(max_models=1)
+        registry.get("a", pin=True)
+        lease = registry.lease(registry.peek("a").model)
+
+        registry.get("b", pin=True, replacing="a")
+        registry.unpin("a")
+        registry.settle()
+        self.assertIsNone(registry.peek("a"))
+        self.assertEqual(self.unloaded, [])  # Still serving the in-flight request
+        self.assertEqual(registry.stats()["retired"], [{"key": "a", "leases": 1}])
+
+        registry.release(lease)
+        self.assertEqual(self.unloaded, ["a"])
+        self.assertEqual(registry.stats()["retired"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
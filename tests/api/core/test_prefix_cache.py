@@ -0,0 +1,175 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Adjust the import path to access the prefix_cache module
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+import torch
+from transformers import DynamicCache, LlamaConfig, LlamaForCausalLM
+
+from backend.api.core.config import settings
+from backend.api.core.history_manager import edit_chat_message, get_kv_snapshot_filepath, save_chat_messages
+from backend.api.core.prefix_cache import PrefixCache, cache_nbytes
+
+
+def tiny_model():
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256,
+        bos_token_id=1, eos_token_id=2, pad_token_id=0,
+    )
+    return LlamaForCausalLM(config).eval()
+
+
+class TestPrefixCache(unittest.TestCase):
+    """Tests for the per-thread prefix KV cache"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = tiny_model()
+
+    def _generate(self, ids, **kwargs):
+        input_ids = torch.tensor([ids])
+        return self.model.generate(
+            input_ids=input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=8,
+            do_sample=False, pad_token_id=0, eos_token_id=None, return_dict_in_generate=True, **kwargs
+        )
+
+    def _store(self, cache, key, outputs):
+        past = outputs.past_key_values
+        cache.put(key, self.model, outputs.sequences[0][:past.get_seq_length()].tolist(), past)
+
+    def test_follow_up_turn_reuses_shared_prefix(self):
+        """The next turn only prefills its new tokens and decodes exactly as without the cache"""
+        cache = PrefixCache(max_bytes=10 * 1024 * 1024)
+        first_turn = [1, 5, 6, 7, 8, 9]
+        self._store(cache, "chat_000001", self._generate(first_turn))
+
+        # Next prompt: first turn, a different "cleaned" reply, then a new user message
+        next_prompt = first_turn + [10, 11, 12, 13]
+        past, reused = cache.take("chat_000001", self.model, next_prompt)
+        self.assertEqual(reused, len(first_turn))
+
+        with_cache = self._generate(next_prompt, past_key_values=past).sequences
+        without_cache = self._generate(next_prompt).sequences
+        self.assertEqual(with_cache.tolist(), without_cache.tolist())
+
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["tokens_reused"], len(first_turn))
+
+    def test_always_leaves_one_token_to_prefill(self):
+        """An identical prompt still reserves its last token for the forward pass"""
+        cache = PrefixCache(max_bytes=10 * 1024 * 1024)
+        prompt = [1, 5, 6, 7]
+        self._store(cache, "t", self._generate(prompt))
+        past, reused = cache.take("t", self.model, prompt)
+        self.assertEqual(reused, len(prompt) - 1)
+        self.assertEqual(past.get_seq_length(), len(prompt) - 1)
+
+    def test_other_model_is_a_miss(self):
+        """Entries produced by a different model object are never reused"""
+        cache = PrefixCache(max_bytes=10 * 1024 * 1024)
+        self._store(cache, "t", self._generate([1, 5, 6, 7]))
+        past, reused = cache.take("t", object(), [1, 5, 6, 7, 8])
+        self.assertIsNone(past)
+        self.assertEqual(reused, 0)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_evicts_least_recently_used_over_budget(self):
+        """Storing beyond the memory budget evicts the oldest thread first"""
+        outputs = self._generate([1, 5, 6, 7])
+        entry_bytes = cache_nbytes(outputs.past_key_values)
+        cache = PrefixCache(max_bytes=int(entry_bytes * 2.5))
+
+        for key in ("a", "b", "c"):
+            self._store(cache, key, self._generate([1, 5, 6, 7]))
+
+        stats = cache.stats()
+        self.assertEqual(stats["entries"], 2)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertIsNone(cache.take("a", self.model, [1, 5, 6, 7, 8])[0])
+        self.assertIsNotNone(cache.take("c", self.model, [1, 5, 6, 7, 8])[0])
+
+    def test_rejects_cache_not_matching_token_ids(self):
+        """A cache whose length differs from the recorded ids is not stored"""
+        cache = PrefixCache(max_bytes=10 * 1024 * 1024)
+        cache.put("t", self.model, [1, 2, 3], DynamicCache())
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+class TestKVSnapshots(unittest.TestCase):
+    """Tests for spilling thread caches to disk and restoring them"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = tiny_model()
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self._patchers = [
+            patch('backend.api.core.history_manager.HISTORY_DIR', self.temp_dir),
+            patch.object(settings, "kv_snapshots_enabled", True),
+        ]
+        for patcher in self._patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self._patchers:
+            patcher.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def _generate(self, ids, **kwargs):
+        return TestPrefixCache._generate(self, ids, **kwargs)
+
+    def _store(self, cache, key, outputs):
+        TestPrefixCache._store(self, cache, key, outputs)
+
+    def test_idle_thread_is_restored_from_disk(self):
+        """A spilled thread resumes from its snapshot with the same output as a full prefill"""
+        first_turn = [1, 5, 6, 7, 8, 9]
+        cache = PrefixCache(max_bytes=10 * 1024 * 1024)
+        self._store(cache, "chat_000001", self._generate(first_turn))
+        self.assertEqual(cache.spill_idle(0), 1)
+        self.assertEqual(cache.stats()["entries"], 0)
+        self.assertTrue(os.path.exists(get_kv_snapshot_filepath("chat_000001")))
+
+        # A fresh process: nothing in memory, only the snapshot on disk
+        restarted = PrefixCache(max_bytes=10 * 1024 * 1024)
+        next_prompt = first_turn + [10, 11, 12]
+        past, reused = restarted.take("chat_000001", self.model, next_prompt)
+        self.assertEqual(reused, len(first_turn))
+        self.assertEqual(restarted.stats()["snapshots_restored"], 1)
+        self.assertEqual(self._generate(next_prompt, past_key_values=past).sequences.tolist(),
+                         self._generate(next_prompt).sequences.tolist())
+
+    def test_evicted_thread_is_written_and_pending_keys_are_not(self):
+        """LRU eviction spills saved threads but never in-flight pending keys"""
+        outputs = self._generate([1, 5, 6, 7])
+        cache = PrefixCache(max_bytes=int(cache_nbytes(outputs.past_key_values) * 1.5))
+        self._store(cache, "pending:abc", self._generate([1, 5, 6, 7]))
+        self._store(cache, "chat_000002", self._generate([1, 5, 6, 7]))
+        self._store(cache, "chat_000003", self._generate([1, 5, 6, 7]))
+        self.assertEqual(cache.stats()["snapshots_written"], 1)
+        self.assertTrue(os.path.exists(get_kv_snapshot_filepath("chat_000002")))
+
+    def test_editing_a_message_removes_the_snapshot(self):
+        """edit_chat_message invalidates the snapshot computed from the old content"""
+        thread_id = save_chat_messages("chat_000009", [{"role": "user", "content": "hi"}])
+        cache = PrefixCache(max_bytes=10 * 1024 * 1024)
+        self._store(cache, thread_id, self._generate([1, 5, 6, 7]))
+        cache.spill_all()
+        self.assertTrue(os.path.exists(get_kv_snapshot_filepath(thread_id)))
+
+        self.assertTrue(edit_chat_message(thread_id, 0, "hello"))
+        self.assertFalse(os.path.exists(get_kv_snapshot_filepath(thread_id)))
+
+
+if __name__ == "__main__":
+    unittest.main()
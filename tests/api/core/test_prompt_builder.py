@@ -0,0 +1,76 @@
+import unittest
+
+# Adjust the import path to access the prompt_builder module
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from backend.api.core.prompt_builder import generate_prompt, pack_history, token_counts
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word; renders prompts with the plain fallback format."""
+
+    prompt_mode = "fallback"
+    name_or_path = "word-tokenizer"
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text, add_special_tokens=True, **kwargs):
+        self.calls += 1
+        return {"input_ids": [0] * len(text.split())}
+
+    def __len__(self):
+        return 1000
+
+
+def conversation(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "word " * 8})
+        messages.append({"role": "assistant", "content": f"answer {i} " + "word " * 8})
+    messages.append({"role": "user", "content": "last question"})
+    return messages
+
+
+class TestHistoryPacking(unittest.TestCase):
+    def setUp(self):
+        token_counts.clear()
+        self.tokenizer = WordTokenizer()
+
+    def test_keeps_most_recent_turns_within_budget(self):
+        messages = conversation(20)
+        prompt = generate_prompt("chat", "Be brief.", self.tokenizer, messages=messages, context_window=150, max_new_tokens=50)
+
+        self.assertLessEqual(len(prompt.split()), 100)
+        self.assertTrue(prompt.startswith("Be brief."))
+        self.assertIn("last question", prompt)
+        self.assertIn("answer 19", prompt)
+        self.assertNotIn("question 0 ", prompt)
+        # The packed history starts at a user turn
+        self.assertTrue(prompt.split("\n")[2].startswith("User:"))
+
+    def test_history_that_fits_is_untouched(self):
+        messages = conversation(2)
+        self.assertEqual(
+            generate_prompt("chat", "Be brief.", self.tokenizer, messages=messages, context_window=4096, max_new_tokens=100),
+            generate_prompt("chat", "Be brief.", self.tokenizer, messages=messages),
+        )
+
+    def test_message_counts_are_cached_between_turns(self):
+        messages = conversation(10)
+        pack_history(messages, "Be brief.", self.tokenizer, budget=1000)
+        calls = self.tokenizer.calls
+
+        messages += [{"role": "assistant", "content": "new answer"}, {"role": "user", "content": "next"}]
+        pack_history(messages, "Be brief.", self.tokenizer, budget=1000)
+        self.assertEqual(self.tokenizer.calls - calls, 2)  # Only the two new messages
+
+    def test_newest_message_is_kept_even_if_too_long(self):
+        messages = [{"role": "user", "content": "word " * 500}]
+        self.assertEqual(pack_history(messages, "Be brief.", self.tokenizer, budget=10), messages)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+
+# Adjust the import path to access the prompt_cache module
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from backend.api.core.prompt_builder import generate_prompt
+from backend.api.core.prompt_cache import PromptSegmentCache
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word; counts how much text it tokenizes."""
+
+    prompt_mode = "fallback"
+    name_or_path = "word-tokenizer"
+
+    def __init__(self):
+        self.words_tokenized = 0
+
+    def __call__(self, text, add_special_tokens=True, **kwargs):
+        words = text.split()
+        self.words_tokenized += len(words)
+        return {"input_ids": [sum(map(ord, word)) for word in words]}
+
+    def __len__(self):
+        return 1000
+
+
+class FoldedSystemTokenizer(WordTokenizer):
+    """Llama-2 style template: the system prompt is folded into the first user turn."""
+
+    prompt_mode = "template"
+    name_or_path = "folded-tokenizer"
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=True):
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        parts = []
+        for i, m in enumerate(m for m in messages if m["role"] != "system"):
+            if m["role"] == "user":
+                prefix = f"<<SYS>> {system} <</SYS>> " if i == 0 else ""
+                parts.append(f"[INST] {prefix}{m['content']} [/INST]")
+            else:
+                parts.append(f" {m['content']} </s>")
+        return "".join(parts)
+
+
+class ContinuationTokenizer(WordTokenizer):
+    """A line ending in "+" continues on the next line, so its last word merges with the next one."""
+
+    name_or_path = "continuation-tokenizer"
+
+    def __call__(self, text, add_special_tokens=True, **kwargs):
+        return super().__call__(text.replace("+\n", "+"), add_special_tokens, **kwargs)
+
+
+def turn(i):
+    return [{"role": "user", "content": f"question {i}"}, {"role": "assistant", "content": f"answer {i}"}]
+
+
+class TestPromptSegmentCache(unittest.TestCase):
+    def test_new_turn_only_renders_new_messages(self):
+        cache = PromptSegmentCache(max_threads=8, verify_interval=1)
+        tokenizer = WordTokenizer()
+        messages = []
+        for i in range(6):
+            messages += turn(i)
+            conversation = messages + [{"role": "user", "content": "next question"}]
+            prompt = cache.render("thread-1", "chat", "Be brief.", tokenizer, messages=conversation)
+            self.assertEqual(prompt, generate_prompt("chat", "Be brief.", tokenizer, messages=conversation))
+            self.assertEqual(cache.encode("thread-1", prompt, tokenizer), tokenizer(prompt)["input_ids"])
+
+        stats = cache.stats()
+        self.assertEqual(stats["mismatches"], 0)
+        self.assertEqual(stats["full_renders"], 0)
+        # Turn i renders its question, its answer and (once) the repeated trailing message
+        self.assertEqual(stats["segments_rendered"], 2 * 6 + 1)
+
+    def test_encode_reuses_cached_ids_without_tokenizing(self):
+        cache = PromptSegmentCache(max_threads=8, verify_interval=0)
+        tokenizer = WordTokenizer()
+        prompt = cache.render("thread-1", "chat", "Be brief.", tokenizer, messages=turn(0) + turn(1))
+        before = tokenizer.words_tokenized
+        cache.encode("thread-1", prompt, tokenizer)
+        self.assertEqual(tokenizer.words_tokenized, before)
+
+        cache.encode("thread-1", prompt + " changed", tokenizer)  # Not the cached prompt
+        self.assertGreater(tokenizer.words_tokenized, before)
+
+    def test_dependent_segments_fall_back_to_full_render(self):
+        cache = PromptSegmentCache(max_threads=8, verify_interval=0)
+        tokenizer = FoldedSystemTokenizer()
+        conversation = turn(0) + turn(1) + [{"role": "user", "content": "next question"}]
+        prompt = cache.render("thread-1", "chat", "Be brief.", tokenizer, messages=conversation)
+
+        self.assertEqual(prompt, generate_prompt("chat", "Be brief.", tokenizer, messages=conversation))
+        self.assertEqual(cache.stats()["unstitchable_formats"], 1)
+        self.assertEqual(cache.stats()["full_renders"], 1)
+
+    def test_new_boundaries_are_checked_for_merges(self):
+        cache = PromptSegmentCache(max_threads=8, verify_interval=0)
+        tokenizer = ContinuationTokenizer()
+        conversation = turn(0) + [{"role": "user", "content": "two +"}, {"role": "assistant", "content": "three"}]
+        for end in (len(conversation) - 1, len(conversation)):
+            prompt = cache.render("thread-1", "chat", "Be brief.", tokenizer, messages=conversation[:end])
+            self.assertEqual(cache.encode("thread-1", prompt, tokenizer), tokenizer(prompt)["input_ids"])
+
+        self.assertEqual(cache.stats()["boundary_merges"], 2)
+        self.assertEqual(cache.stats()["mismatches"], 0)
+        # Boundaries that tokenized cleanly aren't tokenized again
+        cache.render("thread-1", "chat", "Be brief.", tokenizer, messages=turn(0))
+        before = tokenizer.words_tokenized
+        prompt = cache.render("thread-1", "chat", "Be brief.", tokenizer, messages=turn(0))
+        self.assertEqual(tokenizer.words_tokenized, before)
+        self.assertEqual(cache.encode("thread-1", prompt, tokenizer), tokenizer(prompt)["input_ids"])
+
+
+if __name__ == "__main__":
+    unittest.main()
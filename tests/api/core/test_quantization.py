@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+import torch
+import torch.ao.nn.quantized.dynamic as nnqd
+from transformers import GenerationConfig, LlamaConfig, LlamaForCausalLM
+
+# Adjust the import path to access the quantization module
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from backend.api.core.quantization import cache_dir, load_int8_model
+
+
+class TestInt8Quantization(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.model_path = self.tmp.name
+        torch.manual_seed(0)
+        config = LlamaConfig(
+            vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+            num_attention_heads=4, num_key_value_heads=4, max_position_embeddings=64,
+        )
+        LlamaForCausalLM(config).save_pretrained(self.model_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _generate(self, model):
+        return model.generate(torch.tensor([[1, 2, 3, 4]]), max_new_tokens=5, do_sample=False, pad_token_id=0)
+
+    def test_quantized_weights_are_cached_and_reused(self):
+        """The first load quantizes and caches; the second reads the cache and generates identically"""
+        cold, from_cache = load_int8_model(self.model_path)
+        self.assertFalse(from_cache)
+        self.assertIsInstance(cold.model.layers[0].mlp.up_proj, nnqd.Linear)
+        self.assertTrue(os.path.isfile(os.path.join(cache_dir(self.model_path), "int8-dynamic.pt")))
+
+        warm, from_cache = load_int8_model(self.model_path)
+        self.assertTrue(from_cache)
+        self.assertIsInstance(warm.model.layers[0].mlp.up_proj, nnqd.Linear)
+        self.assertTrue(torch.equal(self._generate(cold), self._generate(warm)))
+
+    def test_cached_load_keeps_the_generation_config(self):
+        """generation_config.json (e.g. several EOS ids) survives loading from the cache"""
+        GenerationConfig(eos_token_id=[2, 5], max_length=77).save_pretrained(self.model_path)
+        cold, _ = load_int8_model(self.model_path)
+        warm, from_cache = load_int8_model(self.model_path)
+        self.assertTrue(from_cache)
+        self.assertEqual(warm.generation_config.eos_token_id, [2, 5])
+        self.assertEqual(warm.generation_config.to_dict(), cold.generation_config.to_dict())
+
+    def test_changed_checkpoint_invalidates_the_cache(self):
+        """Rewriting the source weights makes the cached int8 copy stale"""
+        load_int8_model(self.model_path)
+        weights = os.path.join(self.model_path, "model.safetensors")
+        stat = os.stat(weights)
+        os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        _, from_cache = load_int8_model(self.model_path)
+        self.assertFalse(from_cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Adjust the import path to access the history modules
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from backend.api.core import history_manager
+from backend.api.core.session_index import SessionIndex
+
+
+class TestSessionIndex(unittest.TestCase):
+    """Listing the JSON sessions reads the index instead of every session file"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.patcher = patch('backend.api.core.history_manager.HISTORY_DIR', self.temp_dir)
+        self.patcher.start()
+        self.messages = [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": "Hello there!"},
+            {"role": "assistant", "content": "Hi! How can I help you today?"},
+        ]
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.temp_dir)
+
+    def _list_without_reading_files(self):
+        with patch.object(history_manager, '_read_session_file', side_effect=AssertionError("session file read")):
+            return history_manager.list_sessions()
+
+    def test_write_paths_keep_the_index_current(self):
+        first = history_manager.save_chat_messages(None, self.messages)
+        second = history_manager.save_chat_messages(None, self.messages[:2])
+        self.assertEqual(len(history_manager.list_sessions()), 2) # Builds the index
+        self.assertTrue(os.path.exists(os.path.join(self.temp_dir, history_manager.SESSION_INDEX_FILENAME)))
+
+        history_manager.save_chat_messages(second, self.messages, dedupe=True)
+        history_manager.update_session_title(first, "Renamed")
+        history_manager.edit_chat_message(second, 1, "Edited question")
+        sessions = {s["thread_id"]: s for s in self._list_without_reading_files()}
+        self.assertEqual(sessions[first]["title"], "Renamed")
+        self.assertEqual(sessions[second]["title"], "Edited question")
+        self.assertEqual(sessions[second]["message_count"], 3)
+
+        history_manager.delete_session(first)
+        self.assertEqual([s["thread_id"] for s in self._list_without_reading_files()], [second])
+
+    def test_reconciles_with_files_changed_outside_the_write_paths(self):
+        kept = history_manager.save_chat_messages(None, self.messages)
+        removed = history_manager.save_chat_messages(None, self.messages)
+        history_manager.list_sessions()
+
+        os.remove(os.path.join(self.temp_dir, f"{removed}.json"))
+        with open(os.path.join(self.temp_dir, "chat_000099.json"), 'w') as f:
+            json.dump({"thread_id": "chat_000099", "messages": self.messages,
+                       "metadata": {"created_at": "2025-01-01T00:00:00+00:00"}}, f)
+
+        self.assertEqual(sorted(s["thread_id"] for s in history_manager.list_sessions()), sorted(["chat_000099", kept]))
+        # Both changes were recorded, so the next listing reads nothing
+        self.assertEqual(len(self._list_without_reading_files()), 2)
+
+    def test_journal_folds_and_compacts(self):
+        path = os.path.join(self.temp_dir, "index.jsonl")
+        index = SessionIndex(path)
+        for i in range(100):
+            index.put("chat_000001", {"message_count": i})
+        index.put("chat_000002", {"message_count": 1})
+        index.remove("chat_000002")
+        with open(path, 'a') as f:
+            f.write('{"thread_id": "chat_0000') # Cut short mid-append
+
+        self.assertEqual(SessionIndex(path).entries(), {"chat_000001": {"message_count": 99}})
+        with open(path) as f:
+            self.assertLess(len(f.readlines()), 100)
+
+    def _write_session(self, thread_id, title, last_updated):
+        with open(os.path.join(self.temp_dir, f"{thread_id}.json"), 'w') as f:
+            json.dump({"thread_id": thread_id, "messages": [{"role": "user", "content": title}],
+                       "metadata": {"created_at": last_updated, "last_updated": last_updated}}, f)
+
+    def test_pages_follow_the_cursor_and_filters(self):
+        # Two sessions share a timestamp, so the thread id breaks the tie
+        days = ["2025-01-01", "2025-01-02", "2025-01-02", "2025-01-03", "2025-01-04"]
+        for i, day in enumerate(days):
+            self._write_session(f"chat_{i:06d}", "Recipe ideas" if i % 2 else "Travel plans", f"{day}T00:00:00+00:00")
+        newest_first = ["chat_000004", "chat_000003", "chat_000002", "chat_000001", "chat_000000"]
+
+        pages, cursor = [], None
+        while True:
+            page = history_manager.list_sessions_page(limit=2, cursor=cursor)
+            pages.append([s["thread_id"] for s in page["sessions"]])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(pages, [newest_first[:2], newest_first[2:4], newest_first[4:]])
+        self.assertEqual([s["thread_id"] for s in history_manager.list_sessions()], newest_first)
+
+        page = history_manager.list_sessions_page(
+            updated_after=datetime.datetime(2025, 1, 2), updated_before=datetime.datetime(2025, 1, 4))
+        self.assertEqual([s["thread_id"] for s in page["sessions"]], ["chat_000003", "chat_000002", "chat_000001"])
+
+        page = history_manager.list_sessions_page(limit=1, title_prefix="recipe")
+        self.assertEqual([s["thread_id"] for s in page["sessions"]], ["chat_000003"])
+        page = history_manager.list_sessions_page(limit=1, title_prefix="recipe", cursor=page["next_cursor"])
+        self.assertEqual([s["thread_id"] for s in page["sessions"]], ["chat_000001"])
+        self.assertIsNone(page["next_cursor"])
+
+        # Updates move a session to the front of the pages
+        history_manager.update_session_title("chat_000000", "Recipe: soup")
+        page = history_manager.list_sessions_page(limit=1, title_prefix="RECIPE", cursor=None)
+        self.assertEqual([s["thread_id"] for s in page["sessions"]], ["chat_000000"])
+
+        with self.assertRaises(ValueError):
+            history_manager.list_sessions_page(cursor="bm90LWEta2V5")
+
+    def test_title_prefix_folds_non_ascii_case(self):
+        self._write_session("chat_000001", "École de cuisine", "2025-01-01T00:00:00+00:00")
+        self._write_session("chat_000002", "Ecole primaire", "2025-01-02T00:00:00+00:00")
+        page = history_manager.list_sessions_page(title_prefix="éc")
+        self.assertEqual([s["thread_id"] for s in page["sessions"]], ["chat_000001"])
+
+
+if __name__ == "__main__":
+    unittest.main()
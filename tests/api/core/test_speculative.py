@@ -0,0 +1,131 @@
+import copy
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Adjust the import path to access the inference module
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+from backend.api.core import model_loader
+from backend.api.core.inference import _ForwardCounter, _speculative_stats
+
+
+class TestSpeculativeDecodingStats(unittest.TestCase):
+    """Tests for the acceptance-rate estimate of assisted generation"""
+
+    @classmethod
+    def setUpClass(cls):
+        torch.manual_seed(0)
+        config = LlamaConfig(
+            vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+            num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=256,
+            bos_token_id=1, eos_token_id=2, pad_token_id=0,
+        )
+        cls.model = LlamaForCausalLM(config).eval()
+
+    def _generate(self, draft):
+        input_ids = torch.tensor([[1, 5, 6, 7, 8]])
+        with torch.no_grad(), _ForwardCounter(self.model) as verify, _ForwardCounter(draft) as proposals:
+            outputs = self.model.generate(
+                input_ids=input_ids, attention_mask=torch.ones_like(input_ids), max_new_tokens=24,
+                do_sample=False, pad_token_id=0, eos_token_id=None, assistant_model=draft,
+            )
+        generated = outputs.shape[1] - input_ids.shape[1]
+        return outputs, _speculative_stats(generated, verify.calls, proposals.calls)
+
+    def test_identical_draft_is_always_accepted(self):
+        """A draft equal to the main model gets every proposed token accepted"""
+        outputs, stats = self._generate(copy.deepcopy(self.model))
+        self.assertGreater(stats["draft_tokens_proposed"], 0)
+        self.assertEqual(stats["acceptance_rate"], 1.0)
+
+        reference = self.model.generate(
+            input_ids=torch.tensor([[1, 5, 6, 7, 8]]), max_new_tokens=24,
+            do_sample=False, pad_token_id=0, eos_token_id=None,
+        )
+        self.assertEqual(outputs.tolist(), reference.tolist())
+
+    def test_unrelated_draft_is_mostly_rejected(self):
+        """A randomly initialised draft gets few of its proposals accepted"""
+        torch.manual_seed(1)
+        draft = LlamaForCausalLM(self.model.config).eval()
+        _, stats = self._generate(draft)
+        self.assertLess(stats["acceptance_rate"], 0.5)
+
+    def test_counter_ignores_other_threads(self):
+        """Forward calls made from another thread are not counted"""
+        input_ids = torch.tensor([[1, 5, 6]])
+        with torch.no_grad(), _ForwardCounter(self.model) as counter:
+            worker = threading.Thread(target=self.model, args=(input_ids,))
+            worker.start()
+            worker.join()
+            self.model(input_ids)
+        self.assertEqual(counter.calls, 1)
+
+
+class _VocabTokenizer:
+    def __init__(self, vocab, name_or_path="vocab-tokenizer"):
+        self.vocab = vocab
+        self.name_or_path = name_or_path
+        self.get_vocab = MagicMock(return_value=vocab)
+
+    def __len__(self):
+        return len(self.vocab)
+
+
+class TestDraftModelCache(unittest.TestCase):
+    """The draft model is loaded once per device and its vocabulary checked once per main tokenizer"""
+
+    def setUp(self):
+        model_loader.unload_draft_model()
+        self.addCleanup(model_loader.unload_draft_model)
+        self.draft_tokenizer = _VocabTokenizer({"a": 0, "b": 1})
+        self._patchers = [
+            patch('backend.api.core.model_loader.os.path.isdir', return_value=True),
+            patch('backend.api.core.model_loader.AutoTokenizer.from_pretrained', return_value=self.draft_tokenizer),
+            patch('backend.api.core.model_loader.AutoModelForCausalLM.from_pretrained'),
+        ]
+        _, _, self.from_pretrained = [patcher.start() for patcher in self._patchers]
+        for patcher in self._patchers:
+            self.addCleanup(patcher.stop)
+
+    def test_vocabulary_is_compared_once_per_tokenizer(self):
+        tokenizer = _VocabTokenizer({"a": 0, "b": 1})
+        draft = model_loader.get_draft_model("draft", tokenizer, "cpu")
+        for _ in range(3):
+            self.assertIs(model_loader.get_draft_model("draft", tokenizer, "cpu"), draft)
+        self.assertEqual(tokenizer.get_vocab.call_count, 1)
+        self.assertEqual(self.from_pretrained.call_count, 1)
+
+        other = _VocabTokenizer({"a": 0, "c": 1}, "other-tokenizer")
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                model_loader.get_draft_model("draft", other, "cpu")
+        self.assertEqual(other.get_vocab.call_count, 1)
+
+    def test_draft_follows_the_main_model_device(self):
+        tokenizer = _VocabTokenizer({"a": 0, "b": 1})
+        model_loader.get_draft_model("draft", tokenizer, "cpu")
+        self.assertEqual(self.from_pretrained.call_args.kwargs["device_map"], "cpu")
+        with patch('backend.api.core.model_loader._choose_device_map', return_value="auto"):
+            model_loader.get_draft_model("draft", tokenizer, "cuda")
+        self.assertEqual(self.from_pretrained.call_count, 2)
+        self.assertEqual(self.from_pretrained.call_args.kwargs["device_map"], "auto")
+
+    def test_concurrent_first_uses_load_once(self):
+        tokenizer = _VocabTokenizer({"a": 0, "b": 1})
+        workers = [threading.Thread(target=model_loader.get_draft_model, args=("draft", tokenizer, "cpu")) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.from_pretrained.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+# Adjust the import path to access the stopping module
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+import torch
+
+from backend.api.core.stopping import StopSequenceCriteria, StopStringMatcher
+
+
+class PieceTokenizer:
+    """Decodes ids by joining a fixed list of text pieces."""
+    pieces = ["<pad>", "Hello", " there", "\n", "User", ":", " Hi", "Us", "er"]
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(self.pieces[i] for i in ids if not (skip_special_tokens and i == 0))
+
+
+class TestStopStringMatcher(unittest.TestCase):
+    """Tests for decoding-time stop string detection"""
+
+    def setUp(self):
+        self.tokenizer = PieceTokenizer()
+
+    def test_matches_stop_string_split_across_tokens(self):
+        """'\\nUser:' is found once its last piece is generated, whatever the split"""
+        matcher = StopStringMatcher(self.tokenizer, ["\nUser:"])
+        self.assertFalse(matcher.matches([1, 2, 3, 7, 8]))
+        self.assertTrue(matcher.matches([1, 2, 3, 7, 8, 5]))
+        self.assertTrue(matcher.matches([1, 3, 4, 5]))
+
+    def test_uses_default_stop_tokens_when_none_given(self):
+        """Without explicit stop strings the cleaner's default list applies"""
+        matcher = StopStringMatcher(self.tokenizer, None)
+        self.assertIn("\nUser:", matcher.stop_strings)
+        self.assertTrue(matcher.matches([1, 3, 4, 5]))
+        self.assertFalse(matcher.matches([1, 2, 6]))
+
+    def test_criteria_ignores_prompt_and_records_stop_position(self):
+        """Stop strings in the prompt do not count; stopped_at is the generated length"""
+        criteria = StopSequenceCriteria(StopStringMatcher(self.tokenizer, ["\nUser:"]), prompt_length=4)
+        prompt = [3, 4, 5, 1]  # The prompt itself ends a "\nUser:" turn
+        self.assertFalse(criteria(torch.tensor([prompt + [2]]), None)[0])
+        self.assertIsNone(criteria.stopped_at)
+        self.assertTrue(criteria(torch.tensor([prompt + [2, 3, 4, 5]]), None)[0])
+        self.assertEqual(criteria.stopped_at, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+import torch
+from safetensors import safe_open
+from transformers import LlamaConfig, LlamaForCausalLM
+
+# Adjust the import path to access the weight_cache module
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+
+from backend.api.core import weight_cache
+
+
+class TestConvertedWeightsCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.model_path = self.tmp.name
+        config = LlamaConfig(
+            vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=1,
+            num_attention_heads=4, num_key_value_heads=4, max_position_embeddings=64,
+        )
+        LlamaForCausalLM(config).save_pretrained(self.model_path)  # fp32 safetensors
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_conversion_is_cached_in_the_target_dtype(self):
+        """Only a dtype change needs a cache; the cached checkpoint loads in the final dtype"""
+        self.assertFalse(weight_cache.needs_conversion(self.model_path, torch.float32))
+        self.assertTrue(weight_cache.needs_conversion(self.model_path, torch.bfloat16))
+        self.assertIsNone(weight_cache.cached_checkpoint(self.model_path, "bf16"))
+
+        model = LlamaForCausalLM.from_pretrained(self.model_path, torch_dtype=torch.bfloat16)
+        self.assertTrue(weight_cache.save_converted(self.model_path, "bf16", model))
+
+        cached = weight_cache.cached_checkpoint(self.model_path, "bf16")
+        self.assertEqual(cached, os.path.join(self.model_path, ".sigil_cache", "bf16"))
+        with safe_open(os.path.join(cached, "model.safetensors"), "pt") as f:
+            self.assertEqual(f.get_tensor("model.norm.weight").dtype, torch.bfloat16)
+        self.assertIsNone(weight_cache.cached_checkpoint(self.model_path, "fp16"))
+
+    def test_background_save_writes_the_cache_once(self):
+        model = LlamaForCausalLM.from_pretrained(self.model_path, torch_dtype=torch.float16)
+        release = threading.Event()
+        save_converted = weight_cache.save_converted
+
+        def slow_save(*args):
+            release.wait(5)
+            return save_converted(*args)
+
+        with patch.object(weight_cache, "save_converted", side_effect=slow_save):
+            thread = weight_cache.save_converted_in_background(self.model_path, "fp16", model)
+            self.assertIsNone(weight_cache.save_converted_in_background(self.model_path, "fp16", model))  # Already running
+            release.set()
+            thread.join()
+        self.assertIsNotNone(weight_cache.cached_checkpoint(self.model_path, "fp16"))
+
+    def test_changed_source_invalidates_the_cache(self):
+        """Touching a source weight file makes the converted cache stale"""
+        model = LlamaForCausalLM.from_pretrained(self.model_path, torch_dtype=torch.float16)
+        weight_cache.save_converted(self.model_path, "fp16", model)
+        weights = os.path.join(self.model_path, "model.safetensors")
+        stat = os.stat(weights)
+        os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+        self.assertIsNone(weight_cache.cached_checkpoint(self.model_path, "fp16"))
+
+    def test_cold_and_warm_load_times_are_kept_per_precision(self):
+        weight_cache.record_load_time(self.model_path, "fp16", 2.5, warm=False)
+        weight_cache.record_load_time(self.model_path, "fp16", 0.5, warm=True)
+        stats = [entry for entry in weight_cache.load_time_stats()["models"] if entry["model_path"] == self.model_path]
+        self.assertEqual(stats, [{"model_path": self.model_path, "precision": "fp16", "cold_load_time": 2.5, "warm_load_time": 0.5}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -146,5 +146,136 @@ class TestChatRoutes(unittest.TestCase):
         result = response.json()
         self.assertIn("invalid", result["detail"].lower())
 
+    def test_list_sessions_pages(self):
+        """Paging parameters switch /sessions to {"sessions", "next_cursor"} pages"""
+        second = save_chat_messages(None, [{"role": "user", "content": "Second chat"}])
+
+        response = client.get("/api/v1/chat/sessions")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([s["thread_id"] for s in response.json()], [second, self.test_thread_id])
+
+        first_page = client.get("/api/v1/chat/sessions", params={"limit": 1}).json()
+        self.assertEqual([s["thread_id"] for s in first_page["sessions"]], [second])
+        second_page = client.get("/api/v1/chat/sessions", params={"limit": 1, "cursor": first_page["next_cursor"]}).json()
+        self.assertEqual([s["thread_id"] for s in second_page["sessions"]], [self.test_thread_id])
+        self.assertIsNone(second_page["next_cursor"])
+
+        filtered = client.get("/api/v1/chat/sessions", params={"title_prefix": "second"}).json()
+        self.assertEqual([s["thread_id"] for s in filtered["sessions"]], [second])
+
+        response = client.get("/api/v1/chat/sessions", params={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class TestChatStreamRoute(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self._patcher = patch('backend.api.core.history_manager.HISTORY_DIR', self.temp_dir)
+        self._patcher.start()
+
+        tokenizer = MagicMock()
+        tokenizer.prompt_mode = "fallback"
+        app.state.model = MagicMock()
+        app.state.tokenizer = tokenizer
+        app.state.device = "cpu"
+
+    def tearDown(self):
+        self._patcher.stop()
+        shutil.rmtree(self.temp_dir)
+        app.state.model = None
+        app.state.tokenizer = None
+
+    @staticmethod
+    def _parse_events(body):
+        """Splits an SSE body into (event, data) tuples."""
+        events = []
+        for frame in body.strip().split("\n\n"):
+            lines = dict(line.split(": ", 1) for line in frame.split("\n"))
+            events.append((lines["event"], json.loads(lines["data"])))
+        return events
+
+    def test_stream_emits_tokens_then_done(self):
+        """Tokens are streamed and the done event carries the cleaned content"""
+        chunks = iter(["Hello", " there", ", friend."])
+        with patch('backend.api.routes.chat.stream_response', return_value=chunks):
+            response = client.post(
+                "/api/v1/chat/chat/v2/stream",
+                json={"mode": "chat", "messages": [{"role": "user", "content": "Hi"}]}
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        events = self._parse_events(response.text)
+        tokens = [data["text"] for event, data in events if event == "token"]
+        self.assertEqual("".join(tokens), "Hello there, friend.")
+        event, data = events[-1]
+        self.assertEqual(event, "done")
+        self.assertEqual(data["content"], "Hello there, friend.")
+        self.assertIsNotNone(data["metadata"]["time_to_first_token"])
+
+    def test_stream_stops_at_stop_token_across_chunks(self):
+        """A stop token split over two chunks is never streamed and the reply is saved truncated"""
+        chunks = iter(["Sure thing.", "\nUs", "er: next question"])
+        with patch('backend.api.routes.chat.stream_response', return_value=chunks):
+            response = client.post(
+                "/api/v1/chat/chat/v2/stream",
+                json={
+                    "mode": "chat",
+                    "messages": [{"role": "user", "content": "Hi"}],
+                    "stop": ["\nUser:"],
+                    "save_chat": True,
+                }
+            )
+
+        events = self._parse_events(response.text)
+        streamed = "".join(data["text"] for event, data in events if event == "token")
+        self.assertEqual(streamed, "Sure thing.")
+        event, data = events[-1]
+        self.assertEqual(event, "done")
+        self.assertEqual(data["content"], "Sure thing.")
+
+        with open(get_session_filepath(data["thread_id"]), 'r') as f:
+            session_data = json.load(f)
+        self.assertEqual(session_data["messages"][-1], {"role": "assistant", "content": "Sure thing."})
+
+class TestChatV2Usage(unittest.TestCase):
+    def setUp(self):
+        tokenizer = MagicMock()
+        tokenizer.prompt_mode = "fallback"
+        app.state.model = MagicMock()
+        app.state.tokenizer = tokenizer
+        app.state.device = "cpu"
+
+    def tearDown(self):
+        app.state.model = None
+        app.state.tokenizer = None
+
+    def test_usage_reports_generation_token_counts_and_timings(self):
+        """usage, token_count and metadata come from the stats filled in by generate_response"""
+        def fake_generate(*args, stats=None, **kwargs):
+            stats.update({
+                "prompt_tokens": 40, "completion_tokens": 12, "continuation_tokens": 3,
+                "prefill_time": 0.25, "decode_time": 0.5, "tokens_per_second": 28.0,
+            })
+            return "Hello there."
+
+        with patch('backend.api.routes.chat.generate_response', side_effect=fake_generate):
+            response = client.post(
+                "/api/v1/chat/chat/v2",
+                json={"mode": "chat", "messages": [{"role": "user", "content": "Hi"}]}
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        usage = data["usage"]
+        self.assertEqual(usage["prompt_tokens"], 40)
+        self.assertEqual(usage["completion_tokens"], 12)
+        self.assertEqual(usage["continuation_tokens"], 3)
+        self.assertEqual(usage["total_tokens"], 55)
+        self.assertEqual(usage["decode_time"], 0.5)
+        self.assertGreaterEqual(usage["time_to_first_token"], 0.25)
+        self.assertGreater(usage["elapsed_time"], 0)
+        self.assertEqual(data["token_count"], 15)
+        self.assertEqual(data["metadata"]["total_tokens"], 15)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
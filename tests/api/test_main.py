@@ -86,6 +86,64 @@ def test_health_check():
     assert response.status_code == 200
     assert response.json() == {"status": "ok"}
 
+# The lifespan shuts down the shared executor and scheduler; keep other tests' ones running
+@patch('backend.api.main.stop_idle_sweeper')
+@patch('backend.api.main.shutdown_batch_scheduler')
+@patch('backend.api.main.inference_executor')
+@patch('backend.api.main.warm_up_model', return_value=0.25)
+@patch('backend.api.main.load_model_internal')
+def test_ready_waits_for_default_model_preload(mock_load_model, mock_warm_up, mock_executor, mock_shutdown_scheduler, mock_stop_sweeper):
+    """Test the /ready endpoint with a default model preloaded at startup.
+
+    This test verifies that:
+    1. /ready returns 503 while the default model is still loading
+    2. /ready returns 200 once the model is loaded and warmed up, while /health is always 200
+    """
+    import threading
+    import time
+    from backend.api import main
+
+    proceed = threading.Event()
+
+    def slow_load(path):
+        proceed.wait(5)
+        return MockTokenizer(), MockModel(), "cpu"
+
+    mock_load_model.side_effect = slow_load
+    original_readiness = dict(main._readiness)
+    with patch.object(main.settings, 'preload_default_model', True), \
+         patch.object(main.settings, 'default_model_path', 'preload-test-model'):
+        with TestClient(app) as startup_client:
+            response = startup_client.get("/ready")
+            assert response.status_code == 503
+            assert response.json()["status"] == "not_ready"
+            assert response.json()["model"] == "preload-test-model"
+            assert startup_client.get("/health").status_code == 200
+
+            proceed.set()
+            deadline = time.time() + 5
+            while startup_client.get("/ready").status_code != 200 and time.time() < deadline:
+                time.sleep(0.01)
+
+            response = startup_client.get("/ready")
+            assert response.status_code == 200
+            assert response.json()["state"] == "ready"
+            assert response.json()["warmup_time"] == 0.25
+            mock_warm_up.assert_called_once()
+    mock_executor.shutdown.assert_called_once()
+    main._readiness.update(original_readiness)
+    app.state.model = None
+    app.state.tokenizer = None
+
+def test_inference_executor_survives_lifespan_restarts():
+    """Test that chat work can still be submitted after the app has started and stopped twice."""
+    from backend.api.main import inference_executor
+
+    for _ in range(2):
+        with TestClient(app):
+            pass
+    assert inference_executor.submit(lambda: "after restart").result(timeout=5) == "after restart"
+
 @patch('os.path.isdir')
 @patch('os.listdir')
 @patch('os.path.abspath')
@@ -511,6 +569,21 @@ def test_system_device_endpoint(mock_get_device_status):
     assert result["device_name"] == "NVIDIA Test GPU"
 
 
+@patch('backend.api.main.get_active_model_entry')
+def test_model_loaded_gauge_labels_the_loaded_precision(mock_active_entry):
+    """The gauge reports the precision the weights were loaded in, not the current setting"""
+    mock_active_entry.return_value = MagicMock(variant="int8", device="cpu")
+    app.state.model_path = "tinyllama"
+    try:
+        with patch('backend.api.main.settings.model_precision', "fp16"):
+            response = client.get("/metrics")
+    finally:
+        app.state.model_path = None
+
+    assert response.status_code == 200
+    assert 'sigil_model_loaded{model="tinyllama",precision="int8",device="cpu"} 1' in response.text
+
+
 @patch('backend.api.core.settings_manager.get_precision')
 def test_get_precision(mock_get_precision):
     """Test the /api/v1/system/get_precision endpoint."""